@@ -1,6 +1,9 @@
 from __future__ import annotations
-from typing import List, Tuple, Optional, Iterable
+from typing import List, Tuple, Optional, Iterable, Dict, Sequence, Any
 import math
+import inspect
+import operator
+import itertools
 import random
 import numpy as np
 import os, sys
@@ -13,6 +16,31 @@ def set_random_seed(seed: int) -> None:
     random.seed(int(seed))
     np.random.seed(int(seed))
 
+def haversine_matrix_m(origins: Iterable[Tuple[float, float]], targets: Iterable[Tuple[float, float]], earth_radius_m: float = 6_371_000.0) -> np.ndarray:
+    origins_rad = np.radians(np.asarray(origins, dtype=float).reshape(-1, 2))
+    targets_rad = np.radians(np.asarray(targets, dtype=float).reshape(-1, 2))
+    lat1 = origins_rad[:, 0][:, None]
+    lat2 = targets_rad[:, 0][None, :]
+    sin_dlat = np.sin((lat2 - lat1) / 2)
+    sin_dlon = np.sin((targets_rad[:, 1][None, :] - origins_rad[:, 1][:, None]) / 2)
+    a = np.clip(sin_dlat ** 2 + np.cos(lat1) * np.cos(lat2) * sin_dlon ** 2, 0.0, 1.0)
+    return earth_radius_m * 2 * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+
+def haversine_pairwise_m(points: np.ndarray, earth_radius_m: float = 6_371_000.0) -> np.ndarray:
+    points_rad = np.radians(np.asarray(points, dtype=float))
+    lat1 = points_rad[..., :, 0][..., :, None]
+    lat2 = points_rad[..., :, 0][..., None, :]
+    sin_dlat = np.sin((lat2 - lat1) / 2)
+    sin_dlon = np.sin((points_rad[..., :, 1][..., None, :] - points_rad[..., :, 1][..., :, None]) / 2)
+    a = np.clip(sin_dlat ** 2 + np.cos(lat1) * np.cos(lat2) * sin_dlon ** 2, 0.0, 1.0)
+    return earth_radius_m * 2 * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+
+def positions_array(items: Iterable[Any]) -> np.ndarray:
+    positions = getattr(items, "positions", None)
+    if positions is not None:
+        return positions
+    return np.array([item.position for item in items], dtype=float).reshape(-1, 2)
+
 class Task:
     __slots__ = ("id", "position", "value")
     VALUE_LOG_MEAN: float = 1.8
@@ -47,6 +75,37 @@ class Task:
             raise ValueError(f"Valore task deve essere non negativo, ricevuto: {value}")
         self.value: float = value
 
+    @classmethod
+    def _from_columns(cls, task_id: int, lat: float, lon: float, value: float) -> Task:
+        task = cls.__new__(cls)
+        task.id = task_id
+        task.position = (lat, lon)
+        task.value = value
+        return task
+
+    @classmethod
+    def _validate_columns(cls, columns: Dict[str, Sequence[Any]]) -> None:
+        accepted = set(inspect.signature(cls._from_columns).parameters) - {"task_id", "lat", "lon", "value"}
+        unknown = sorted(set(columns) - accepted - {"id", "lat", "lon", "value"})
+        if unknown:
+            raise TypeError(f"Colonne non previste per {cls.__name__}: {unknown}. Colonne ammesse: {sorted(accepted)}")
+        ids = np.asarray(columns["id"])
+        if ids.size and ids.dtype.kind not in "iu":
+            raise TypeError("task_id deve essere un intero")
+        lat = np.asarray(columns["lat"], dtype=float)
+        lon = np.asarray(columns["lon"], dtype=float)
+        if not (np.isfinite(lat).all() and np.isfinite(lon).all()):
+            raise ValueError("Coordinate devono essere valori finiti")
+        out_of_range = (lon < -180.0) | (lon > 180.0) | (lat < -90.0) | (lat > 90.0)
+        if out_of_range.any():
+            idx = int(np.flatnonzero(out_of_range)[0])
+            raise ValueError(f"Coordinate fuori range EPSG:4326: lon={lon[idx]}, lat={lat[idx]}. Range ammessi: lon ∈ [-180, 180], lat ∈ [-90, 90]")
+        values = np.asarray(columns["value"], dtype=float)
+        if not np.isfinite(values).all():
+            raise ValueError("Valore task deve essere finito")
+        if (values < 0).any():
+            raise ValueError(f"Valore task deve essere non negativo, ricevuto: {float(values.min())}")
+
     def __repr__(self) -> str:
         lat, lon = self.position
         return f"Task(ID={self.id}, Posizione=({lat:.5f}°N, {lon:.5f}°E), Valore={self.value:.2f})"
@@ -110,7 +169,7 @@ class User:
     def _calculate_travel_distance_km(self) -> float:
         if not self.tasks:
             return 0.0
-        haversine_sum_m = sum(self.calculate_distance_to(t) for t in self.tasks)
+        haversine_sum_m = sum(self.distances_to(self.tasks).tolist())
         distance_m = haversine_sum_m * 2.0 * self.URBAN_CORRECTION_FACTOR
         return distance_m / 1000.0
 
@@ -131,6 +190,9 @@ class User:
         d = float(self.EARTH_RADIUS_M * c)
         return d if math.isfinite(d) and d >= 0.0 else 0.0
 
+    def distances_to(self, tasks: Iterable[Task]) -> np.ndarray:
+        return haversine_matrix_m([self.position], positions_array(tasks), self.EARTH_RADIUS_M)[0]
+
     def reset_state(self) -> None:
         self.cost = 0.0
         self.bid = 0.0
@@ -142,3 +204,59 @@ class User:
         status = "Vincitore" if self.is_winner else "Non vincitore"
         lat, lon = self.position
         return f"User(ID={self.id}, Posizione=({lat:.5f}°N, {lon:.5f}°E), Costo/km={self.cost_per_km:.2f} €/km, Bid={self.bid:.2f} €, Stato={status})"
+
+class TaskSet:
+    __slots__ = ("ids", "lat", "lon", "values", "columns", "task_cls", "_views")
+
+    def __init__(self, ids: Sequence[int], lat: Sequence[float], lon: Sequence[float], values: Sequence[float], task_cls: type = Task, columns: Optional[Dict[str, Sequence[Any]]] = None):
+        raw_ids = np.asarray(ids).reshape(-1)
+        self.lat = np.asarray(lat, dtype=float).reshape(-1)
+        self.lon = np.asarray(lon, dtype=float).reshape(-1)
+        self.values = np.asarray(values, dtype=float).reshape(-1)
+        self.columns: Dict[str, List[Any]] = {name: list(column) for name, column in (columns or {}).items()}
+        n = raw_ids.size
+        if any(arr.size != n for arr in (self.lat, self.lon, self.values)) or any(len(column) != n for column in self.columns.values()):
+            raise ValueError(f"Colonne di lunghezza diversa: ids={n}, lat={self.lat.size}, lon={self.lon.size}, values={self.values.size}, extra={[len(column) for column in self.columns.values()]}")
+        task_cls._validate_columns({"id": raw_ids, "lat": self.lat, "lon": self.lon, "value": self.values, **self.columns})
+        self.ids = raw_ids.astype(np.int64)
+        self.task_cls = task_cls
+        self._views: List[Optional[Task]] = [None] * n
+
+    @classmethod
+    def from_tasks(cls, tasks: Iterable[Task]) -> TaskSet:
+        tasks = list(tasks)
+        task_set = cls([t.id for t in tasks], [t.position[0] for t in tasks], [t.position[1] for t in tasks], [t.value for t in tasks], task_cls=type(tasks[0]) if tasks else Task)
+        task_set._views = tasks
+        return task_set
+
+    def with_task_cls(self, task_cls: type, columns: Optional[Dict[str, Sequence[Any]]] = None) -> TaskSet:
+        return TaskSet(self.ids, self.lat, self.lon, self.values, task_cls=task_cls, columns=columns)
+
+    @property
+    def positions(self) -> np.ndarray:
+        return np.column_stack((self.lat, self.lon))
+
+    def __len__(self) -> int:
+        return self.ids.size
+
+    def __getitem__(self, idx: int) -> Task:
+        idx = operator.index(idx)
+        view = self._views[idx]
+        if view is None:
+            view = self._views[idx] = self.task_cls._from_columns(int(self.ids[idx]), float(self.lat[idx]), float(self.lon[idx]), float(self.values[idx]), **{name: column[idx] for name, column in self.columns.items()})
+        return view
+
+    def to_list(self) -> List[Task]:
+        if any(view is None for view in self._views):
+            names = list(self.columns)
+            extras = zip(*self.columns.values()) if names else itertools.repeat(())
+            for idx, (task_id, lat, lon, value, extra) in enumerate(zip(self.ids.tolist(), self.lat.tolist(), self.lon.tolist(), self.values.tolist(), extras)):
+                if self._views[idx] is None:
+                    self._views[idx] = self.task_cls._from_columns(task_id, lat, lon, value, **dict(zip(names, extra)))
+        return list(self._views)
+
+    def __iter__(self):
+        return iter(self.to_list())
+
+    def __repr__(self) -> str:
+        return f"TaskSet(n={len(self)}, classe={self.task_cls.__name__}, valore_totale={float(self.values.sum()):.2f})"
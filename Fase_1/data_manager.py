@@ -7,20 +7,26 @@ import csv
 import math
 import json
 import time
+import hashlib
 import gzip
 import random
+import io
+import shutil
 import warnings
+import traceback
 import datetime as dt
 
-from typing import Iterator, List, Tuple, Dict, Optional, Any
+from typing import Iterator, Iterable, List, Tuple, Dict, Optional, Any, Callable, Union
 from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
 from tqdm import tqdm
 
 _current_dir = os.path.dirname(os.path.abspath(__file__))
 if _current_dir not in sys.path:
     sys.path.insert(0, _current_dir)
 
-from classes import Task, User, set_random_seed
+from classes import Task, User, TaskSet, set_random_seed, haversine_matrix_m, positions_array
 
 class GeoConstants:
     ROME_BBOX: Tuple[float, float, float, float] = (41.78, 42.04, 12.30, 12.72)
@@ -104,6 +110,18 @@ def latlon_to_cell(lat: float, lon: float, origin_lat: float, origin_lon: float,
     ix = int(math.floor(delta_x_m / cell_m))
     return iy, ix
 
+def latlon_to_cells(lat: np.ndarray, lon: np.ndarray, origin_lat: float, origin_lon: float, cell_m: float) -> Tuple[np.ndarray, np.ndarray]:
+    lat = np.asarray(lat, dtype=float)
+    lon = np.asarray(lon, dtype=float)
+    iy = np.floor((lat - origin_lat) * GeoConstants.M_PER_DEG_LAT / cell_m).astype(np.int64)
+    scaled_x = (lon - origin_lon) * (GeoConstants.M_PER_DEG_LAT * np.cos(np.radians((origin_lat + lat) / 2.0))) / cell_m
+    ix_float = np.floor(scaled_x)
+    ix = ix_float.astype(np.int64)
+    frac = scaled_x - ix_float
+    for idx in np.flatnonzero((frac < 1e-9) | (frac > 1.0 - 1e-9)).tolist():
+        ix[idx] = latlon_to_cell(float(lat[idx]), float(lon[idx]), origin_lat, origin_lon, cell_m)[1]
+    return iy, ix
+
 def cell_to_centroid(iy: int, ix: int, origin_lat: float, origin_lon: float, cell_m: float) -> Tuple[float, float]:
     centroid_y_m = (iy + 0.5) * cell_m
     centroid_x_m = (ix + 0.5) * cell_m
@@ -111,6 +129,90 @@ def cell_to_centroid(iy: int, ix: int, origin_lat: float, origin_lon: float, cel
     lon = origin_lon + (centroid_x_m / m_per_deg_lon_at_lat(origin_lat))
     return lat, lon
 
+def cells_to_centroids(iy: np.ndarray, ix: np.ndarray, origin_lat: float, origin_lon: float, cell_m: float) -> Tuple[np.ndarray, np.ndarray]:
+    lat = origin_lat + ((np.asarray(iy, dtype=float) + 0.5) * cell_m / GeoConstants.M_PER_DEG_LAT)
+    lon = origin_lon + ((np.asarray(ix, dtype=float) + 0.5) * cell_m / m_per_deg_lon_at_lat(origin_lat))
+    return lat, lon
+
+class TaskSpatialIndex:
+    EARTH_RADIUS_M: float = 6_371_000.0
+    BUCKET_MARGIN: int = 1
+
+    def __init__(self, tasks: Union[List[Task], TaskSet], cell_m: float = 500.0, radius_m: Optional[float] = None, origin: Optional[Tuple[float, float]] = None):
+        if cell_m <= 0:
+            raise ValueError(f"cell_m deve essere > 0, ricevuto {cell_m}")
+        self._positions = positions_array(tasks)
+        self.tasks: List[Task] = list(tasks)
+        if radius_m is not None and math.isfinite(radius_m) and radius_m > 2 * cell_m:
+            cell_m = cell_m * int(radius_m // (2 * cell_m))
+        self.cell_m = float(cell_m)
+        if origin is None:
+            origin = (float(self._positions[:, 0].min()), float(self._positions[:, 1].min())) if self.tasks else (0.0, 0.0)
+        self.origin_lat, self.origin_lon = origin
+        self._max_abs_lat = float(np.abs(self._positions[:, 0]).max()) if self.tasks else 0.0
+        self._buckets: Dict[Tuple[int, int], List[int]] = {}
+        for idx, (lat, lon) in enumerate(self._positions.tolist()):
+            self._buckets.setdefault(latlon_to_cell(lat, lon, self.origin_lat, self.origin_lon, self.cell_m), []).append(idx)
+
+    def __len__(self) -> int:
+        return len(self.tasks)
+
+    def _bucket_ranges(self, lat: float, lon: float, radius_m: float) -> Optional[Tuple[int, int, int, int]]:
+        dlat_rad = radius_m / self.EARTH_RADIUS_M
+        lat_extent = max(abs(lat), self._max_abs_lat) + math.degrees(dlat_rad)
+        if lat_extent >= 89.0:
+            return None
+        sin_half_dlon = math.sin(dlat_rad / 2.0) / math.cos(math.radians(lat_extent))
+        if sin_half_dlon >= 1.0:
+            return None
+        dlat = math.degrees(dlat_rad)
+        dlon = math.degrees(2.0 * math.asin(sin_half_dlon))
+        lat_samples = [lat - dlat, lat + dlat]
+        if lat - dlat < -self.origin_lat < lat + dlat:
+            lat_samples.append(-self.origin_lat)
+        corners = [latlon_to_cell(lat_s, lon + sx * dlon, self.origin_lat, self.origin_lon, self.cell_m) for lat_s in lat_samples for sx in (-1, 1)]
+        margin = self.BUCKET_MARGIN
+        return (min(c[0] for c in corners) - margin, max(c[0] for c in corners) + margin, min(c[1] for c in corners) - margin, max(c[1] for c in corners) + margin)
+
+    def candidate_indices(self, lat: float, lon: float, radius_m: Optional[float]) -> List[int]:
+        if radius_m is None or not math.isfinite(radius_m):
+            return list(range(len(self.tasks)))
+        ranges = self._bucket_ranges(lat, lon, radius_m)
+        if ranges is None:
+            return list(range(len(self.tasks)))
+        iy_min, iy_max, ix_min, ix_max = ranges
+        indices: List[int] = []
+        if (iy_max - iy_min + 1) * (ix_max - ix_min + 1) > len(self._buckets):
+            for (iy, ix), bucket in self._buckets.items():
+                if iy_min <= iy <= iy_max and ix_min <= ix <= ix_max:
+                    indices.extend(bucket)
+        else:
+            buckets = self._buckets
+            for iy in range(iy_min, iy_max + 1):
+                for ix in range(ix_min, ix_max + 1):
+                    bucket = buckets.get((iy, ix))
+                    if bucket:
+                        indices.extend(bucket)
+        indices.sort()
+        return indices
+
+    def candidates(self, lat: float, lon: float, radius_m: Optional[float]) -> List[Task]:
+        return [self.tasks[idx] for idx in self.candidate_indices(lat, lon, radius_m)]
+
+    def query(self, user: User, radius_m: Optional[float]) -> Tuple[List[Task], np.ndarray]:
+        lat, lon = user.position
+        indices = np.array(self.candidate_indices(lat, lon, radius_m), dtype=np.intp)
+        distances_m = haversine_matrix_m([user.position], self._positions[indices], user.EARTH_RADIUS_M)[0]
+        if radius_m is not None:
+            keep = distances_m <= radius_m
+            indices, distances_m = indices[keep], distances_m[keep]
+        return [self.tasks[idx] for idx in indices.tolist()], distances_m
+
+    def tasks_within_radius(self, user: User, radius_m: Optional[float]) -> List[Task]:
+        if radius_m is None:
+            return list(self.tasks)
+        return self.query(user, radius_m)[0]
+
 def _smart_split_3cols(line: str) -> Optional[List[str]]:
     for separator in (";", ",", "|", "\t"):
         parts = [part.strip() for part in line.split(separator)]
@@ -118,15 +220,240 @@ def _smart_split_3cols(line: str) -> Optional[List[str]]:
             return parts
     return None
 
+def _normalize_ts_iso_fast(s: str) -> str:
+    s = s.strip().replace("T", " ")
+    if s.endswith("Z"):
+        return s[:-1] + "+00:00"
+    if len(s) >= 3 and s[-3] in "+-" and s[-2:].isdecimal():
+        return s + ":00"
+    if len(s) >= 5 and s[-5] in "+-" and s[-4:].isdecimal():
+        return s[:-2] + ":" + s[-2:]
+    return s
+
+class RawRecordParser:
+    SAMPLE_LINES: int = 1000
+    SEPARATORS: Tuple[str, ...] = (";", ",", "|", "\t")
+    POINT_PREFIX: str = "POINT("
+    POINT_CHARS: frozenset = frozenset("-0123456789.")
+
+    def __init__(self, time_format: Optional[str] = None, separator: Optional[str] = None, ts_format: Optional[str] = None):
+        self.time_format = time_format
+        self.separator = separator
+        self.ts_format = ts_format
+        self._earlier_separators = self.SEPARATORS[:self.SEPARATORS.index(separator)] if separator in self.SEPARATORS else ()
+
+    @classmethod
+    def detect(cls, lines: Iterable[str], time_format: Optional[str] = None) -> RawRecordParser:
+        separator_votes: Dict[str, int] = {}
+        ts_votes: Dict[str, int] = {}
+        for line in lines:
+            line = line.strip()
+            if not line:
+                continue
+            for separator in cls.SEPARATORS:
+                parts = [part.strip() for part in line.split(separator)]
+                if len(parts) == 3:
+                    separator_votes[separator] = separator_votes.get(separator, 0) + 1
+                    break
+            else:
+                continue
+            if time_format:
+                continue
+            normalized = _normalize_ts_iso_fast(parts[1])
+            try:
+                dt.datetime.fromisoformat(normalized)
+                ts_votes[""] = ts_votes.get("", 0) + 1
+                continue
+            except ValueError:
+                pass
+            for format_str in GeoConstants.COMMON_TS_FORMATS:
+                try:
+                    dt.datetime.strptime(normalized, format_str)
+                except ValueError:
+                    continue
+                ts_votes[format_str] = ts_votes.get(format_str, 0) + 1
+                break
+        separator = max(separator_votes, key=separator_votes.get) if separator_votes else None
+        ts_format = max(ts_votes, key=ts_votes.get) if ts_votes else ""
+        return cls(time_format=time_format, separator=separator, ts_format=ts_format or None)
+
+    @classmethod
+    def detect_from_file(cls, path: str, time_format: Optional[str] = None) -> RawRecordParser:
+        open_func = gzip.open if path.lower().endswith(".gz") else open
+        sample: List[str] = []
+        with open_func(path, "rt", encoding="utf-8", errors="ignore") as f:
+            for line in f:
+                sample.append(line)
+                if len(sample) >= cls.SAMPLE_LINES:
+                    break
+        return cls.detect(sample, time_format=time_format)
+
+    def split(self, line: str) -> Optional[List[str]]:
+        separator = self.separator
+        if separator is not None and line.count(separator) == 2 and all(line.count(earlier) != 2 for earlier in self._earlier_separators):
+            return [part.strip() for part in line.split(separator)]
+        return _smart_split_3cols(line)
+
+    def parse_ts(self, s: str) -> dt.datetime:
+        if self.time_format:
+            return parse_ts(s, fmt=self.time_format)
+        try:
+            normalized = _normalize_ts_iso_fast(s)
+            if self.ts_format:
+                return dt.datetime.strptime(normalized, self.ts_format)
+            return dt.datetime.fromisoformat(normalized)
+        except ValueError:
+            return parse_ts(s)
+
+    def parse_point(self, s: str) -> Tuple[float, float]:
+        if s.startswith(self.POINT_PREFIX) and s.endswith(")"):
+            coords = s[len(self.POINT_PREFIX):-1].split(" ")
+            if len(coords) == 2 and coords[0] and coords[1] and self.POINT_CHARS.issuperset(coords[0]) and self.POINT_CHARS.issuperset(coords[1]):
+                try:
+                    lat, lon = float(coords[0]), float(coords[1])
+                except ValueError:
+                    return parse_point(s)
+                if -90.0 <= lat <= 90.0 and -180.0 <= lon <= 180.0:
+                    return lat, lon
+        return parse_point(s)
+
+def _update_partition_stats(partition_stats: Dict[str, List[int]], partition_name: str, epoch_ms: int) -> None:
+    stats = partition_stats.get(partition_name)
+    if stats is None:
+        partition_stats[partition_name] = [1, epoch_ms, epoch_ms]
+        return
+    stats[0] += 1
+    if epoch_ms < stats[1]:
+        stats[1] = epoch_ms
+    if epoch_ms > stats[2]:
+        stats[2] = epoch_ms
+
+def _merge_partition_stats(target: Dict[str, List[int]], source: Dict[str, List[int]]) -> None:
+    for partition_name, (rows, min_epoch, max_epoch) in source.items():
+        stats = target.get(partition_name)
+        if stats is None:
+            target[partition_name] = [rows, min_epoch, max_epoch]
+        else:
+            target[partition_name] = [stats[0] + rows, min(stats[1], min_epoch), max(stats[2], max_epoch)]
+
+def _day_hour_from_iso(dt_obj: dt.datetime, ts_iso: str) -> Tuple[str, str]:
+    if dt_obj.year >= 1000:
+        return ts_iso[:10], ts_iso[11:13]
+    return dt_obj.strftime("%Y-%m-%d"), dt_obj.strftime("%H")
+
+def _append_csv_rows(path: str, rows: List[List[Any]]) -> None:
+    with open(path, "a", newline="", encoding="utf-8") as f_out:
+        csv.writer(f_out).writerows(rows)
+    rows.clear()
+
+def _fsync_files(files: Iterable[Any], ignore_errors: bool = False) -> None:
+    for f_out in files:
+        try:
+            f_out.flush()
+            os.fsync(f_out.fileno())
+        except OSError:
+            if not ignore_errors:
+                raise
+
+def _parse_raw_chunk(raw_path: str, start: int, end: Optional[int], chunk_dir: str, parser: RawRecordParser, bbox: Tuple[float, float, float, float], partition_by: str, master_sample_max: int, flush_rows: int = 100_000) -> Dict[str, Any]:
+    rows: Dict[str, List[List[Any]]] = {}
+    rejects: List[List[str]] = []
+    master_rows: List[List[Any]] = []
+    partitions: Dict[str, None] = {}
+    partition_stats: Dict[str, List[int]] = {}
+    records_written, records_rejected, master_records, buffered, lines_processed = 0, 0, 0, 0, 0
+    min_ts, max_ts = None, None
+    min_lat, max_lat = 90.0, -90.0
+    min_lon, max_lon = 180.0, -180.0
+    drivers_seen: set[int] = set()
+    shutil.rmtree(chunk_dir, ignore_errors=True)
+    os.makedirs(chunk_dir)
+    rejects_path, master_path = os.path.join(chunk_dir, "_rejects.csv"), os.path.join(chunk_dir, "_master.csv")
+    def flush() -> None:
+        for partition_name, partition_rows in rows.items():
+            _append_csv_rows(os.path.join(chunk_dir, partition_name), partition_rows)
+        _append_csv_rows(rejects_path, rejects)
+        _append_csv_rows(master_path, master_rows)
+        rows.clear()
+    open_func = gzip.open if raw_path.lower().endswith(".gz") else open
+    with open_func(raw_path, "rb") as f_raw:
+        f_raw.seek(start)
+        pos = start
+        for raw_line in f_raw:
+            if end is not None and pos >= end:
+                break
+            pos += len(raw_line)
+            line = raw_line.decode("utf-8", errors="ignore").strip()
+            if not line:
+                continue
+            lines_processed += 1
+            if buffered >= flush_rows:
+                flush()
+                buffered = 0
+            buffered += 1
+            parts = parser.split(line)
+            if not parts:
+                records_rejected += 1
+                rejects.append([line, "formato_colonne_invalido", "expected_3_columns"])
+                continue
+            driver_s, ts_s, point_s = parts
+            try:
+                driver_id = int(driver_s)
+                dt_obj = parser.parse_ts(ts_s)
+                lat, lon = parser.parse_point(point_s)
+            except ValueError as e:
+                records_rejected += 1
+                rejects.append([line, "parsing_value_error", str(e)[:100]])
+                continue
+            except TypeError as e:
+                records_rejected += 1
+                rejects.append([line, "parsing_type_error", str(e)[:100]])
+                continue
+            if not within_bbox(lat, lon, bbox):
+                records_rejected += 1
+                rejects.append([line, "fuori_bounding_box", f"lat={lat:.6f}_lon={lon:.6f}_bbox={bbox}"])
+                continue
+            epoch_ms = int(dt_obj.timestamp() * 1000)
+            min_ts = min(min_ts, dt_obj) if min_ts else dt_obj
+            max_ts = max(max_ts, dt_obj) if max_ts else dt_obj
+            min_lat, max_lat = min(min_lat, lat), max(max_lat, lat)
+            min_lon, max_lon = min(min_lon, lon), max(max_lon, lon)
+            drivers_seen.add(driver_id)
+            ts_iso = dt_obj.isoformat(sep=" ")
+            day, hour = _day_hour_from_iso(dt_obj, ts_iso)
+            partition_name = f"{day}.csv" if partition_by == "day" else f"{day}_{hour}.csv"
+            record = [driver_id, ts_iso, epoch_ms, f"{lat:.7f}", f"{lon:.7f}", day, hour]
+            rows.setdefault(partition_name, []).append(record)
+            partitions[partition_name] = None
+            records_written += 1
+            _update_partition_stats(partition_stats, partition_name, epoch_ms)
+            if master_records < master_sample_max:
+                master_rows.append(record)
+                master_records += 1
+    flush()
+    return {"partitions": list(partitions), "records_written": records_written, "records_rejected": records_rejected, "master_records": master_records, "drivers_seen": drivers_seen, "bbox": (min_lat, max_lat, min_lon, max_lon), "time_range": (min_ts, max_ts), "partition_stats": partition_stats}
+
 class DataManager:    
     MAX_OPEN_FILES: int = min(200, os.sysconf("SC_OPEN_MAX") // 10) if hasattr(os, "sysconf") else 200
     UPDATE_INTERVAL: int = 250_000
+    ETL_CHUNK_BYTES: int = 16 * 1024 * 1024
+    ETL_FLUSH_ROWS: int = 100_000
+    FINGERPRINT_BYTES: int = 1024 * 1024
+    FINGERPRINT_SAMPLES: int = 64
+    FINGERPRINT_SAMPLE_BYTES: int = 64 * 1024
+    COLUMNAR_SCHEMA: Tuple[Tuple[str, Any], ...] = (("driver_id", np.int64), ("epoch_ms", np.int64), ("lat", np.float64), ("lon", np.float64))
+    AGGREGATE_VERSION: int = 1
+    AGGREGATE_CACHE_MAX: int = 256
+    _SHARED_AGGREGATES: "OrderedDict[str, Tuple[float, Dict[str, np.ndarray]]]" = OrderedDict()
     
     def __init__(self, raw_txt_path: str, out_dir: str = "dataset_processato", bbox: Tuple[float, float, float, float] = None, random_seed: int = 42):
         self.raw_txt_path = raw_txt_path
         self.out_dir = out_dir
         self.part_dir = os.path.join(out_dir, "csv_partitions")
+        self.npy_dir = os.path.join(out_dir, "npy_partitions")
+        self.agg_dir = os.path.join(out_dir, "aggregates")
         self.meta_path = os.path.join(out_dir, "metadata.json")
+        self.manifest_path = os.path.join(out_dir, "manifest.json")
         self.bbox = bbox if bbox is not None else GeoConstants.ROME_BBOX
         set_random_seed(random_seed)
         os.makedirs(self.part_dir, exist_ok=True)
@@ -135,16 +462,41 @@ class DataManager:
         self._last_cells_counts: Dict[Tuple[int, int], int] = {}
         self._task_cell_map: Dict[int, Tuple[int, int, float, float]] = {}
         self._partition_by: str = "day-hour"
+        self._manifest_cache: Optional[Tuple[float, Dict[str, Any]]] = None
+        self._aggregate_cache = DataManager._SHARED_AGGREGATES
     
-    def parse_raw_to_csv(self, time_format: Optional[str] = None, compute_total_lines: bool = False, partition_by: str = "day-hour", write_master_sample: bool = True, master_sample_max: int = 1_000_000, checkpoint_interval: int = 100_000) -> Dict[str, Any]:
+    def parse_raw_to_csv(self, time_format: Optional[str] = None, compute_total_lines: bool = False, partition_by: str = "day-hour", write_master_sample: bool = True, master_sample_max: int = 1_000_000, checkpoint_interval: int = 100_000, build_columnar: bool = True, workers: int = 0, incremental: bool = False) -> Dict[str, Any]:
         print("Parsing: conversione file grezzo → CSV partizionati")
         print(f"  Partizione: {partition_by}")
+        if workers > 1:
+            print(f"  Worker paralleli: {workers}")
         print(f"  Checkpoint ogni {checkpoint_interval:,} record")
         start_time = time.perf_counter()
         self._partition_by = partition_by
         is_gz = self.raw_txt_path.lower().endswith(".gz")
         total_lines = None
-        if compute_total_lines:
+        parallel = workers > 1 and not is_gz
+        if workers > 1 and is_gz:
+            warnings.warn("ETL parallelo non disponibile per file .gz: uso la modalità sequenziale", UserWarning)
+        if incremental and is_gz:
+            warnings.warn("ETL incrementale non disponibile per file .gz: uso la modalità completa", UserWarning)
+        manifest = self.load_manifest() if incremental and not is_gz else None
+        if manifest is not None and not self._manifest_matches(manifest, partition_by, time_format, write_master_sample):
+            print("  Manifest non compatibile con il file grezzo corrente: ETL completo")
+            manifest = None
+        raw_size = os.path.getsize(self.raw_txt_path)
+        if manifest is not None:
+            start_offset = manifest["raw_bytes_processed"]
+            end_offset = self._last_line_end(start_offset, raw_size)
+            if end_offset <= start_offset:
+                print("  Nessun nuovo dato nel file grezzo, ETL incrementale non necessario")
+                return manifest["metadata"]
+            print(f"  ETL incrementale: byte {start_offset:,} → {end_offset:,}")
+        else:
+            end_offset = None if is_gz else self._last_line_end(0, raw_size)
+            if end_offset is not None and end_offset < raw_size:
+                print(f"  Riga finale incompleta esclusa (byte {end_offset:,} → {raw_size:,}): verrà elaborata dal prossimo ETL incrementale")
+        if compute_total_lines and not parallel and manifest is None:
             print("Pre-scansione per conteggio righe")
             open_func = gzip.open if is_gz else open
             with open_func(self.raw_txt_path, "rt", encoding="utf-8", errors="ignore") as f:
@@ -157,62 +509,257 @@ class DataManager:
         records_rejected, records_written, master_records_written = 0, 0, 0
         master_path = os.path.join(self.out_dir, "master_sample.csv") if write_master_sample else None
         rejects_path = os.path.join(self.out_dir, "rejects.csv")
+        parser = RawRecordParser.detect_from_file(self.raw_txt_path, time_format=time_format)
+        print(f"  Formato rilevato: separatore={parser.separator!r}, timestamp={parser.time_format or parser.ts_format or 'ISO 8601'}")
+        partition_stats: Dict[str, List[int]] = {}
+        raw_bytes_processed = raw_size if is_gz else end_offset
+        if manifest is not None:
+            previous = manifest["metadata"]
+            records_written, records_rejected, master_records_written, drivers_seen, (min_lat, max_lat, min_lon, max_lon), (min_ts, max_ts), partition_stats = self._parse_raw_chunks(parser, partition_by, master_path, master_sample_max, rejects_path, workers, start_offset=start_offset, end_offset=end_offset, append=True, master_records_written=previous["master_records_written"], checkpoint_interval=checkpoint_interval)
+            records_written += previous["records_written"]
+            records_rejected += previous["records_rejected"]
+            drivers_seen |= set(manifest["drivers"])
+            prev_min_lat, prev_max_lat, prev_min_lon, prev_max_lon = previous["effective_bbox"]
+            min_lat, max_lat = min(prev_min_lat, min_lat), max(prev_max_lat, max_lat)
+            min_lon, max_lon = min(prev_min_lon, min_lon), max(prev_max_lon, max_lon)
+            if previous["time_range"]["min_ts"]:
+                prev_min_ts = dt.datetime.fromisoformat(previous["time_range"]["min_ts"])
+                prev_max_ts = dt.datetime.fromisoformat(previous["time_range"]["max_ts"])
+                min_ts = min(prev_min_ts, min_ts) if min_ts else prev_min_ts
+                max_ts = max(prev_max_ts, max_ts) if max_ts else prev_max_ts
+            merged_stats = {name: [stats["rows"], stats["min_epoch_ms"], stats["max_epoch_ms"]] for name, stats in manifest["partitions"].items()}
+            _merge_partition_stats(merged_stats, partition_stats)
+            partition_stats = merged_stats
+        else:
+            self._clear_partitions()
+            records_written, records_rejected, master_records_written, drivers_seen, (min_lat, max_lat, min_lon, max_lon), (min_ts, max_ts), partition_stats = self._parse_raw_chunks(parser, partition_by, master_path, master_sample_max, rejects_path, workers if parallel else 0, end_offset=end_offset, checkpoint_interval=checkpoint_interval, total_lines=total_lines)
+        metadata = {"raw_path": self.raw_txt_path, "out_dir": self.out_dir, "partitions_dir": self.part_dir, "partition_by": partition_by, "records_written": records_written, "records_rejected": records_rejected, "unique_drivers": len(drivers_seen), "effective_bbox": [min_lat, max_lat, min_lon, max_lon], "time_range": {"min_ts": min_ts.isoformat(sep=" ") if min_ts else None, "max_ts": max_ts.isoformat(sep=" ") if max_ts else None}, "master_sample_path": master_path, "master_records_written": master_records_written, "rejects_log_path": rejects_path}
+        with open(self.meta_path, "w", encoding="utf-8") as f_meta:
+            json.dump(metadata, f_meta, indent=2)
+        manifest = {"raw_path": os.path.abspath(self.raw_txt_path), "raw_bytes_processed": raw_bytes_processed, "raw_fingerprint": self._raw_fingerprint(raw_bytes_processed), "raw_size": raw_size, "raw_mtime": os.path.getmtime(self.raw_txt_path), "partition_by": partition_by, "time_format": time_format, "bbox": list(self.bbox), "drivers": sorted(drivers_seen), "metadata": metadata, "partitions": {name: {"rows": rows, "min_epoch_ms": min_epoch, "max_epoch_ms": max_epoch} for name, (rows, min_epoch, max_epoch) in sorted(partition_stats.items())}}
+        manifest_tmp = self.manifest_path + ".tmp"
+        with open(manifest_tmp, "w", encoding="utf-8") as f_manifest:
+            json.dump(manifest, f_manifest, indent=2)
+        os.replace(manifest_tmp, self.manifest_path)
+        self._manifest_cache = None
+        if build_columnar:
+            self.build_columnar_partitions()
+        duration_sec = time.perf_counter() - start_time
+        print("\n" + "=" * 70)
+        print(f"Parsing completato in {duration_sec:.1f} secondi")
+        print(f"  Record validi: {records_written:,}")
+        print(f"  Righe scartate: {records_rejected:,} ({records_rejected/(records_written+records_rejected)*100:.1f}%)")
+        print(f"  Driver unici: {len(drivers_seen):,}")
+        print(f"  Range temporale: {min_ts.strftime('%Y-%m-%d %H:%M') if min_ts else 'N/A'} → {max_ts.strftime('%Y-%m-%d %H:%M') if max_ts else 'N/A'}")
+        print(f"  Bounding box: [{min_lat:.4f}, {max_lat:.4f}] lat × [{min_lon:.4f}, {max_lon:.4f}] lon")
+        print(f"\nFile generati:")
+        print(f"  Partizioni: {self.part_dir}")
+        if build_columnar:
+            print(f"  Partizioni colonnari: {self.npy_dir}")
+        print(f"  Metadata: {self.meta_path}")
+        print(f"  Righe scartate: {rejects_path}")
+        if write_master_sample:
+            print(f"  Campione master: {master_path} ({master_records_written:,} record)")
+        print("=" * 70 + "\n")
+        return metadata
+    
+    def _iter_partitions_for_window(self, day: str, hour: Optional[str], duration_hours: int) -> List[str]:
+        partition_paths: List[str] = []
+        manifest = self.load_manifest()
+        known = manifest["partitions"] if manifest is not None and manifest.get("partition_by") == self._partition_by else None
+        start_datetime = dt.datetime.strptime(f"{day} {hour or '00'}", "%Y-%m-%d %H")
+        if self._partition_by == "day":
+            days_covered = set()
+            for i in range(duration_hours):
+                current_dt = start_datetime + dt.timedelta(hours=i)
+                days_covered.add(current_dt.strftime("%Y-%m-%d"))
+            for day_str in sorted(days_covered):
+                partition_name = f"{day_str}.csv"
+                partition_path = os.path.join(self.part_dir, partition_name)
+                if known is not None:
+                    if known.get(partition_name, {}).get("rows", 0) > 0:
+                        partition_paths.append(partition_path)
+                elif os.path.exists(partition_path):
+                    partition_paths.append(partition_path)
+        else:
+            for i in range(duration_hours):
+                current_dt = start_datetime + dt.timedelta(hours=i)
+                partition_name = f"{current_dt.strftime('%Y-%m-%d')}_{current_dt.strftime('%H')}.csv"
+                partition_path = os.path.join(self.part_dir, partition_name)
+                if known is not None:
+                    if known.get(partition_name, {}).get("rows", 0) > 0:
+                        partition_paths.append(partition_path)
+                elif os.path.exists(partition_path):
+                    partition_paths.append(partition_path)
+        return partition_paths
+    
+    def get_window_records(self, day: str, hour: str, duration_hours: int = 1, bbox: Optional[Tuple[float, float, float, float]] = None, max_rows: Optional[int] = None) -> Iterator[Dict[str, Any]]:
+        target_bbox = bbox or self.bbox
+        partition_files = self._iter_partitions_for_window(day, hour, duration_hours)
+        if not partition_files:
+            raise FileNotFoundError(f"Nessuna partizione trovata per {day} H{hour} (durata {duration_hours}h). Verificare esecuzione parse_raw_to_csv().")
+        record_count = 0
+        for file_path in tqdm(partition_files, desc="Caricamento partizioni", unit="file", disable=True):
+            with open(file_path, "r", encoding="utf-8") as f:
+                reader = csv.DictReader(f)
+                for row in reader:
+                    lat, lon = float(row["lat"]), float(row["lon"])
+                    if within_bbox(lat, lon, target_bbox):
+                        yield row
+                        record_count += 1
+                        if max_rows and record_count >= max_rows:
+                            return
+    
+    def _raw_chunk_ranges(self, n_chunks: int, start: int = 0, end: Optional[int] = None) -> List[Tuple[int, int]]:
+        size = os.path.getsize(self.raw_txt_path) if end is None else end
+        bounds = [start]
+        with open(self.raw_txt_path, "rb") as f_raw:
+            for i in range(1, n_chunks):
+                target = start + (size - start) * i // n_chunks
+                if target <= bounds[-1]:
+                    continue
+                f_raw.seek(target - 1)
+                f_raw.readline()
+                if bounds[-1] < f_raw.tell() < size:
+                    bounds.append(f_raw.tell())
+        bounds.append(size)
+        return [(bounds[i], bounds[i + 1]) for i in range(len(bounds) - 1) if bounds[i + 1] > bounds[i]]
+    
+    def _parse_raw_chunks(self, parser: RawRecordParser, partition_by: str, master_path: Optional[str], master_sample_max: int, rejects_path: str, workers: int, start_offset: int = 0, end_offset: Optional[int] = None, append: bool = False, master_records_written: int = 0, checkpoint_interval: int = 100_000, total_lines: Optional[int] = None) -> Tuple[int, int, int, set, Tuple[float, float, float, float], Tuple[Any, Any], Dict[str, List[int]]]:
+        if workers <= 1:
+            return self._parse_raw_sequential(parser, partition_by, master_path, master_sample_max, rejects_path, start_offset, end_offset, append, master_records_written, checkpoint_interval, total_lines)
+        tmp_dir = os.path.join(self.out_dir, "_etl_chunks")
+        master_cap = master_sample_max if master_path else 0
+        n_chunks = max(workers, math.ceil((end_offset - start_offset) / self.ETL_CHUNK_BYTES))
+        ranges = self._raw_chunk_ranges(n_chunks, start_offset, end_offset)
+        chunk_dirs = [os.path.join(tmp_dir, f"chunk_{i:05d}") for i in range(len(ranges))]
+        records_written, records_rejected = 0, 0
+        drivers_seen: set[int] = set()
+        partition_stats: Dict[str, List[int]] = {}
+        min_lat, max_lat, min_lon, max_lon = 90.0, -90.0, 180.0, -180.0
+        min_ts, max_ts = None, None
+        header = ["driver_id", "ts_iso", "epoch_ms", "lat", "lon", "day", "hour"]
+        master_file = None
+        chunk_idx = 0
+        try:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                futures = [executor.submit(_parse_raw_chunk, self.raw_txt_path, start, end, chunk_dir, parser, self.bbox, partition_by, master_cap, self.ETL_FLUSH_ROWS) for (start, end), chunk_dir in zip(ranges, chunk_dirs)]
+                results = [future.result() for future in tqdm(futures, desc="Parsing parallelo", unit="blocco", mininterval=1.0)]
+            master_file = open(master_path, "a" if append else "w", newline="", encoding="utf-8") if master_path else None
+            if not append:
+                with open(rejects_path, "w", newline="", encoding="utf-8") as f_rej:
+                    csv.writer(f_rej).writerow(["riga_grezza", "motivo_scarto", "dettagli_errore"])
+                if master_file:
+                    csv.writer(master_file).writerow(header)
+                    master_file.flush()
+            for chunk_idx, (chunk_dir, result) in enumerate(zip(chunk_dirs, results)):
+                for partition_name in result["partitions"]:
+                    partition_path = os.path.join(self.part_dir, partition_name)
+                    if not (os.path.exists(partition_path) and os.path.getsize(partition_path) > 0):
+                        with open(partition_path, "w", newline="", encoding="utf-8") as f_part:
+                            csv.writer(f_part).writerow(header)
+                    with open(partition_path, "ab") as f_part, open(os.path.join(chunk_dir, partition_name), "rb") as f_chunk:
+                        shutil.copyfileobj(f_chunk, f_part)
+                        _fsync_files([f_part])
+                with open(rejects_path, "ab") as f_rej, open(os.path.join(chunk_dir, "_rejects.csv"), "rb") as f_chunk:
+                    shutil.copyfileobj(f_chunk, f_rej)
+                if master_file and master_records_written < master_cap:
+                    with open(os.path.join(chunk_dir, "_master.csv"), "r", newline="", encoding="utf-8") as f_chunk:
+                        for row_line in f_chunk:
+                            if master_records_written >= master_cap:
+                                break
+                            master_file.write(row_line)
+                            master_records_written += 1
+                records_written += result["records_written"]
+                records_rejected += result["records_rejected"]
+                drivers_seen |= result["drivers_seen"]
+                _merge_partition_stats(partition_stats, result["partition_stats"])
+                c_min_lat, c_max_lat, c_min_lon, c_max_lon = result["bbox"]
+                min_lat, max_lat = min(min_lat, c_min_lat), max(max_lat, c_max_lat)
+                min_lon, max_lon = min(min_lon, c_min_lon), max(max_lon, c_max_lon)
+                c_min_ts, c_max_ts = result["time_range"]
+                if c_min_ts:
+                    min_ts = min(min_ts, c_min_ts) if min_ts else c_min_ts
+                    max_ts = max(max_ts, c_max_ts) if max_ts else c_max_ts
+        except OSError as e:
+            print(f"\nErrore I/O critico nel blocco {chunk_idx + 1}/{len(chunk_dirs)}")
+            print(f"  Tipo: {type(e).__name__}")
+            print(f"  Messaggio: {e}")
+            print(f"  Record scritti: {records_written:,}")
+            raise
+        except Exception as e:
+            print(f"\nBug rilevato nel blocco {chunk_idx + 1}/{len(chunk_dirs)}")
+            print(f"  Tipo: {type(e).__name__}")
+            print(f"  Messaggio: {e}")
+            print(f"  Record scritti: {records_written:,}")
+            raise
+        finally:
+            if master_file:
+                master_file.close()
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+        return records_written, records_rejected, master_records_written, drivers_seen, (min_lat, max_lat, min_lon, max_lon), (min_ts, max_ts), partition_stats
+    
+    def _parse_raw_sequential(self, parser: RawRecordParser, partition_by: str, master_path: Optional[str], master_sample_max: int, rejects_path: str, start_offset: int = 0, end_offset: Optional[int] = None, append: bool = False, master_records_written: int = 0, checkpoint_interval: int = 100_000, total_lines: Optional[int] = None) -> Tuple[int, int, int, set, Tuple[float, float, float, float], Tuple[Any, Any], Dict[str, List[int]]]:
+        min_ts, max_ts = None, None
+        min_lat, max_lat = 90.0, -90.0
+        min_lon, max_lon = 180.0, -180.0
+        drivers_seen: set[int] = set()
+        partition_stats: Dict[str, List[int]] = {}
+        records_rejected, records_written = 0, 0
+        header = ["driver_id", "ts_iso", "epoch_ms", "lat", "lon", "day", "hour"]
         partition_files: OrderedDict[str, Tuple[Any, Any]] = OrderedDict()
-        open_func = gzip.open if is_gz else open
+        open_func = gzip.open if self.raw_txt_path.lower().endswith(".gz") else open
+        mode = "a" if append else "w"
         try:
-            with open_func(self.raw_txt_path, "rt", encoding="utf-8", errors="ignore") as f_in, open(rejects_path, "w", newline="", encoding="utf-8") as f_rej:
+            with open_func(self.raw_txt_path, "rb") as f_in, open(rejects_path, mode, newline="", encoding="utf-8") as f_rej:
                 reject_writer = csv.writer(f_rej)
-                reject_writer.writerow(["riga_grezza", "motivo_scarto", "dettagli_errore"])
+                if not append:
+                    reject_writer.writerow(["riga_grezza", "motivo_scarto", "dettagli_errore"])
                 master_file = None
                 master_writer = None
-                if write_master_sample and master_path:
-                    master_file = open(master_path, "w", newline="", encoding="utf-8")
+                if master_path:
+                    master_file = open(master_path, mode, newline="", encoding="utf-8")
                     master_writer = csv.writer(master_file)
-                    master_writer.writerow(["driver_id", "ts_iso", "epoch_ms", "lat", "lon", "day", "hour"])
+                    if not append:
+                        master_writer.writerow(header)
+                f_in.seek(start_offset)
+                pos = start_offset
                 pbar = tqdm(total=total_lines, unit=" righe", desc="Parsing", mininterval=1.0)
                 pbar.set_postfix(valid=0, reject=0)
                 lines_processed = 0
-                for line_num, line in enumerate(f_in, start=1):
-                    line = line.strip()
+                for line_num, raw_line in enumerate(f_in, start=1):
+                    if end_offset is not None and pos >= end_offset:
+                        break
+                    pos += len(raw_line)
+                    line = raw_line.decode("utf-8", errors="ignore").strip()
                     if not line:
                         continue
                     lines_processed += 1
-                    parts = _smart_split_3cols(line)
+                    if lines_processed % self.UPDATE_INTERVAL == 0:
+                        pbar.update(self.UPDATE_INTERVAL)
+                        pbar.set_postfix(valid=records_written, reject=records_rejected)
+                    parts = parser.split(line)
                     if not parts:
                         records_rejected += 1
                         reject_writer.writerow([line, "formato_colonne_invalido", "expected_3_columns"])
-                        if lines_processed % self.UPDATE_INTERVAL == 0:
-                            pbar.update(self.UPDATE_INTERVAL)
-                            pbar.set_postfix(valid=records_written, reject=records_rejected)
                         continue
                     driver_s, ts_s, point_s = parts
                     try:
                         driver_id = int(driver_s)
-                        dt_obj = parse_ts(ts_s, fmt=time_format)
-                        lat, lon = parse_point(point_s)
+                        dt_obj = parser.parse_ts(ts_s)
+                        lat, lon = parser.parse_point(point_s)
                     except ValueError as e:
                         records_rejected += 1
-                        error_detail = str(e)[:100]
-                        reject_writer.writerow([line, "parsing_value_error", error_detail])
-                        if lines_processed % self.UPDATE_INTERVAL == 0:
-                            pbar.update(self.UPDATE_INTERVAL)
-                            pbar.set_postfix(valid=records_written, reject=records_rejected)
+                        reject_writer.writerow([line, "parsing_value_error", str(e)[:100]])
                         continue
                     except TypeError as e:
                         records_rejected += 1
-                        error_detail = str(e)[:100]
-                        reject_writer.writerow([line, "parsing_type_error", error_detail])
-                        if lines_processed % self.UPDATE_INTERVAL == 0:
-                            pbar.update(self.UPDATE_INTERVAL)
-                            pbar.set_postfix(valid=records_written, reject=records_rejected)
+                        reject_writer.writerow([line, "parsing_type_error", str(e)[:100]])
                         continue
                     try:
                         if not within_bbox(lat, lon, self.bbox):
                             records_rejected += 1
                             reject_writer.writerow([line, "fuori_bounding_box", f"lat={lat:.6f}_lon={lon:.6f}_bbox={self.bbox}"])
-                            if lines_processed % self.UPDATE_INTERVAL == 0:
-                                pbar.update(self.UPDATE_INTERVAL)
-                                pbar.set_postfix(valid=records_written, reject=records_rejected)
                             continue
                         epoch_ms = int(dt_obj.timestamp() * 1000)
                         min_ts = min(min_ts, dt_obj) if min_ts else dt_obj
@@ -220,7 +767,8 @@ class DataManager:
                         min_lat, max_lat = min(min_lat, lat), max(max_lat, lat)
                         min_lon, max_lon = min(min_lon, lon), max(max_lon, lon)
                         drivers_seen.add(driver_id)
-                        day, hour = dt_obj.strftime("%Y-%m-%d"), dt_obj.strftime("%H")
+                        ts_iso = dt_obj.isoformat(sep=" ")
+                        day, hour = _day_hour_from_iso(dt_obj, ts_iso)
                         partition_name = f"{day}.csv" if partition_by == "day" else f"{day}_{hour}.csv"
                         if partition_name not in partition_files:
                             if len(partition_files) >= self.MAX_OPEN_FILES:
@@ -232,35 +780,27 @@ class DataManager:
                             f_part = open(partition_path, "a", newline="", encoding="utf-8")
                             writer = csv.writer(f_part)
                             if not file_exists:
-                                writer.writerow(["driver_id", "ts_iso", "epoch_ms", "lat", "lon", "day", "hour"])
+                                writer.writerow(header)
                             partition_files[partition_name] = (f_part, writer)
                         else:
                             partition_files.move_to_end(partition_name)
                         _, writer = partition_files[partition_name]
-                        writer.writerow([driver_id, dt_obj.isoformat(sep=" "), epoch_ms, f"{lat:.7f}", f"{lon:.7f}", day, hour])
+                        record = [driver_id, ts_iso, epoch_ms, f"{lat:.7f}", f"{lon:.7f}", day, hour]
+                        writer.writerow(record)
                         records_written += 1
-                        if lines_processed % self.UPDATE_INTERVAL == 0:
-                            pbar.update(self.UPDATE_INTERVAL)
-                            pbar.set_postfix(valid=records_written, reject=records_rejected)
+                        _update_partition_stats(partition_stats, partition_name, epoch_ms)
                         if master_writer and master_records_written < master_sample_max:
-                            master_writer.writerow([driver_id, dt_obj.isoformat(sep=" "), epoch_ms, f"{lat:.7f}", f"{lon:.7f}", day, hour])
+                            master_writer.writerow(record)
                             master_records_written += 1
                         if records_written % checkpoint_interval == 0:
-                            for f_part, _ in partition_files.values():
-                                f_part.flush()
-                                os.fsync(f_part.fileno())
+                            _fsync_files(f_part for f_part, _ in partition_files.values())
                     except OSError as e:
                         print(f"\nErrore I/O critico riga {line_num}")
                         print(f"  Tipo: {type(e).__name__}")
                         print(f"  Messaggio: {e}")
                         print(f"  Record scritti: {records_written:,}")
                         print(f"  Salvando checkpoint")
-                        for f_part, _ in partition_files.values():
-                            try:
-                                f_part.flush()
-                                os.fsync(f_part.fileno())
-                            except:
-                                pass
+                        _fsync_files((f_part for f_part, _ in partition_files.values()), ignore_errors=True)
                         pbar.close()
                         raise
                     except Exception as e:
@@ -270,15 +810,9 @@ class DataManager:
                         print(f"  Riga: {line!r}")
                         print(f"  Dati: driver_id={driver_id}, dt={dt_obj}, lat={lat}, lon={lon}")
                         print(f"  Record scritti: {records_written:,}")
-                        import traceback
                         print("\nTraceback:")
                         traceback.print_exc()
-                        for f_part, _ in partition_files.values():
-                            try:
-                                f_part.flush()
-                                os.fsync(f_part.fileno())
-                            except:
-                                pass
+                        _fsync_files((f_part for f_part, _ in partition_files.values()), ignore_errors=True)
                         pbar.close()
                         raise
                 remaining = lines_processed % self.UPDATE_INTERVAL
@@ -292,66 +826,215 @@ class DataManager:
             for f_part, _ in partition_files.values():
                 try:
                     f_part.close()
-                except:
+                except OSError:
                     pass
-        metadata = {"raw_path": self.raw_txt_path, "out_dir": self.out_dir, "partitions_dir": self.part_dir, "partition_by": partition_by, "records_written": records_written, "records_rejected": records_rejected, "unique_drivers": len(drivers_seen), "effective_bbox": [min_lat, max_lat, min_lon, max_lon], "time_range": {"min_ts": min_ts.isoformat(sep=" ") if min_ts else None, "max_ts": max_ts.isoformat(sep=" ") if max_ts else None}, "master_sample_path": master_path, "master_records_written": master_records_written, "rejects_log_path": rejects_path}
-        with open(self.meta_path, "w", encoding="utf-8") as f_meta:
-            json.dump(metadata, f_meta, indent=2)
-        duration_sec = time.perf_counter() - start_time
-        print("\n" + "=" * 70)
-        print(f"Parsing completato in {duration_sec:.1f} secondi")
-        print(f"  Record validi: {records_written:,}")
-        print(f"  Righe scartate: {records_rejected:,} ({records_rejected/(records_written+records_rejected)*100:.1f}%)")
-        print(f"  Driver unici: {len(drivers_seen):,}")
-        print(f"  Range temporale: {min_ts.strftime('%Y-%m-%d %H:%M') if min_ts else 'N/A'} → {max_ts.strftime('%Y-%m-%d %H:%M') if max_ts else 'N/A'}")
-        print(f"  Bounding box: [{min_lat:.4f}, {max_lat:.4f}] lat × [{min_lon:.4f}, {max_lon:.4f}] lon")
-        print(f"\nFile generati:")
-        print(f"  Partizioni: {self.part_dir}")
-        print(f"  Metadata: {self.meta_path}")
-        print(f"  Righe scartate: {rejects_path}")
-        if write_master_sample:
-            print(f"  Campione master: {master_path} ({master_records_written:,} record)")
-        print("=" * 70 + "\n")
-        return metadata
+        return records_written, records_rejected, master_records_written, drivers_seen, (min_lat, max_lat, min_lon, max_lon), (min_ts, max_ts), partition_stats
     
-    def _iter_partitions_for_window(self, day: str, hour: Optional[str], duration_hours: int) -> List[str]:
-        partition_paths: List[str] = []
-        start_datetime = dt.datetime.strptime(f"{day} {hour or '00'}", "%Y-%m-%d %H")
-        if self._partition_by == "day":
-            days_covered = set()
-            for i in range(duration_hours):
-                current_dt = start_datetime + dt.timedelta(hours=i)
-                days_covered.add(current_dt.strftime("%Y-%m-%d"))
-            for day_str in sorted(days_covered):
-                partition_name = f"{day_str}.csv"
-                partition_path = os.path.join(self.part_dir, partition_name)
-                if os.path.exists(partition_path):
-                    partition_paths.append(partition_path)
+    def _last_line_end(self, start: int, size: int) -> int:
+        block = 64 * 1024
+        with open(self.raw_txt_path, "rb") as f_raw:
+            pos = size
+            while pos > start:
+                read_from = max(start, pos - block)
+                f_raw.seek(read_from)
+                idx = f_raw.read(pos - read_from).rfind(b"\n")
+                if idx >= 0:
+                    return read_from + idx + 1
+                pos = read_from
+        return start
+    
+    def _raw_fingerprint(self, offset: int) -> str:
+        digest = hashlib.sha256()
+        if offset <= 2 * self.FINGERPRINT_BYTES + self.FINGERPRINT_SAMPLES * self.FINGERPRINT_SAMPLE_BYTES:
+            spans = [(0, offset)]
         else:
-            for i in range(duration_hours):
-                current_dt = start_datetime + dt.timedelta(hours=i)
-                partition_name = f"{current_dt.strftime('%Y-%m-%d')}_{current_dt.strftime('%H')}.csv"
-                partition_path = os.path.join(self.part_dir, partition_name)
-                if os.path.exists(partition_path):
-                    partition_paths.append(partition_path)
-        return partition_paths
+            step = offset // (self.FINGERPRINT_SAMPLES + 1)
+            spans = [(0, self.FINGERPRINT_BYTES), (offset - self.FINGERPRINT_BYTES, offset)] + [(step * i, step * i + self.FINGERPRINT_SAMPLE_BYTES) for i in range(1, self.FINGERPRINT_SAMPLES + 1)]
+        with open(self.raw_txt_path, "rb") as f_raw:
+            for start, end in spans:
+                f_raw.seek(start)
+                digest.update(f_raw.read(end - start))
+        digest.update(str(offset).encode())
+        return digest.hexdigest()
     
-    def get_window_records(self, day: str, hour: str, duration_hours: int = 1, bbox: Optional[Tuple[float, float, float, float]] = None, max_rows: Optional[int] = None) -> Iterator[Dict[str, Any]]:
-        target_bbox = bbox or self.bbox
+    def load_manifest(self) -> Optional[Dict[str, Any]]:
+        if not os.path.exists(self.manifest_path):
+            return None
+        mtime = os.path.getmtime(self.manifest_path)
+        if self._manifest_cache is not None and self._manifest_cache[0] == mtime:
+            return self._manifest_cache[1]
+        try:
+            with open(self.manifest_path, "r", encoding="utf-8") as f_manifest:
+                manifest = json.load(f_manifest)
+        except (OSError, ValueError) as e:
+            warnings.warn(f"Manifest ETL illeggibile ({self.manifest_path}): {e}", UserWarning)
+            return None
+        self._manifest_cache = (mtime, manifest)
+        return manifest
+    
+    def _manifest_matches(self, manifest: Dict[str, Any], partition_by: str, time_format: Optional[str], write_master_sample: bool) -> bool:
+        offset = manifest.get("raw_bytes_processed", -1)
+        if manifest.get("partition_by") != partition_by or manifest.get("time_format") != time_format or manifest.get("bbox") != list(self.bbox):
+            return False
+        if (manifest.get("metadata", {}).get("master_sample_path") is not None) != write_master_sample:
+            return False
+        if not 0 <= offset <= os.path.getsize(self.raw_txt_path):
+            return False
+        return manifest.get("raw_fingerprint") == self._raw_fingerprint(offset)
+    
+    def needs_etl(self) -> bool:
+        if not (os.path.isdir(self.part_dir) and any(f.endswith(".csv") for f in os.listdir(self.part_dir))):
+            return True
+        if not os.path.exists(self.raw_txt_path):
+            return False
+        manifest = self.load_manifest()
+        if manifest is None:
+            return True
+        raw_size = os.path.getsize(self.raw_txt_path)
+        if raw_size == manifest.get("raw_bytes_processed", -1):
+            return False
+        return not (raw_size == manifest.get("raw_size") and os.path.getmtime(self.raw_txt_path) == manifest.get("raw_mtime"))
+    
+    def _clear_partitions(self) -> None:
+        existing = [name for name in os.listdir(self.part_dir) if name.endswith(".csv")]
+        if existing:
+            warnings.warn(f"ETL completo: rimozione di {len(existing)} partizioni esistenti in {self.part_dir} (e relativi file colonnari, aggregati e manifest) prima della riscrittura", UserWarning)
+        for name in existing:
+            os.remove(os.path.join(self.part_dir, name))
+        shutil.rmtree(self.npy_dir, ignore_errors=True)
+        shutil.rmtree(self.agg_dir, ignore_errors=True)
+        for path in [path for path in self._aggregate_cache if path.startswith(self.agg_dir + os.sep)]:
+            del self._aggregate_cache[path]
+        if os.path.exists(self.manifest_path):
+            os.remove(self.manifest_path)
+        self._manifest_cache = None
+    
+    def _columnar_paths(self, partition_path: str) -> Dict[str, str]:
+        col_dir = os.path.join(self.npy_dir, os.path.splitext(os.path.basename(partition_path))[0])
+        return {name: os.path.join(col_dir, f"{name}.npy") for name, _ in self.COLUMNAR_SCHEMA}
+    
+    def _write_partition_columns(self, partition_path: str) -> Dict[str, np.ndarray]:
+        values: Dict[str, List[Any]] = {name: [] for name, _ in self.COLUMNAR_SCHEMA}
+        with open(partition_path, "r", encoding="utf-8") as f:
+            for row in csv.DictReader(f):
+                values["driver_id"].append(int(row["driver_id"]))
+                values["epoch_ms"].append(int(row["epoch_ms"]))
+                values["lat"].append(float(row["lat"]))
+                values["lon"].append(float(row["lon"]))
+        columns = {name: np.array(values[name], dtype=dtype) for name, dtype in self.COLUMNAR_SCHEMA}
+        paths = self._columnar_paths(partition_path)
+        os.makedirs(os.path.dirname(next(iter(paths.values()))), exist_ok=True)
+        for name, column in columns.items():
+            tmp_path = f"{paths[name]}.{os.getpid()}.tmp"
+            with open(tmp_path, "wb") as f_col:
+                np.save(f_col, column)
+            os.replace(tmp_path, paths[name])
+        return columns
+    
+    def _load_partition_columns(self, partition_path: str, mmap_mode: Optional[str] = None) -> Dict[str, np.ndarray]:
+        paths = self._columnar_paths(partition_path)
+        csv_mtime = os.path.getmtime(partition_path)
+        if all(os.path.exists(p) and os.path.getmtime(p) >= csv_mtime for p in paths.values()):
+            return {name: np.load(p, mmap_mode=mmap_mode) for name, p in paths.items()}
+        return self._write_partition_columns(partition_path)
+    
+    def build_columnar_partitions(self) -> int:
+        partitions = sorted(f for f in os.listdir(self.part_dir) if f.endswith(".csv"))
+        for partition_name in tqdm(partitions, desc="Conversione colonnare", unit="file", disable=len(partitions) < 2):
+            self._load_partition_columns(os.path.join(self.part_dir, partition_name))
+        return len(partitions)
+    
+    def _window_partition_files(self, day: str, hour: str, duration_hours: int) -> List[str]:
         partition_files = self._iter_partitions_for_window(day, hour, duration_hours)
         if not partition_files:
             raise FileNotFoundError(f"Nessuna partizione trovata per {day} H{hour} (durata {duration_hours}h). Verificare esecuzione parse_raw_to_csv().")
-        record_count = 0
-        for file_path in tqdm(partition_files, desc="Caricamento partizioni", unit="file", disable=True):
-            with open(file_path, "r", encoding="utf-8") as f:
-                reader = csv.DictReader(f)
-                for row in reader:
-                    lat, lon = float(row["lat"]), float(row["lon"])
-                    if within_bbox(lat, lon, target_bbox):
-                        yield row
-                        record_count += 1
-                        if max_rows and record_count >= max_rows:
-                            return
+        return partition_files
+    
+    def _window_columns(self, partition_files: List[str], bbox: Optional[Tuple[float, float, float, float]] = None, mmap_mode: Optional[str] = "r") -> Dict[str, np.ndarray]:
+        lat_min, lat_max, lon_min, lon_max = bbox or self.bbox
+        parts = [self._load_partition_columns(path, mmap_mode=mmap_mode) for path in partition_files]
+        columns = parts[0] if len(parts) == 1 else {name: np.concatenate([part[name] for part in parts]) for name, _ in self.COLUMNAR_SCHEMA}
+        lat, lon = columns["lat"], columns["lon"]
+        mask = (lat_min <= lat) & (lat < lat_max) & (lon_min <= lon) & (lon < lon_max)
+        if mask.all():
+            return columns
+        return {name: column[mask] for name, column in columns.items()}
+    
+    def get_window_arrays(self, day: str, hour: str, duration_hours: int = 1, bbox: Optional[Tuple[float, float, float, float]] = None, mmap_mode: Optional[str] = "r") -> Dict[str, np.ndarray]:
+        return self._window_columns(self._window_partition_files(day, hour, duration_hours), bbox=bbox, mmap_mode=mmap_mode)
+    
+    @staticmethod
+    def _last_position_arrays(columns: Dict[str, np.ndarray]) -> Dict[str, np.ndarray]:
+        driver_ids, epoch_ms = columns["driver_id"], columns["epoch_ms"]
+        if driver_ids.size == 0:
+            return {name: np.asarray(columns[name])[:0] for name in ("driver_id", "epoch_ms", "lat", "lon")}
+        order = np.lexsort((-epoch_ms, driver_ids))
+        sorted_ids = driver_ids[order]
+        group_start = np.ones(sorted_ids.size, dtype=bool)
+        group_start[1:] = sorted_ids[1:] != sorted_ids[:-1]
+        _, first_seen = np.unique(driver_ids, return_index=True)
+        latest = order[group_start][np.argsort(first_seen, kind="stable")]
+        return {name: np.asarray(columns[name][latest]) for name in ("driver_id", "epoch_ms", "lat", "lon")}
+    
+    @staticmethod
+    def _cell_count_arrays(iy: np.ndarray, ix: np.ndarray, counts: np.ndarray) -> Dict[str, np.ndarray]:
+        if iy.size == 0:
+            return {"iy": iy.astype(np.int64), "ix": ix.astype(np.int64), "count": counts.astype(np.int64)}
+        iy_min, ix_min = int(iy.min()), int(ix.min())
+        span = int(ix.max()) - ix_min + 1
+        keys, inverse = np.unique((iy - iy_min) * span + (ix - ix_min), return_inverse=True)
+        totals = np.zeros(keys.size, dtype=np.int64)
+        np.add.at(totals, inverse, counts)
+        return {"iy": (iy_min + keys // span).astype(np.int64), "ix": (ix_min + keys % span).astype(np.int64), "count": totals}
+    
+    def _aggregate_path(self, partition_path: str, kind: str, params: List[Any]) -> str:
+        tag = hashlib.sha1(json.dumps([self.AGGREGATE_VERSION, list(self.bbox)] + params).encode()).hexdigest()[:12]
+        return os.path.join(self.agg_dir, os.path.splitext(os.path.basename(partition_path))[0], f"{kind}_{tag}.npz")
+    
+    def _load_aggregate(self, partition_path: str, kind: str, params: List[Any], build: Callable[[Dict[str, np.ndarray]], Dict[str, np.ndarray]]) -> Dict[str, np.ndarray]:
+        path = self._aggregate_path(partition_path, kind, params)
+        csv_mtime = os.path.getmtime(partition_path)
+        cached = self._aggregate_cache.get(path)
+        if cached is not None and cached[0] == csv_mtime:
+            self._aggregate_cache.move_to_end(path)
+            return cached[1]
+        if os.path.exists(path) and os.path.getmtime(path) >= csv_mtime:
+            with np.load(path) as data:
+                arrays = {name: data[name] for name in data.files}
+        else:
+            arrays = build(self._window_columns([partition_path]))
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with open(tmp_path, "wb") as f_agg:
+                np.savez(f_agg, **arrays)
+            os.replace(tmp_path, path)
+        self._aggregate_cache[path] = (csv_mtime, arrays)
+        self._aggregate_cache.move_to_end(path)
+        while len(self._aggregate_cache) > self.AGGREGATE_CACHE_MAX:
+            self._aggregate_cache.popitem(last=False)
+        return arrays
+    
+    def _hourly_aggregates(self, day: str, hour: str, duration_hours: int, kind: str, params: List[Any], build: Callable[[Dict[str, np.ndarray]], Dict[str, np.ndarray]]) -> Dict[str, np.ndarray]:
+        partition_files = self._window_partition_files(day, hour, duration_hours)
+        if self._partition_by != "day-hour":
+            return build(self._window_columns(partition_files))
+        parts = [self._load_aggregate(path, kind, params, build) for path in partition_files]
+        return parts[0] if len(parts) == 1 else {name: np.concatenate([part[name] for part in parts]) for name in parts[0]}
+    
+    def get_last_positions(self, day: str, hour: str, duration_hours: int = 1) -> Dict[int, Tuple[float, float, int]]:
+        latest = self._hourly_aggregates(day, hour, duration_hours, "last", [], self._last_position_arrays)
+        if duration_hours > 1:
+            latest = self._last_position_arrays(latest)
+        return {did: (lat, lon, epoch) for did, lat, lon, epoch in zip(latest["driver_id"].tolist(), latest["lat"].tolist(), latest["lon"].tolist(), latest["epoch_ms"].tolist())}
+    
+    def count_cells(self, day: str, hour: str, duration_hours: int, origin: Tuple[float, float], cell_m: float) -> Dict[Tuple[int, int], int]:
+        def build(columns: Dict[str, np.ndarray]) -> Dict[str, np.ndarray]:
+            iy, ix = latlon_to_cells(columns["lat"], columns["lon"], origin[0], origin[1], cell_m)
+            return self._cell_count_arrays(iy, ix, np.ones(iy.size, dtype=np.int64))
+        cells = self._hourly_aggregates(day, hour, duration_hours, "cells", [float(origin[0]), float(origin[1]), float(cell_m)], build)
+        if duration_hours > 1:
+            cells = self._cell_count_arrays(cells["iy"], cells["ix"], cells["count"])
+        return {(iy, ix): count for iy, ix, count in zip(cells["iy"].tolist(), cells["ix"].tolist(), cells["count"].tolist())}
     
     def get_block_records(self, day: str, start_hour: int, end_hour: int, bbox: Optional[Tuple[float, float, float, float]] = None, max_rows: Optional[int] = None) -> Iterator[Dict[str, Any]]:
         duration = end_hour - start_hour
@@ -359,7 +1042,7 @@ class DataManager:
             return iter([])
         yield from self.get_window_records(day=day, hour=f"{start_hour:02d}", duration_hours=duration, bbox=bbox, max_rows=max_rows)
     
-    def create_tasks(self, day: Optional[str] = None, hour: Optional[str] = None, duration_hours: int = 1, cell_size_m: int = 500, value_mode: str = "uniform", uniform_low: float = None, uniform_high: float = None, seed: Optional[int] = None, show_progress: bool = True) -> List[Task]:
+    def create_task_set(self, day: Optional[str] = None, hour: Optional[str] = None, duration_hours: int = 1, cell_size_m: int = 500, value_mode: str = "uniform", uniform_low: float = None, uniform_high: float = None, seed: Optional[int] = None, task_cls: type = Task) -> TaskSet:
         if cell_size_m <= 0:
             raise ValueError(f"cell_size_m deve essere > 0, ricevuto {cell_size_m}")
         if cell_size_m > 50000:
@@ -383,28 +1066,28 @@ class DataManager:
             first_partition = partitions[0]
             day = first_partition[:10]
             hour = first_partition[11:13] if len(first_partition) > 10 else "00"
-        records_iterator = self.get_window_records(day=day, hour=hour, duration_hours=duration_hours)
         lat0, _, lon0, _ = self.bbox
         self._grid_origin_current = (lat0, lon0)
         self._grid_cell_m_current = cell_size_m
-        cells: Dict[Tuple[int, int], int] = {}
-        for row in records_iterator:
-            lat, lon = float(row["lat"]), float(row["lon"])
-            iy, ix = latlon_to_cell(lat, lon, lat0, lon0, cell_size_m)
-            cells[(iy, ix)] = cells.get((iy, ix), 0) + 1
+        cells = self.count_cells(day=day, hour=hour, duration_hours=duration_hours, origin=(lat0, lon0), cell_m=cell_size_m)
         self._last_cells_counts = cells
         sorted_cells = sorted(cells.items(), key=lambda item: item[0])
-        tasks: List[Task] = []
-        self._task_cell_map = {}
-        task_id_counter = 1
-        for (iy, ix), count in sorted_cells:
-            lat, lon = cell_to_centroid(iy, ix, lat0, lon0, cell_size_m)
-            value = TaskValueModel.compute_value(mode=value_mode, count=count, low=uniform_low, high=uniform_high)
-            task = Task(task_id=task_id_counter, x=lon, y=lat, value=value)
-            tasks.append(task)
-            self._task_cell_map[task.id] = (iy, ix, lat, lon)
-            task_id_counter += 1
-        return tasks
+        cell_iy = [iy for (iy, _), _ in sorted_cells]
+        cell_ix = [ix for (_, ix), _ in sorted_cells]
+        lats, lons = cells_to_centroids(cell_iy, cell_ix, lat0, lon0, cell_size_m)
+        values = [TaskValueModel.compute_value(mode=value_mode, count=count, low=uniform_low, high=uniform_high) for _, count in sorted_cells]
+        task_ids = range(1, len(sorted_cells) + 1)
+        self._task_cell_map = {task_id: (iy, ix, lat, lon) for task_id, iy, ix, lat, lon in zip(task_ids, cell_iy, cell_ix, lats.tolist(), lons.tolist())}
+        return TaskSet(np.arange(1, len(sorted_cells) + 1), lats, lons, values, task_cls=task_cls)
+    
+    def create_tasks(self, day: Optional[str] = None, hour: Optional[str] = None, duration_hours: int = 1, cell_size_m: int = 500, value_mode: str = "uniform", uniform_low: float = None, uniform_high: float = None, seed: Optional[int] = None, show_progress: bool = True) -> List[Task]:
+        return self.create_task_set(day=day, hour=hour, duration_hours=duration_hours, cell_size_m=cell_size_m, value_mode=value_mode, uniform_low=uniform_low, uniform_high=uniform_high, seed=seed).to_list()
+    
+    def build_task_index(self, tasks: Union[List[Task], TaskSet], radius_m: Optional[float] = None) -> TaskSpatialIndex:
+        return TaskSpatialIndex(tasks, cell_m=self._grid_cell_m_current, radius_m=radius_m, origin=self._grid_origin_current)
+    
+    def distance_matrix(self, users: Iterable[User], tasks: Union[List[Task], TaskSet]) -> np.ndarray:
+        return haversine_matrix_m(positions_array(users), positions_array(tasks), User.EARTH_RADIUS_M)
     
     def create_users(self, day: Optional[str] = None, hour: Optional[str] = None, duration_hours: int = 1, max_users: int = 99999, cost_mode: str = "uniform", cost_params: Tuple[float, float] = None, sampling_strategy: str = "uniform", show_progress: bool = True) -> List[User]:
         if cost_params is None:
@@ -416,13 +1099,7 @@ class DataManager:
             first_partition = partitions[0]
             day = first_partition[:10]
             hour = first_partition[11:13] if len(first_partition) > 10 else "00"
-        last_positions: Dict[int, Tuple[float, float, int]] = {}
-        for row in self.get_window_records(day=day, hour=hour, duration_hours=duration_hours):
-            driver_id = int(row["driver_id"])
-            epoch_ms = int(row["epoch_ms"])
-            lat, lon = float(row["lat"]), float(row["lon"])
-            if driver_id not in last_positions or epoch_ms > last_positions[driver_id][2]:
-                last_positions[driver_id] = (lat, lon, epoch_ms)
+        last_positions = self.get_last_positions(day=day, hour=hour, duration_hours=duration_hours)
         driver_items = [(did, (lat, lon)) for did, (lat, lon, _) in last_positions.items()]
         if len(driver_items) > max_users:
             if sampling_strategy == "uniform":
@@ -7,14 +7,16 @@ _current_dir = os.path.dirname(os.path.abspath(__file__))
 if _current_dir not in sys.path:
     sys.path.insert(0, _current_dir)
 
-from typing import Dict, Tuple, List, Any, Optional
+from typing import Callable, Dict, Tuple, List, Any, Optional
 from dataclasses import dataclass
+from concurrent.futures import ProcessPoolExecutor
 from classes import set_random_seed
-from data_manager import DataManager, GeoConstants, latlon_to_cell
-from imcu import run_imcu_auction
+from data_manager import DataManager, GeoConstants
+from imcu import run_imcu_auction, VALIDATION_LEVELS
 from plot import ScientificPlotter
 
 import json
+import pickle
 import argparse
 import logging
 import hashlib
@@ -46,6 +48,14 @@ class ExperimentConfig:
     save_raw_logs: bool
     verify_properties: bool
     dataset_out: Optional[str] = None
+    etl_workers: int = 0
+    workers: int = 0
+    validation_level: str = "full"
+    fast_verification: bool = False
+    lazy_greedy: bool = False
+    incremental_payments: bool = False
+    compiled_coverage: bool = False
+    verification_workers: int = 0
     
     def validate(self) -> None:
         if not os.path.exists(self.raw_data_path):
@@ -56,6 +66,14 @@ class ExperimentConfig:
             raise ValueError(f"Ore fuori range [0,24): hour_start={self.hour_start}, hour_end={self.hour_end}")
         if self.block_size <= 0:
             raise ValueError(f"block_size deve essere > 0, ricevuto: {self.block_size}")
+        if self.etl_workers < 0:
+            raise ValueError(f"etl_workers deve essere >= 0, ricevuto: {self.etl_workers}")
+        if self.workers < 0:
+            raise ValueError(f"workers deve essere >= 0, ricevuto: {self.workers}")
+        if isinstance(self.verification_workers, bool) or not isinstance(self.verification_workers, int) or self.verification_workers < 0:
+            raise ValueError(f"verification_workers deve essere un intero >= 0, ricevuto: {self.verification_workers!r}")
+        if self.validation_level not in VALIDATION_LEVELS:
+            raise ValueError(f"validation_level deve essere uno tra {VALIDATION_LEVELS}, ricevuto: {self.validation_level}")
         if self.cell_size_m <= 0:
             raise ValueError(f"cell_size_m deve essere > 0, ricevuto: {self.cell_size_m}")
         if self.cell_size_m > 50000:
@@ -93,6 +111,22 @@ class ExperimentConfig:
                 data[key] = str(value)
         return data
 
+@dataclass(slots=True)
+class HourlyResult:
+    day: str
+    hour: int
+    n_tasks: int
+    n_users: int
+    n_winners: int
+    platform_value: float
+    total_payments: float
+    platform_utility: float
+    mv_calls_selection: int
+    mv_calls_payment: int
+    payments: np.ndarray
+    winner_ids: np.ndarray
+    spill_path: Optional[str] = None
+
 def setup_experiment_logger(output_dir: str, experiment_id: str) -> logging.Logger:
     os.makedirs(output_dir, exist_ok=True)
     logger = logging.getLogger(experiment_id)
@@ -141,6 +175,21 @@ def safe_json_dump(data: Dict, filepath: str, logger: logging.Logger) -> bool:
         logger.error(f"Errore imprevisto salvataggio JSON {filepath}: {e}")
         return False
 
+def spill_hour_objects(spill_dir: str, day: str, hour: int, payload: Dict[str, Any], logger: logging.Logger) -> Optional[str]:
+    filepath = os.path.join(spill_dir, f"{day}_H{hour:02d}.pkl")
+    try:
+        os.makedirs(spill_dir, exist_ok=True)
+        with open(filepath, "wb") as f:
+            pickle.dump(payload, f, protocol=pickle.HIGHEST_PROTOCOL)
+        return filepath
+    except (OSError, pickle.PicklingError, TypeError, AttributeError) as e:
+        logger.error(f"Errore salvataggio oggetti orari {filepath}: {e}")
+        return None
+
+def load_spilled_hour(filepath: str) -> Dict[str, Any]:
+    with open(filepath, "rb") as f:
+        return pickle.load(f)
+
 def safe_csv_write(content: str, filepath: str, logger: logging.Logger) -> bool:
     try:
         os.makedirs(os.path.dirname(filepath), exist_ok=True)
@@ -155,13 +204,7 @@ def safe_csv_write(content: str, filepath: str, logger: logging.Logger) -> bool:
         return False
 
 def compute_density_cells(dm: DataManager, day: str, hour: int, origin: Tuple[float, float], cell_m: float) -> Dict[Tuple[int, int], float]:
-    density = {}    
-    for row in dm.get_window_records(day=day, hour=f"{hour:02d}", duration_hours=1):
-        lat = float(row["lat"])
-        lon = float(row["lon"])
-        iy, ix = latlon_to_cell(lat, lon, origin[0], origin[1], cell_m)
-        density[(iy, ix)] = density.get((iy, ix), 0.0) + 1.0
-    return density
+    return {cell: float(count) for cell, count in dm.count_cells(day=day, hour=f"{hour:02d}", duration_hours=1, origin=origin, cell_m=cell_m).items()}
 
 def generate_summary_report(output_dir: str, day: str, hours: List[int], vS_values: List[float], sumP_values: List[float], u0_values: List[float], winners_per_hour: Dict[int, int], all_payments: List[float], gini: float, logger: logging.Logger) -> None:
     report_path = os.path.join(output_dir, f"{day}_SUMMARY_REPORT.txt")
@@ -219,7 +262,7 @@ def generate_summary_report(output_dir: str, day: str, hours: List[int], vS_valu
     except Exception as e:
         logger.error(f"Errore generazione summary report: {e}")
 
-def run_hourly_simulation(dm: DataManager, config: ExperimentConfig, day: str, hour: int, logger: logging.Logger) -> Optional[Dict[str, Any]]:
+def run_hourly_simulation(dm: DataManager, config: ExperimentConfig, day: str, hour: int, logger: logging.Logger) -> Optional[HourlyResult]:
     try:
         logger.info(f"[{day} H{hour:02d}] Inizio simulazione oraria")
         tasks = dm.create_tasks(day=day, hour=f"{hour:02d}", duration_hours=1, cell_size_m=config.cell_size_m, value_mode=config.value_mode, show_progress=False)
@@ -234,11 +277,12 @@ def run_hourly_simulation(dm: DataManager, config: ExperimentConfig, day: str, h
         if not users:
             logger.warning(f"[{day} H{hour:02d}] Nessun utente trovato, skip ora")
             return None
+        task_index = dm.build_task_index(tasks, radius_m=config.task_radius_m) if config.task_radius_m is not None else None
         for user in users:
             if config.task_radius_m is None:
                 user.set_tasks(tasks)
             else:
-                tasks_in_radius = [t for t in tasks if user.calculate_distance_to(t) <= config.task_radius_m]
+                tasks_in_radius = task_index.tasks_within_radius(user, config.task_radius_m)
                 user.set_tasks(tasks_in_radius)
             user.calculate_cost_and_bid()
         users_with_tasks = [u for u in users if len(u.tasks) > 0]
@@ -250,7 +294,7 @@ def run_hourly_simulation(dm: DataManager, config: ExperimentConfig, day: str, h
         if not users_with_tasks:
             logger.warning(f"[{day} H{hour:02d}] Nessun utente con task assegnati (raggio {config.task_radius_m}m troppo restrittivo?), skip ora")
             return None
-        winners_set, payments, diagnostics = run_imcu_auction(users_with_tasks, debug=True, verify_properties=config.verify_properties)
+        winners_set, payments, diagnostics = run_imcu_auction(users_with_tasks, debug=True, verify_properties=config.verify_properties, fast_verification=config.fast_verification, lazy_greedy=config.lazy_greedy, incremental_payments=config.incremental_payments, compiled_coverage=config.compiled_coverage, verification_workers=config.verification_workers, validation=config.validation_level)
         logger.debug(f"[{day} H{hour:02d}] IMCU completato: {len(winners_set)} vincitori su {len(users_with_tasks)} partecipanti")
         if config.verify_properties:
             props = diagnostics.get("property_checks", {})
@@ -261,12 +305,46 @@ def run_hourly_simulation(dm: DataManager, config: ExperimentConfig, day: str, h
             truth_ok = len(props.get("Truthfulness", {})) > 0
             subm = props.get("Submodularity", {})
             logger.info(f"[{day} H{hour:02d}] Proprietà: IR={ir_ok}, Profit={prof_ok}, Monot={mono_ok}, Crit={crit_ok}, Truth={truth_ok}, SubmViol={subm.get('violations', 'N/A')}")
-        return {"day": day, "hour": hour, "n_tasks": len(tasks), "n_users": len(users_with_tasks), "n_winners": len(winners_set), "platform_value": diagnostics.get("platform_value_vS", 0.0), "total_payments": diagnostics.get("payments_sum", 0.0), "platform_utility": diagnostics.get("platform_utility_u0", 0.0), "mv_calls_selection": diagnostics.get("mv_calls_selection", 0), "mv_calls_payment": diagnostics.get("mv_calls_payment", 0), "payments_list": list(payments.values()), "properties": diagnostics.get("property_checks", {}), "users": users_with_tasks, "tasks": tasks, "winners_set": winners_set}
+        spill_path = spill_hour_objects(os.path.join(config.output_dir, f"day_{day}", "raw_logs"), day, hour, {"users": users_with_tasks, "tasks": tasks, "winners_set": winners_set, "payments": payments, "properties": diagnostics.get("property_checks", {})}, logger) if config.save_raw_logs else None
+        return HourlyResult(day=day, hour=hour, n_tasks=len(tasks), n_users=len(users_with_tasks), n_winners=len(winners_set), platform_value=diagnostics.get("platform_value_vS", 0.0), total_payments=diagnostics.get("payments_sum", 0.0), platform_utility=diagnostics.get("platform_utility_u0", 0.0), mv_calls_selection=diagnostics.get("mv_calls_selection", 0), mv_calls_payment=diagnostics.get("mv_calls_payment", 0), payments=np.fromiter(payments.values(), dtype=float, count=len(payments)), winner_ids=np.fromiter(sorted(winners_set), dtype=np.int64, count=len(winners_set)), spill_path=spill_path)
     except Exception as e:
         logger.error(f"[{day} H{hour:02d}] Errore simulazione oraria: {e}", exc_info=True)
         return None
 
-def run_experiment(config: ExperimentConfig) -> None:
+HOURLY_KPI_FIELDS = ("n_tasks", "n_users", "n_winners", "platform_value", "total_payments", "platform_utility")
+
+def hourly_kpi_row(result: HourlyResult) -> Dict[str, Any]:
+    return {"day": result.day, "hour": result.hour, **{field: float(getattr(result, field)) for field in HOURLY_KPI_FIELDS}}
+
+def hour_seed(random_seed: int, day: str, hour: int) -> int:
+    return int(np.random.SeedSequence([int(random_seed), dt.date.fromisoformat(day).toordinal(), int(hour)]).generate_state(1)[0])
+
+def run_hour_block(dm: DataManager, config: ExperimentConfig, day: str, hours: List[int], logger: logging.Logger) -> List[HourlyResult]:
+    results = []
+    for hour in hours:
+        seed = hour_seed(config.random_seed, day, hour)
+        set_random_seed(seed)
+        logger.debug(f"[{day} H{hour:02d}] Seed orario: {seed}")
+        result = run_hourly_simulation(dm=dm, config=config, day=day, hour=hour, logger=logger)
+        if result:
+            results.append(result)
+    return results
+
+_HOUR_WORKER: Dict[str, Any] = {}
+
+def _init_hour_worker(dm_kwargs: Dict[str, Any], config: ExperimentConfig, logger_name: str, log_path: str) -> None:
+    logger = logging.getLogger(logger_name)
+    if not logger.handlers:
+        logger.setLevel(logging.DEBUG)
+        file_handler = logging.FileHandler(log_path, mode='a', encoding='utf-8')
+        file_handler.setFormatter(logging.Formatter('%(asctime)s | %(levelname)-8s | %(message)s', datefmt='%Y-%m-%d %H:%M:%S'))
+        logger.addHandler(file_handler)
+    _HOUR_WORKER.update(dm=DataManager(**dm_kwargs), config=config, logger=logger)
+
+def _run_hour_block_worker(day: str, hours: List[int]) -> List[HourlyResult]:
+    return run_hour_block(_HOUR_WORKER["dm"], _HOUR_WORKER["config"], day, hours, _HOUR_WORKER["logger"])
+
+def run_experiment(config: ExperimentConfig, kpi_sink: Optional[Callable[[Dict[str, Any]], None]] = None) -> None:
     experiment_id = f"imcu_fase1_{config.day}_{config.hour_start:02d}-{config.hour_end:02d}"
     day_output_dir = os.path.join(config.output_dir, f"day_{config.day}")
     os.makedirs(day_output_dir, exist_ok=True)
@@ -292,12 +370,12 @@ def run_experiment(config: ExperimentConfig) -> None:
     logger.info(f"Caricamento DataManager da: {config.raw_data_path}")
     etl_out_dir = config.dataset_out if config.dataset_out else os.path.join(config.output_dir, "dataset_processato")
     logger.info(f"Path output ETL: {etl_out_dir}")
-    dm = DataManager(raw_txt_path=config.raw_data_path, out_dir=etl_out_dir, bbox=config.bbox if config.bbox else GeoConstants.ROME_BBOX, random_seed=config.random_seed)
-    partitions_exist = os.path.exists(dm.part_dir) and len([f for f in os.listdir(dm.part_dir) if f.endswith('.csv')]) > 0
-    if not partitions_exist:
-        logger.info("Partizioni CSV non trovate, avvio ETL parsing")
+    dm_kwargs = dict(raw_txt_path=config.raw_data_path, out_dir=etl_out_dir, bbox=config.bbox if config.bbox else GeoConstants.ROME_BBOX, random_seed=config.random_seed)
+    dm = DataManager(**dm_kwargs)
+    if dm.needs_etl():
+        logger.info("Partizioni CSV assenti o file grezzo aggiornato, avvio ETL parsing")
         try:
-            metadata_etl = dm.parse_raw_to_csv(compute_total_lines=True, partition_by="day-hour", write_master_sample=True, checkpoint_interval=100_000)
+            metadata_etl = dm.parse_raw_to_csv(compute_total_lines=True, partition_by="day-hour", write_master_sample=True, checkpoint_interval=100_000, workers=config.etl_workers, incremental=True)
             logger.info(f"ETL completato: {metadata_etl['records_written']:,} record scritti")
             logger.info(f"Driver unici: {metadata_etl['unique_drivers']:,}")
             logger.info(f"Range temporale: {metadata_etl['time_range']['min_ts']} → {metadata_etl['time_range']['max_ts']}")
@@ -312,24 +390,40 @@ def run_experiment(config: ExperimentConfig) -> None:
     logger.info(f"ScientificPlotter configurato: DPI={config.plot_dpi}")
     hours_range = list(range(config.hour_start, config.hour_end))
     logger.info(f"Ore da simulare: {len(hours_range)} ({hours_range[0]}-{hours_range[-1]})")
-    all_hourly_results = []
-    for block_start in range(config.hour_start, config.hour_end, config.block_size):
-        block_end = min(block_start + config.block_size, config.hour_end)
-        block_hours = list(range(block_start, block_end))
-        for hour in block_hours:
-            result = run_hourly_simulation(dm=dm, config=config, day=config.day, hour=hour, logger=logger)
-            if result:
-                all_hourly_results.append(result)
-    if not all_hourly_results:
+    hours_all: List[int] = []
+    vS_all: List[float] = []
+    sumP_all: List[float] = []
+    u0_all: List[float] = []
+    winners_all: Dict[int, int] = {}
+    payment_chunks: List[np.ndarray] = []
+    def collect(result: HourlyResult) -> None:
+        hours_all.append(result.hour)
+        vS_all.append(result.platform_value)
+        sumP_all.append(result.total_payments)
+        u0_all.append(result.platform_utility)
+        winners_all[result.hour] = result.n_winners
+        payment_chunks.append(result.payments)
+        if kpi_sink is not None:
+            kpi_sink(hourly_kpi_row(result))
+    blocks = [list(range(block_start, min(block_start + config.block_size, config.hour_end))) for block_start in range(config.hour_start, config.hour_end, config.block_size)]
+    if config.workers > 1:
+        logger.info(f"Esecuzione parallela: {config.workers} processi, {len(blocks)} blocchi da {config.block_size} ore")
+        log_path = os.path.join(day_output_dir, f"{experiment_id}_experiment.log")
+        with ProcessPoolExecutor(max_workers=config.workers, initializer=_init_hour_worker, initargs=(dm_kwargs, config, logger.name, log_path)) as executor:
+            futures = [executor.submit(_run_hour_block_worker, config.day, block_hours) for block_hours in blocks]
+            for future in futures:
+                for result in future.result():
+                    collect(result)
+    else:
+        logger.info(f"Esecuzione sequenziale con seed orari derivati da {config.random_seed}")
+        for block_hours in blocks:
+            for result in run_hour_block(dm, config, config.day, block_hours, logger):
+                collect(result)
+    if not hours_all:
         logger.error("Nessun risultato orario disponibile")
         return
     logger.info("Generazione aggregati giornalieri")
-    hours_all = [r["hour"] for r in all_hourly_results]
-    vS_all = [r["platform_value"] for r in all_hourly_results]
-    sumP_all = [r["total_payments"] for r in all_hourly_results]
-    u0_all = [r["platform_utility"] for r in all_hourly_results]
-    winners_all = {r["hour"]: r["n_winners"] for r in all_hourly_results}
-    all_payments = [p for r in all_hourly_results for p in r["payments_list"]]
+    all_payments = np.concatenate(payment_chunks).tolist()
     csv_hourly = "hour,vS,sumP,u0,winners\n"
     for i, h in enumerate(hours_all):
         csv_hourly += f"{h},{vS_all[i]},{sumP_all[i]},{u0_all[i]},{winners_all.get(h, 0)}\n"
@@ -373,10 +467,18 @@ def main():
     parser.add_argument("--dpi", type=int, default=300, help="DPI figure")
     parser.add_argument("--out", default="experiments_fase1", help="Directory output")
     parser.add_argument("--seed", type=int, default=42, help="Seed RNG")
-    parser.add_argument("--save_raw_logs", action="store_true", help="Salva log grezzi JSON/CSV")
+    parser.add_argument("--save_raw_logs", action="store_true", help="Salva su disco gli oggetti orari completi (utenti, task, vincitori, proprietà)")
     parser.add_argument("--no_verify", action="store_true", help="Disabilita verifica proprietà IMCU")
+    parser.add_argument("--fast_verify", action="store_true", help="Verifica proprietà IMCU rapida (replay della traccia di selezione, senza clonare utenti)")
+    parser.add_argument("--verify_workers", type=int, default=0, help="Processi paralleli per la verifica delle proprietà dei vincitori (0 = sequenziale)")
+    parser.add_argument("--lazy_greedy", action="store_true", help="Selezione lazy-greedy (CELF), stessi vincitori della greedy standard")
+    parser.add_argument("--incremental_payments", action="store_true", help="Pagamenti critici incrementali a partire dalla traccia di selezione")
+    parser.add_argument("--compiled_coverage", action="store_true", help="Valori marginali su modello di copertura NumPy compilato")
+    parser.add_argument("--etl_workers", type=int, default=0, help="Processi paralleli per ETL (0 = sequenziale)")
+    parser.add_argument("--workers", type=int, default=0, help="Processi paralleli per le ore (0 o 1 = sequenziale); ogni ora usa un seed derivato da seed, giorno e ora, quindi i risultati non dipendono dal numero di processi")
+    parser.add_argument("--validation", choices=VALIDATION_LEVELS, default="full", help="Validazione utenti nell'asta: full (ogni costruzione), hourly (una volta per snapshot), off")
     args = parser.parse_args()
-    config = ExperimentConfig(raw_data_path=args.raw, day=args.day, hour_start=args.start, hour_end=args.end, block_size=args.block, cell_size_m=args.cell, task_radius_m=args.radius, bbox=None, max_users=args.max_users, cost_params=(args.cost_min, args.cost_max), value_mode=args.value_mode, norm_mode=args.norm, percentile_low=args.p_low, percentile_high=args.p_high, plot_dpi=args.dpi, output_dir=args.out, random_seed=args.seed, save_raw_logs=args.save_raw_logs, verify_properties=not args.no_verify, dataset_out=args.dataset_out)
+    config = ExperimentConfig(raw_data_path=args.raw, day=args.day, hour_start=args.start, hour_end=args.end, block_size=args.block, cell_size_m=args.cell, task_radius_m=args.radius, bbox=None, max_users=args.max_users, cost_params=(args.cost_min, args.cost_max), value_mode=args.value_mode, norm_mode=args.norm, percentile_low=args.p_low, percentile_high=args.p_high, plot_dpi=args.dpi, output_dir=args.out, random_seed=args.seed, save_raw_logs=args.save_raw_logs, verify_properties=not args.no_verify, dataset_out=args.dataset_out, etl_workers=args.etl_workers, workers=args.workers, validation_level=args.validation, fast_verification=args.fast_verify, lazy_greedy=args.lazy_greedy, incremental_payments=args.incremental_payments, compiled_coverage=args.compiled_coverage, verification_workers=args.verify_workers)
     try:
         run_experiment(config)
         sys.exit(0)
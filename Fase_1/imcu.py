@@ -5,14 +5,18 @@ _current_dir = os.path.dirname(os.path.abspath(__file__))
 if _current_dir not in sys.path:
     sys.path.insert(0, _current_dir)
 
-from typing import List, Set, Dict, Tuple, Optional, Any
+from typing import Callable, List, Set, Dict, Tuple, Optional, Any
 from dataclasses import dataclass, field
 import time
 import math
 import json
 import csv
 import random
+import heapq
+import hashlib
 import logging
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
 logger = logging.getLogger(__name__)
 from classes import User, Task
 
@@ -37,6 +41,13 @@ class PaymentStepLog:
     bj_sequence: List[float] = field(default_factory=list)
     cand_sequence: List[float] = field(default_factory=list)
 
+@dataclass
+class SelectionTraceStep:
+    chosen_user_id: int
+    chosen_mv: float
+    chosen_gain: float
+    bounds: List[Tuple[float, int, int, float]]
+
 @dataclass
 class IMCUDiagnostics:
     winners_count: int
@@ -87,22 +98,69 @@ def _validate_user(user: User) -> None:
     for t in user.tasks:
         _validate_task(t)
 
+def _as_list(items: Any) -> Any:
+    return items.to_list() if hasattr(items, "to_list") else items
+
 def _validate_users(users: Optional[List[User]]) -> List[User]:
     if users is None:
         raise TypeError("Parametro 'users' è None")
+    users = _as_list(users)
     if not isinstance(users, list):
         raise TypeError(f"'users' deve essere lista, ricevuto: {type(users)}")
     for u in users:
         _validate_user(u)
     return sorted(users, key=lambda u: u.id)
 
+VALIDATION_LEVELS: Tuple[str, ...] = ("full", "hourly", "off")
+VALIDATION_CACHE_SIZE: int = 256
+_VALIDATED_SNAPSHOTS: Dict[Tuple[str, str], None] = {}
+
+_FINGERPRINT_FIELDS: Dict[type, Tuple[str, ...]] = {}
+
+def _fingerprint_fields(cls: type) -> Tuple[str, ...]:
+    fields = _FINGERPRINT_FIELDS.get(cls)
+    if fields is None:
+        slots = [(klass.__slots__,) if isinstance(klass.__slots__, str) else klass.__slots__ for klass in reversed(cls.__mro__) if "__slots__" in vars(klass)]
+        fields = _FINGERPRINT_FIELDS[cls] = tuple(name for name in dict.fromkeys(name for names in slots for name in names) if not name.startswith("_") and name != "tasks")
+    return fields
+
+def _user_state(u: User) -> Tuple[Any, ...]:
+    state = [getattr(u, name, None) for name in _fingerprint_fields(type(u))]
+    if hasattr(u, "__dict__"):
+        state.extend(sorted((name, value) for name, value in vars(u).items() if not name.startswith("_") and name != "tasks"))
+    return tuple(state)
+
+def users_fingerprint(users: List[User]) -> str:
+    snapshot = tuple((type(u).__module__, type(u).__qualname__, _user_state(u), tuple((type(t).__qualname__, t.id, t.value) for t in u.tasks)) for u in users)
+    return hashlib.sha256(repr(snapshot).encode("utf-8")).hexdigest()
+
+def validate_users_cached(users: Optional[List[User]], validator: Callable[[Optional[List[User]]], List[User]], level: str = "full") -> List[User]:
+    if level not in VALIDATION_LEVELS:
+        raise ValueError(f"Livello di validazione non valido: '{level}'. Valori ammessi: {', '.join(VALIDATION_LEVELS)}")
+    if level == "full" or users is None:
+        return validator(users)
+    users = _as_list(users)
+    if level == "off":
+        return sorted(users, key=lambda u: u.id)
+    try:
+        key = (validator.__qualname__, users_fingerprint(users))
+    except (AttributeError, TypeError):
+        return validator(users)
+    if key in _VALIDATED_SNAPSHOTS:
+        return sorted(users, key=lambda u: u.id)
+    validated = validator(users)
+    _VALIDATED_SNAPSHOTS[key] = None
+    if len(_VALIDATED_SNAPSHOTS) > VALIDATION_CACHE_SIZE:
+        del _VALIDATED_SNAPSHOTS[next(iter(_VALIDATED_SNAPSHOTS))]
+    return validated
+
 def _unique_tasks(tasks: List[Task]) -> List[Task]:
     return list({t.id: t for t in tasks}.values())
 
-def total_value_of_users(users: List[User]) -> float:
+def total_value_of_users(users: List[User], task_lists: Optional[Dict[int, List[Task]]] = None) -> float:
     covered: Dict[int, Task] = {}
     for u in users:
-        for t in _unique_tasks(u.tasks):
+        for t in _unique_tasks(u.tasks if task_lists is None else task_lists[u.id]):
             covered.setdefault(t.id, t)
     return float(sum(float(t.value) for t in covered.values()))
 
@@ -150,6 +208,90 @@ def empirical_submodularity_check(users: List[User], trials: int = 100, seed: in
                 examples.append({"user_id": int(i_id), "S_size": int(len(S_ids)), "T_size": int(len(T_ids)), "delta_v_S": float(dvS), "delta_v_T": float(dvT)})
     return {"violations": int(violations), "trials": int(trials), "examples": examples}
 
+class CoverageMask:
+    __slots__ = ("model", "flags", "mask", "count", "extra")
+
+    def __init__(self, model: CoverageModel):
+        self.model = model
+        self.flags = bytearray(model.n_tasks + 1)
+        self.mask = np.frombuffer(self.flags, dtype=np.bool_)
+        self.count = 0
+        self.extra: Set[int] = set()
+
+    def __len__(self) -> int:
+        return self.count + len(self.extra)
+
+    def __contains__(self, task_id: int) -> bool:
+        col = self.model.task_index.get(task_id)
+        if col is None:
+            return task_id in self.extra
+        return bool(self.flags[col])
+
+    def add(self, task_id: int) -> None:
+        col = self.model.task_index.get(task_id)
+        if col is None:
+            self.extra.add(task_id)
+        elif not self.flags[col]:
+            self.flags[col] = 1
+            self.count += 1
+
+    def cover_row(self, row: int) -> None:
+        cols = self.model.cols[row, :self.model.lengths[row]]
+        self.count += int(np.count_nonzero(~self.mask[cols]))
+        self.mask[cols] = True
+
+class CoverageModel:
+    VECTOR_MIN_TASKS: int = 64
+
+    def __init__(self, users: List[User], task_lists: Optional[Dict[int, List[Task]]] = None):
+        self.task_index: Dict[int, int] = {}
+        self.user_rows: Dict[int, int] = {}
+        rows_cols: List[List[int]] = []
+        rows_vals: List[List[float]] = []
+        for row, u in enumerate(users):
+            self.user_rows[u.id] = row
+            cols: List[int] = []
+            vals: List[float] = []
+            seen: Set[int] = set()
+            for t in (u.tasks if task_lists is None else task_lists[u.id]):
+                if t.id in seen:
+                    continue
+                seen.add(t.id)
+                cols.append(self.task_index.setdefault(t.id, len(self.task_index)))
+                vals.append(float(t.value))
+            rows_cols.append(cols)
+            rows_vals.append(vals)
+        self.n_tasks = len(self.task_index)
+        self.row_items: List[List[Tuple[int, float]]] = [list(zip(cols, vals)) for cols, vals in zip(rows_cols, rows_vals)]
+        width = max([1] + [len(c) for c in rows_cols])
+        self.lengths = np.array([len(c) for c in rows_cols], dtype=np.intp)
+        self.cols = np.full((len(users), width), self.n_tasks, dtype=np.intp)
+        self.vals = np.zeros((len(users), width), dtype=np.float64)
+        for row, (cols, vals) in enumerate(zip(rows_cols, rows_vals)):
+            self.cols[row, :len(cols)] = cols
+            self.vals[row, :len(vals)] = vals
+
+    def new_mask(self) -> CoverageMask:
+        return CoverageMask(self)
+
+    def marginal_value(self, row: int, covered: CoverageMask) -> float:
+        n = self.lengths[row]
+        if n < self.VECTOR_MIN_TASKS:
+            flags = covered.flags
+            mv = 0.0
+            for col, val in self.row_items[row]:
+                if not flags[col]:
+                    mv += val
+            return mv
+        cols = self.cols[row, :n]
+        return float(np.cumsum(np.where(covered.mask[cols], 0.0, self.vals[row, :n]))[-1])
+
+    def marginal_values(self, rows: np.ndarray, covered: CoverageMask) -> np.ndarray:
+        if len(rows) == 0:
+            return np.zeros(0, dtype=np.float64)
+        uncovered_vals = np.where(covered.mask[self.cols[rows]], 0.0, self.vals[rows])
+        return np.cumsum(uncovered_vals, axis=1)[:, -1]
+
 class IMCUAuction:
     EPSILON: float = 1e-9
     SUBMODULARITY_TEST_TRIALS: int = 100
@@ -158,24 +300,53 @@ class IMCUAuction:
     MONOTONICITY_TEST_DELTA_MIN: float = 1e-6    
     TRUTHFULNESS_TEST_SAMPLES: int = 10
     
-    def __init__(self, users: List[User], debug: bool = True, verify_properties: bool = True):
-        self._test_rng = random.Random(self.SUBMODULARITY_TEST_SEED)
-        self.users: List[User] = _validate_users(users)
+    def __init__(self, users: List[User], debug: bool = True, verify_properties: bool = True, lazy_greedy: bool = False, incremental_payments: bool = False, compiled_coverage: bool = False, fast_verification: bool = False, verification_workers: int = 0, validation: str = "full", task_lists: Optional[Dict[int, List[Task]]] = None):
+        self.users: List[User] = self._validated_users(users, validation)
+        self.validation = validation
         self.debug = debug
         self.verify_properties = verify_properties
+        self.lazy_greedy = lazy_greedy
+        self.incremental_payments = incremental_payments
+        self.compiled_coverage = compiled_coverage
+        self._task_lists = task_lists
+        self._coverage: Optional[CoverageModel] = CoverageModel(self.users, task_lists) if compiled_coverage else None
+        self.fast_verification = fast_verification
+        if isinstance(verification_workers, bool) or not isinstance(verification_workers, int) or verification_workers < 0:
+            raise ValueError(f"verification_workers deve essere un intero >= 0, ricevuto: {verification_workers!r}")
+        self.verification_workers = verification_workers
+        self._user_index: Dict[int, int] = {u.id: i for i, u in enumerate(self.users)}
+        self._bid_vector: Tuple[float, ...] = tuple(float(u.bid) for u in self.users)
+        self._payment_thresholds: Dict[int, float] = {}
         self._mv_calls_selection = 0
         self._mv_calls_payment = 0
         self._logs_selection: List[SelectionStepLog] = []
         self._logs_payment: List[PaymentStepLog] = []
+        self._selection_trace: List[SelectionTraceStep] = []
     
+    def _validated_users(self, users: List[User], validation: str) -> List[User]:
+        return validate_users_cached(users, _validate_users, validation)
+
+    def _nested_validation(self) -> str:
+        return "full" if self.validation == "full" else "off"
+
+    def _tasks_of(self, user: User) -> List[Task]:
+        return user.tasks if self._task_lists is None else self._task_lists[user.id]
+
+    def _new_covered(self) -> Any:
+        return self._coverage.new_mask() if self._coverage is not None else set()
+
     def _marginal_value(self, user: User, covered_task_ids: Set[int], count_for: str) -> float:
         if count_for == "sel":
             self._mv_calls_selection += 1
         elif count_for == "pay":
             self._mv_calls_payment += 1
+        if self._coverage is not None and isinstance(covered_task_ids, CoverageMask):
+            row = self._coverage.user_rows.get(user.id)
+            if row is not None:
+                return self._coverage.marginal_value(row, covered_task_ids)
         mv = 0.0
         seen = set()
-        for t in user.tasks:
+        for t in self._tasks_of(user):
             if t.id in seen:
                 continue
             seen.add(t.id)
@@ -183,32 +354,55 @@ class IMCUAuction:
                 mv += float(t.value)
         return float(mv)
     
+    def _marginal_values(self, users: List[User], covered_task_ids: Set[int], count_for: str) -> List[float]:
+        if self._coverage is not None and isinstance(covered_task_ids, CoverageMask):
+            rows = [self._coverage.user_rows.get(u.id) for u in users]
+            if None not in rows:
+                if count_for == "sel":
+                    self._mv_calls_selection += len(users)
+                elif count_for == "pay":
+                    self._mv_calls_payment += len(users)
+                return self._coverage.marginal_values(np.asarray(rows, dtype=np.intp), covered_task_ids).tolist()
+        return [self._marginal_value(u, covered_task_ids, count_for) for u in users]
+
     def _add_user_tasks_to_covered(self, user: User, covered_task_ids: Set[int]) -> None:
-        for t in _unique_tasks(user.tasks):
+        if self._coverage is not None and isinstance(covered_task_ids, CoverageMask):
+            row = self._coverage.user_rows.get(user.id)
+            if row is not None:
+                covered_task_ids.cover_row(row)
+                return
+        for t in _unique_tasks(self._tasks_of(user)):
             covered_task_ids.add(t.id)
     
     def _selection_phase(self) -> List[User]:
+        if self.lazy_greedy:
+            return self._selection_phase_lazy()
         winners: List[User] = []
         remaining: List[User] = list(self.users)
-        covered: Set[int] = set()
+        covered = self._new_covered()
+        self._selection_trace = []
         iteration = 0
         while True:
             iteration += 1
             best_candidate = None
             best_gain = float("-inf")
+            best_mv = 0.0
             candidates_log = []
-            for u in remaining:
-                mv = self._marginal_value(u, covered, count_for="sel")
+            bounds: List[Tuple[float, int, int, float]] = []
+            for u, mv in zip(remaining, self._marginal_values(remaining, covered, count_for="sel")):
                 gain = mv - float(u.bid)
                 candidates_log.append({"id": float(u.id), "mv": float(mv), "bid": float(u.bid), "gain": float(gain)})
+                bounds.append((-gain, u.id, len(winners), mv))
                 should_update = ((gain > best_gain) or (best_candidate is None) or (math.isclose(gain, best_gain, rel_tol=0, abs_tol=self.EPSILON) and u.id < best_candidate.id))
                 if should_update:
                     best_candidate = u
                     best_gain = gain
+                    best_mv = mv
             if best_candidate is None:
                 break
             covered_before = len(covered)
             if best_gain > self.EPSILON:
+                self._selection_trace.append(SelectionTraceStep(chosen_user_id=best_candidate.id, chosen_mv=best_mv, chosen_gain=best_gain, bounds=bounds))
                 winners.append(best_candidate)
                 remaining.remove(best_candidate)
                 self._add_user_tasks_to_covered(best_candidate, covered)
@@ -223,67 +417,241 @@ class IMCUAuction:
             logger.info(f"  [Selezione] Completata in {iteration-1} iterazioni. Input: {len(self.users)} utenti. Output: {len(winners)} vincitori, {len(covered)} task coperti")
         return winners
     
+    def _selection_phase_lazy(self) -> List[User]:
+        winners: List[User] = []
+        covered = self._new_covered()
+        users_by_id: Dict[int, User] = {u.id: u for u in self.users}
+        heap: List[Tuple[float, int, int, float]] = [(float("-inf"), u.id, -1, 0.0) for u in self.users]
+        heapq.heapify(heap)
+        self._selection_trace = []
+        iteration = 0
+        while True:
+            iteration += 1
+            best_candidate = None
+            best_gain = float("-inf")
+            best_mv = 0.0
+            candidates_log = []
+            while heap:
+                neg_gain, uid, evaluated_at, mv_at = heap[0]
+                if evaluated_at == len(winners):
+                    best_candidate = users_by_id[uid]
+                    best_gain = -neg_gain
+                    best_mv = mv_at
+                    break
+                u = users_by_id[uid]
+                mv = self._marginal_value(u, covered, count_for="sel")
+                gain = mv - float(u.bid)
+                if self.debug:
+                    candidates_log.append({"id": float(u.id), "mv": float(mv), "bid": float(u.bid), "gain": float(gain)})
+                heapq.heapreplace(heap, (-gain, uid, len(winners), mv))
+            if best_candidate is None:
+                break
+            covered_before = len(covered)
+            if best_gain > self.EPSILON:
+                self._selection_trace.append(SelectionTraceStep(chosen_user_id=best_candidate.id, chosen_mv=best_mv, chosen_gain=best_gain, bounds=list(heap)))
+                heapq.heappop(heap)
+                winners.append(best_candidate)
+                self._add_user_tasks_to_covered(best_candidate, covered)
+                covered_after = len(covered)
+                if self.debug:
+                    self._logs_selection.append(SelectionStepLog(iteration=iteration, covered_count_before=covered_before, candidates=candidates_log, chosen_user_id=best_candidate.id, chosen_gain=float(best_gain), covered_count_after=covered_after))
+            else:
+                if self.debug:
+                    self._logs_selection.append(SelectionStepLog(iteration=iteration, covered_count_before=covered_before, candidates=candidates_log, chosen_user_id=None, chosen_gain=float(best_gain), covered_count_after=covered_before))
+                break
+        if self.debug:
+            logger.info(f"  [Selezione lazy] Completata in {iteration-1} iterazioni. Input: {len(self.users)} utenti. Output: {len(winners)} vincitori, {len(covered)} task coperti. MV Calls: {self._mv_calls_selection}")
+        return winners
+
     def _payment_phase(self, winners: List[User]) -> Dict[int, float]:
         payments: Dict[int, float] = {}
         n_winners = len(winners)
         mv_calls_start = self._mv_calls_payment 
         if self.debug:
             logger.info(f"  [Pagamento] Avvio calcolo per {n_winners} vincitori")
+        trace_positions: Dict[int, int] = {step.chosen_user_id: k for k, step in enumerate(self._selection_trace)} if self.incremental_payments else {}
         for w in winners:
-            others: List[User] = [u for u in self.users if u.id != w.id]
-            critical = float(w.bid)
-            temp_covered: Set[int] = set()
-            prefix_T: List[User] = []
-            steps_log: List[Dict[str, float]] = []
-            k_last = 0
-            vi_sequence: List[float] = []
-            vj_sequence: List[float] = []
-            bj_sequence: List[float] = []
-            cand_sequence: List[float] = []
-            while True:
+            if w.id in trace_positions:
+                payments[w.id] = self._critical_payment_incremental(w, trace_positions[w.id])
+            else:
+                payments[w.id] = self._critical_payment_full(w)
+        mv_calls_end = self._mv_calls_payment
+        total_payment = sum(payments.values())
+        avg_payment = total_payment / n_winners if n_winners > 0 else 0
+        if self.debug:
+            logger.info(f"  [Pagamento] Completato. Totale: {total_payment:.2f} euro (media: {avg_payment:.2f} euro/vincitore). MV Calls: {mv_calls_end - mv_calls_start}")
+        return payments
+
+    def _critical_payment_full(self, w: User) -> float:
+        others: List[User] = [u for u in self.users if u.id != w.id]
+        critical = float(w.bid)
+        threshold = float("-inf")
+        temp_covered = self._new_covered()
+        prefix_ids: Set[int] = set()
+        steps_log: List[Dict[str, float]] = []
+        k_last = 0
+        vi_sequence: List[float] = []
+        vj_sequence: List[float] = []
+        bj_sequence: List[float] = []
+        cand_sequence: List[float] = []
+        while True:
+            best_competitor = None
+            best_competitor_gain = float("-inf")
+            candidates = [c for c in others if c.id not in prefix_ids]
+            for c, mv_c in zip(candidates, self._marginal_values(candidates, temp_covered, count_for="pay")):
+                gain_c = mv_c - float(c.bid)
+                should_update = ((gain_c > best_competitor_gain) or (best_competitor is None) or (math.isclose(gain_c, best_competitor_gain, rel_tol=0, abs_tol=self.EPSILON) and c.id < best_competitor.id))
+                if should_update:
+                    best_competitor = c
+                    best_competitor_gain = gain_c
+            if best_competitor is None or best_competitor_gain <= self.EPSILON:
+                v_i_after = self._marginal_value(w, temp_covered, count_for="pay")
+                critical = max(critical, v_i_after)
+                threshold = max(threshold, v_i_after)
+                if self.debug:
+                    self._logs_payment.append(PaymentStepLog(winner_id=w.id, steps=steps_log, after_threshold=float(v_i_after), final_payment=float(critical), k_last=int(k_last), vi_sequence=vi_sequence, vj_sequence=vj_sequence, bj_sequence=bj_sequence, cand_sequence=cand_sequence))
+                break
+            v_i_T = self._marginal_value(w, temp_covered, count_for="pay")
+            v_j_T = self._marginal_value(best_competitor, temp_covered, count_for="pay")
+            cand_j = min(v_i_T - v_j_T + float(best_competitor.bid), v_i_T)
+            critical = max(critical, cand_j)
+            threshold = max(threshold, cand_j)
+            if best_competitor_gain > self.EPSILON:
+                k_last = len(prefix_ids) + 1
+            if self.debug:
+                steps_log.append({"pos": float(len(prefix_ids) + 1), "v_i_T": float(v_i_T), "comp_id": float(best_competitor.id), "v_j_T": float(v_j_T), "b_j": float(best_competitor.bid), "cand_j": float(cand_j), "critical_so_far": float(critical)})
+            vi_sequence.append(float(v_i_T))
+            vj_sequence.append(float(v_j_T))
+            bj_sequence.append(float(best_competitor.bid))
+            cand_sequence.append(float(cand_j))
+            prefix_ids.add(best_competitor.id)
+            self._add_user_tasks_to_covered(best_competitor, temp_covered)
+        self._payment_thresholds[w.id] = float(threshold)
+        return float(critical)
+
+    def _critical_payment_incremental(self, w: User, position: int) -> float:
+        users_by_id: Dict[int, User] = {u.id: u for u in self.users}
+        critical = float(w.bid)
+        threshold = float("-inf")
+        temp_covered = self._new_covered()
+        steps_log: List[Dict[str, float]] = []
+        k_last = 0
+        vi_sequence: List[float] = []
+        vj_sequence: List[float] = []
+        bj_sequence: List[float] = []
+        cand_sequence: List[float] = []
+        steps_done = 0
+        heap: List[Tuple[float, int, int, float]] = []
+        while True:
+            if steps_done < position:
+                step = self._selection_trace[steps_done]
+                best_competitor = users_by_id[step.chosen_user_id]
+                best_competitor_gain = step.chosen_gain
+                v_j_T = step.chosen_mv
+            else:
+                if steps_done == position:
+                    heap = [entry for entry in self._selection_trace[position].bounds if entry[1] != w.id]
+                    heapq.heapify(heap)
                 best_competitor = None
                 best_competitor_gain = float("-inf")
-                for c in others:
-                    if c in prefix_T:
-                        continue
+                while heap:
+                    neg_gain, uid, evaluated_at, mv_at = heap[0]
+                    if evaluated_at == steps_done:
+                        best_competitor = users_by_id[uid]
+                        best_competitor_gain = -neg_gain
+                        break
+                    c = users_by_id[uid]
                     mv_c = self._marginal_value(c, temp_covered, count_for="pay")
-                    gain_c = mv_c - float(c.bid)
-                    should_update = ((gain_c > best_competitor_gain) or (best_competitor is None) or (math.isclose(gain_c, best_competitor_gain, rel_tol=0, abs_tol=self.EPSILON) and c.id < best_competitor.id))
-                    if should_update:
-                        best_competitor = c
-                        best_competitor_gain = gain_c
+                    heapq.heapreplace(heap, (-(mv_c - float(c.bid)), uid, steps_done, mv_c))
                 if best_competitor is None or best_competitor_gain <= self.EPSILON:
                     v_i_after = self._marginal_value(w, temp_covered, count_for="pay")
                     critical = max(critical, v_i_after)
-                    after_threshold = float(v_i_after)
-                    final_payment = float(critical)
+                    threshold = max(threshold, v_i_after)
                     if self.debug:
-                        self._logs_payment.append(PaymentStepLog(winner_id=w.id, steps=steps_log, after_threshold=after_threshold, final_payment=final_payment, k_last=int(k_last), vi_sequence=vi_sequence, vj_sequence=vj_sequence, bj_sequence=bj_sequence, cand_sequence=cand_sequence))
+                        self._logs_payment.append(PaymentStepLog(winner_id=w.id, steps=steps_log, after_threshold=float(v_i_after), final_payment=float(critical), k_last=int(k_last), vi_sequence=vi_sequence, vj_sequence=vj_sequence, bj_sequence=bj_sequence, cand_sequence=cand_sequence))
                     break
-                v_i_T = self._marginal_value(w, temp_covered, count_for="pay")
-                v_j_T = self._marginal_value(best_competitor, temp_covered, count_for="pay")
-                cand_j = min(v_i_T - v_j_T + float(best_competitor.bid), v_i_T)
-                critical = max(critical, cand_j)
-                if best_competitor_gain > self.EPSILON:
-                    k_last = len(prefix_T) + 1
-                if self.debug:
-                    steps_log.append({"pos": float(len(prefix_T) + 1), "v_i_T": float(v_i_T), "comp_id": float(best_competitor.id), "v_j_T": float(v_j_T), "b_j": float(best_competitor.bid), "cand_j": float(cand_j), "critical_so_far": float(critical)})
-                vi_sequence.append(float(v_i_T))
-                vj_sequence.append(float(v_j_T))
-                bj_sequence.append(float(best_competitor.bid))
-                cand_sequence.append(float(cand_j))
-                prefix_T.append(best_competitor)
-                self._add_user_tasks_to_covered(best_competitor, temp_covered)
-            payments[w.id] = float(critical)
-        mv_calls_end = self._mv_calls_payment
-        total_payment = sum(payments.values())
-        avg_payment = total_payment / n_winners if n_winners > 0 else 0
-        if self.debug:
-            logger.info(f"  [Pagamento] Completato. Totale: {total_payment:.2f} euro (media: {avg_payment:.2f} euro/vincitore). MV Calls: {mv_calls_end - mv_calls_start}")
-        return payments
+                heapq.heappop(heap)
+                v_j_T = mv_at
+            v_i_T = self._marginal_value(w, temp_covered, count_for="pay")
+            cand_j = min(v_i_T - v_j_T + float(best_competitor.bid), v_i_T)
+            critical = max(critical, cand_j)
+            threshold = max(threshold, cand_j)
+            if best_competitor_gain > self.EPSILON:
+                k_last = steps_done + 1
+            if self.debug:
+                steps_log.append({"pos": float(steps_done + 1), "v_i_T": float(v_i_T), "comp_id": float(best_competitor.id), "v_j_T": float(v_j_T), "b_j": float(best_competitor.bid), "cand_j": float(cand_j), "critical_so_far": float(critical)})
+            vi_sequence.append(float(v_i_T))
+            vj_sequence.append(float(v_j_T))
+            bj_sequence.append(float(best_competitor.bid))
+            cand_sequence.append(float(cand_j))
+            steps_done += 1
+            self._add_user_tasks_to_covered(best_competitor, temp_covered)
+        self._payment_thresholds[w.id] = float(threshold)
+        return float(critical)
     
+    def _selection_wins_with_bid(self, user_id: int, new_bid: float) -> bool:
+        target = self.users[self._user_index[user_id]]
+        target_bid = float(max(0.0, new_bid))
+        users_by_id: Dict[int, User] = {u.id: u for u in self.users}
+        covered = self._new_covered()
+        trace = self._selection_trace
+        position = next((k for k, step in enumerate(trace) if step.chosen_user_id == user_id), len(trace))
+        for step in trace[:position]:
+            gain_t = self._marginal_value(target, covered, count_for="ver") - target_bid
+            if gain_t <= self.EPSILON:
+                return False
+            if gain_t > step.chosen_gain or (gain_t == step.chosen_gain and user_id < step.chosen_user_id):
+                return True
+            self._add_user_tasks_to_covered(users_by_id[step.chosen_user_id], covered)
+        if position < len(trace):
+            heap = [entry for entry in trace[position].bounds if entry[1] != user_id]
+        else:
+            chosen_ids = {step.chosen_user_id for step in trace}
+            heap = [(float("-inf"), u.id, -1, 0.0) for u in self.users if u.id != user_id and u.id not in chosen_ids]
+        heapq.heapify(heap)
+        steps_done = position
+        while True:
+            gain_t = self._marginal_value(target, covered, count_for="ver") - target_bid
+            if gain_t <= self.EPSILON:
+                return False
+            best_id: Optional[int] = None
+            best_gain = float("-inf")
+            while heap:
+                neg_gain, uid, evaluated_at, _ = heap[0]
+                if evaluated_at == steps_done:
+                    best_id = uid
+                    best_gain = -neg_gain
+                    break
+                mv_c = self._marginal_value(users_by_id[uid], covered, count_for="ver")
+                heapq.heapreplace(heap, (-(mv_c - self._bid_vector[self._user_index[uid]]), uid, steps_done, mv_c))
+            if best_id is None or gain_t > best_gain or (gain_t == best_gain and user_id < best_id):
+                return True
+            heapq.heappop(heap)
+            self._add_user_tasks_to_covered(users_by_id[best_id], covered)
+            steps_done += 1
+
+    def _wins_with_bid(self, user_id: int, new_bid: float) -> bool:
+        if self.fast_verification:
+            return self._selection_wins_with_bid(user_id, new_bid)
+        mod_users = self._clone_users_with_modified_bid(user_id, new_bid=new_bid)
+        return user_id in self._selection_only(mod_users)
+
+    def _payment_with_bid(self, user_id: int, new_bid: float) -> Optional[float]:
+        if self.fast_verification and user_id in self._payment_thresholds:
+            if not self._selection_wins_with_bid(user_id, new_bid):
+                return None
+            return max(float(max(0.0, new_bid)), self._payment_thresholds[user_id])
+        mod_users = self._clone_users_with_modified_bid(user_id, new_bid=new_bid)
+        temp_auction = IMCUAuction(mod_users, debug=False, verify_properties=False, lazy_greedy=self.lazy_greedy, compiled_coverage=self.compiled_coverage, validation=self._nested_validation())
+        fake_winners_ids = temp_auction._selection_only(mod_users)
+        if user_id not in fake_winners_ids:
+            return None
+        fake_winners_obj = [u for u in mod_users if u.id in fake_winners_ids]
+        fake_payments = temp_auction._payment_phase(fake_winners_obj)
+        return fake_payments[user_id]
+
     def _selection_only(self, users: List[User]) -> Set[int]:
-        temp_auction = IMCUAuction(users, debug=False, verify_properties=False)
+        temp_auction = IMCUAuction(users, debug=False, verify_properties=False, lazy_greedy=self.lazy_greedy, compiled_coverage=self.compiled_coverage, validation=self._nested_validation())
         winners = temp_auction._selection_phase()
         return {u.id for u in winners}
     
@@ -291,12 +659,48 @@ class IMCUAuction:
         cloned: List[User] = []
         for u in self.users:
             nu = User(u.id, u.position[1], u.position[0], cost_per_km=u.cost_per_km)
-            nu.tasks = list(u.tasks)
+            nu.tasks = list(self._tasks_of(u))
             nu.cost = float(u.cost)
             nu.bid = float(max(0.0, new_bid)) if u.id == user_id else float(u.bid)
             cloned.append(nu)
         return cloned
     
+    def _check_winner_properties(self, w: User, p_i: float, rng: random.Random) -> Dict[str, Dict[str, Any]]:
+        delta = max(self.MONOTONICITY_TEST_DELTA_MIN, self.MONOTONICITY_TEST_DELTA_FACTOR * max(1.0, float(w.bid)))
+        reduced_bid = max(0.0, float(w.bid) - delta)
+        still_wins = self._wins_with_bid(w.id, reduced_bid)
+        mono = {"original_bid": float(w.bid), "reduced_bid": float(reduced_bid), "still_wins": bool(still_wins)}
+        delta = max(self.MONOTONICITY_TEST_DELTA_MIN, self.MONOTONICITY_TEST_DELTA_FACTOR * max(1.0, p_i))
+        above_bid = p_i + delta
+        wins_above = self._wins_with_bid(w.id, above_bid)
+        below_bid = max(0.0, p_i - delta)
+        wins_below = self._wins_with_bid(w.id, below_bid)
+        crit = {"payment": float(p_i), "bid_above": float(above_bid), "wins_above": bool(wins_above), "bid_below": float(below_bid), "wins_below": bool(wins_below)}
+        true_cost = float(w.cost)
+        true_utility = max(0.0, float(p_i - true_cost))
+        fake_utilities = []
+        violations = []
+        for _ in range(self.TRUTHFULNESS_TEST_SAMPLES):
+            multiplier = rng.uniform(0.5, 2.0)
+            if math.isclose(multiplier, 1.0):
+                continue 
+            fake_bid = true_cost * multiplier
+            fake_payment = self._payment_with_bid(w.id, fake_bid)
+            fake_utility = float(fake_payment - true_cost) if fake_payment is not None else 0.0
+            fake_utilities.append({"bid_multiplier": float(multiplier), "fake_bid": float(fake_bid), "utility": float(fake_utility)})
+            if fake_utility > true_utility + self.EPSILON:
+                violations.append({'multiplier': multiplier, 'utility_gain': fake_utility - true_utility, 'fake_utility': fake_utility})
+        truth = {"true_utility": float(true_utility), "fake_bids_tested": len(fake_utilities), "dominating_bids_count": len(violations), "dominating_bids_examples": violations[:5]}
+        return {"Monotonicity": mono, "CriticalValue": crit, "Truthfulness": truth}
+
+    def _check_winners_parallel(self, winners: List[User], payments: Dict[int, float]) -> Dict[int, Dict[str, Dict[str, Any]]]:
+        items = [(w.id, float(payments[w.id])) for w in winners]
+        if self.verification_workers <= 1 or len(items) <= 1:
+            return {w.id: self._check_winner_properties(w, payments[w.id], random.Random(self.SUBMODULARITY_TEST_SEED + w.id)) for w in winners}
+        chunksize = max(1, len(items) // (4 * self.verification_workers))
+        with ProcessPoolExecutor(max_workers=self.verification_workers, initializer=_init_verification_worker, initargs=(self,)) as pool:
+            return dict(pool.map(_verify_winner_in_worker, items, chunksize=chunksize))
+
     def _check_properties(self, winners: List[User], payments: Dict[int, float]) -> Dict[str, Any]:
         report: Dict[str, Any] = {}
         ir_violations = []
@@ -311,34 +715,23 @@ class IMCUAuction:
         if vS + self.EPSILON < sumP:
             raise AssertionError(f"Violazione Profitability: v(S) = {vS:.6f} < Σp_i = {sumP:.6f}, deficit = {sumP - vS:.6f}")
         report["Profitability"] = {"passed": True, "platform_value": float(vS), "total_payments": float(sumP), "platform_utility": float(vS - sumP)}
+        per_winner = self._check_winners_parallel(winners, payments)
         mono_results = {}
         for w in winners:
-            delta = max(self.MONOTONICITY_TEST_DELTA_MIN, self.MONOTONICITY_TEST_DELTA_FACTOR * max(1.0, float(w.bid)))
-            reduced_bid = max(0.0, float(w.bid) - delta)
-            mod_users = self._clone_users_with_modified_bid(w.id, new_bid=reduced_bid)
-            new_winners = self._selection_only(mod_users)
-            still_wins = (w.id in new_winners)
-            mono_results[str(w.id)] = {"original_bid": float(w.bid), "reduced_bid": float(reduced_bid), "still_wins": bool(still_wins)}
-            if not still_wins:
-                raise AssertionError(f"Violazione Monotonicity: utente {w.id} perde dopo riduzione bid da {w.bid:.6f} a {reduced_bid:.6f}")
+            mono = per_winner[w.id]["Monotonicity"]
+            mono_results[str(w.id)] = mono
+            if not mono["still_wins"]:
+                raise AssertionError(f"Violazione Monotonicity: utente {w.id} perde dopo riduzione bid da {w.bid:.6f} a {mono['reduced_bid']:.6f}")
         report["Monotonicity"] = mono_results
         crit_results = {}
         for w in winners:
             p_i = payments[w.id]
-            delta = max(self.MONOTONICITY_TEST_DELTA_MIN, self.MONOTONICITY_TEST_DELTA_FACTOR * max(1.0, p_i))
-            above_bid = p_i + delta
-            mod_high = self._clone_users_with_modified_bid(w.id, new_bid=above_bid)
-            win_high = self._selection_only(mod_high)
-            wins_above = (w.id in win_high)
-            below_bid = max(0.0, p_i - delta)
-            mod_low = self._clone_users_with_modified_bid(w.id, new_bid=below_bid)
-            win_low = self._selection_only(mod_low)
-            wins_below = (w.id in win_low)
-            crit_results[str(w.id)] = {"payment": float(p_i), "bid_above": float(above_bid), "wins_above": bool(wins_above), "bid_below": float(below_bid), "wins_below": bool(wins_below)}
-            if wins_above:
-                raise AssertionError(f"Violazione Critical Value (sopra): utente {w.id} vince ancora con bid = {above_bid:.6f} > p_i = {p_i:.6f}")
-            if not wins_below:
-                raise AssertionError(f"Violazione Critical Value (sotto): utente {w.id} perde con bid = {below_bid:.6f} < p_i = {p_i:.6f}")
+            crit = per_winner[w.id]["CriticalValue"]
+            crit_results[str(w.id)] = crit
+            if crit["wins_above"]:
+                raise AssertionError(f"Violazione Critical Value (sopra): utente {w.id} vince ancora con bid = {crit['bid_above']:.6f} > p_i = {p_i:.6f}")
+            if not crit["wins_below"]:
+                raise AssertionError(f"Violazione Critical Value (sotto): utente {w.id} perde con bid = {crit['bid_below']:.6f} < p_i = {p_i:.6f}")
         report["CriticalValue"] = crit_results
         if self.debug and self._logs_payment:
             bound_results = {}
@@ -354,30 +747,11 @@ class IMCUAuction:
             report["PaymentBound"] = {"skipped": "log non disponibili"}
         truth_results = {}
         for w in winners:
-            true_cost = float(w.cost)
-            true_utility = max(0.0, float(payments[w.id] - true_cost))            
-            fake_utilities = []
-            violations = []
-            for _ in range(self.TRUTHFULNESS_TEST_SAMPLES):
-                multiplier = self._test_rng.uniform(0.5, 2.0)
-                if math.isclose(multiplier, 1.0):
-                    continue 
-                fake_bid = true_cost * multiplier
-                mod_users = self._clone_users_with_modified_bid(w.id, new_bid=fake_bid)
-                temp_auction = IMCUAuction(mod_users, debug=False, verify_properties=False)
-                fake_winners_ids = temp_auction._selection_only(mod_users)
-                if w.id in fake_winners_ids:
-                    fake_winners_obj = [u for u in mod_users if u.id in fake_winners_ids]
-                    fake_payments = temp_auction._payment_phase(fake_winners_obj)
-                    fake_utility = float(fake_payments[w.id] - true_cost)
-                else:
-                    fake_utility = 0.0
-                fake_utilities.append({"bid_multiplier": float(multiplier), "fake_bid": float(fake_bid), "utility": float(fake_utility)})
-                if fake_utility > true_utility + self.EPSILON:
-                    violations.append({'multiplier': multiplier, 'utility_gain': fake_utility - true_utility, 'fake_utility': fake_utility})
-            truth_results[str(w.id)] = {"true_utility": float(true_utility), "fake_bids_tested": len(fake_utilities), "dominating_bids_count": len(violations), "dominating_bids_examples": violations[:5]}
+            truth = per_winner[w.id]["Truthfulness"]
+            violations = truth["dominating_bids_examples"]
+            truth_results[str(w.id)] = truth
             if violations:
-                raise AssertionError(f"Violazione Truthfulness: utente {w.id} guadagna mentendo. Utilità vera = {true_utility:.6f}, Trovati {len(violations)}/{self.TRUTHFULNESS_TEST_SAMPLES} bid mendaci migliori. Esempio: {violations[0]}")
+                raise AssertionError(f"Violazione Truthfulness: utente {w.id} guadagna mentendo. Utilità vera = {truth['true_utility']:.6f}, Trovati {truth['dominating_bids_count']}/{self.TRUTHFULNESS_TEST_SAMPLES} bid mendaci migliori. Esempio: {violations[0]}")
         report["Truthfulness"] = truth_results
         return report
     
@@ -393,9 +767,9 @@ class IMCUAuction:
             u.payment = float(payments.get(u.id, 0.0))
             base_cost = float(u.cost) if hasattr(u, "cost") and u.cost > 0 else float(u.bid)
             u.utility = float(u.payment - base_cost)
-        vS = total_value_of_users(winners)
+        vS = total_value_of_users(winners, self._task_lists)
         sumP = float(sum(payments.values()))
-        diagnostics = IMCUDiagnostics(winners_count=len(winners), covered_tasks_count=len({t.id for u in winners for t in _unique_tasks(u.tasks)}), payments_sum=sumP, platform_value_vS=vS, platform_utility_u0=vS - sumP, selection_time_s=(t1 - t0), payment_time_s=(t2 - t1), total_time_s=(t2 - t0), mv_calls_selection=self._mv_calls_selection, mv_calls_payment=self._mv_calls_payment, logs_selection=self._logs_selection if self.debug else [], logs_payment=self._logs_payment if self.debug else [])
+        diagnostics = IMCUDiagnostics(winners_count=len(winners), covered_tasks_count=len({t.id for u in winners for t in _unique_tasks(self._tasks_of(u))}), payments_sum=sumP, platform_value_vS=vS, platform_utility_u0=vS - sumP, selection_time_s=(t1 - t0), payment_time_s=(t2 - t1), total_time_s=(t2 - t0), mv_calls_selection=self._mv_calls_selection, mv_calls_payment=self._mv_calls_payment, logs_selection=self._logs_selection if self.debug else [], logs_payment=self._logs_payment if self.debug else [])
         if self.verify_properties:
             prop_report = self._check_properties(winners, payments)
             diagnostics.property_checks = prop_report
@@ -403,8 +777,20 @@ class IMCUAuction:
             diagnostics.property_checks["Submodularity"] = subm
         return winners_set, payments, diagnostics
 
-def run_imcu_auction(users: List[User], debug: bool = True, verify_properties: bool = True) -> Tuple[Set[int], Dict[int, float], Dict[str, Any]]:
-    auction = IMCUAuction(users, debug=debug, verify_properties=verify_properties)
+_VERIFICATION_AUCTION: Optional[IMCUAuction] = None
+
+def _init_verification_worker(auction: IMCUAuction) -> None:
+    global _VERIFICATION_AUCTION
+    _VERIFICATION_AUCTION = auction
+
+def _verify_winner_in_worker(item: Tuple[int, float]) -> Tuple[int, Dict[str, Dict[str, Any]]]:
+    w_id, p_i = item
+    auction = _VERIFICATION_AUCTION
+    winner = auction.users[auction._user_index[w_id]]
+    return w_id, auction._check_winner_properties(winner, p_i, random.Random(auction.SUBMODULARITY_TEST_SEED + w_id))
+
+def run_imcu_auction(users: List[User], debug: bool = True, verify_properties: bool = True, lazy_greedy: bool = False, incremental_payments: bool = False, compiled_coverage: bool = False, fast_verification: bool = False, verification_workers: int = 0, validation: str = "full") -> Tuple[Set[int], Dict[int, float], Dict[str, Any]]:
+    auction = IMCUAuction(users, debug=debug, verify_properties=verify_properties, lazy_greedy=lazy_greedy, incremental_payments=incremental_payments, compiled_coverage=compiled_coverage, fast_verification=fast_verification, verification_workers=verification_workers, validation=validation)
     winners_set, payments, diag = auction.run()
     all_task_ids = {t.id for u in auction.users for t in _unique_tasks(u.tasks)}
     diagnostics = {"winners_count": diag.winners_count, "covered_tasks_count": diag.covered_tasks_count, "payments_sum": diag.payments_sum, "platform_value_vS": diag.platform_value_vS, "platform_utility_u0": diag.platform_utility_u0, "selection_time_s": diag.selection_time_s, "payment_time_s": diag.payment_time_s, "total_time_s": diag.total_time_s, "mv_calls_selection": diag.mv_calls_selection, "mv_calls_payment": diag.mv_calls_payment, "property_checks": diag.property_checks, "n_users": len(auction.users), "m_tasks": len(all_task_ids)}
@@ -4,7 +4,7 @@ import math
 import random
 import logging
 from enum import Enum, auto
-from typing import Optional, Tuple, List, Dict, Any
+from typing import Optional, Tuple, List, Dict, Any, Sequence
 import numpy as np
 from pathlib import Path
 
@@ -16,7 +16,7 @@ if str(_fase1_dir) not in sys.path:
     sys.path.insert(0, str(_fase1_dir))
 
 try:
-    from Fase_1.classes import Task as TaskBase, User as UserBase
+    from Fase_1.classes import Task as TaskBase, User as UserBase, haversine_matrix_m, haversine_pairwise_m, positions_array
 except ImportError as e:
     raise ImportError(f"Impossibile importare Fase_1.classes: {e}\nVerifica che esista Fase_1/__init__.py e che contenga Task e User")
 
@@ -129,6 +129,24 @@ class Task(TaskBase):
             self.quality_target = None
         self.group_id = group_id
 
+    @classmethod
+    def _from_columns(cls, task_id: int, lat: float, lon: float, value: float, is_community_task: bool = False, quality_target: Optional[float] = None, group_id: Optional[int] = None) -> Task:
+        task = super()._from_columns(task_id, lat, lon, value)
+        task.is_community_task = bool(is_community_task)
+        task.quality_target = None if quality_target is None else float(quality_target)
+        task.group_id = group_id
+        return task
+
+    @classmethod
+    def _validate_columns(cls, columns: Dict[str, Sequence[Any]]) -> None:
+        super()._validate_columns(columns)
+        if "quality_target" in columns:
+            targets = np.asarray(columns["quality_target"], dtype=object)
+            targets = targets[targets != None].astype(float)
+            invalid = ~((targets >= 0.0) & (targets <= 1.0))
+            if invalid.any():
+                raise ValueError(f"Il target di qualità (quality_target) è fuori dall'intervallo [0, 1]: {targets[invalid][0]}\nValori ammessi: [0.0 = nessun vincolo, 1.0 = massima qualità]")
+
     def __repr__(self) -> str:
         tipo = "Comunitario" if self.is_community_task else "Commerciale"
         return f"Task({self.id}, {tipo}, v={self.value:.2f})"
@@ -211,14 +229,14 @@ class BoundedRationalUser(UserBase):
         self.reward_allocation_class = f"({rank_str},{fft_type.name})"
         logger.debug(f"Utente {self.id}: FFT assegnato {self.reward_allocation_class}, ordine indizi={[c.name for c in self.cue_ranking]}")
 
-    def _evaluate_cue_sequential(self, task: Task, reward: float) -> Tuple[bool, str]:
+    def _evaluate_cue_sequential(self, task: Task, reward: float, dist_m: Optional[float] = None) -> Tuple[bool, str]:
         if not isinstance(task, Task):
             raise TypeError(f"Atteso oggetto Task, ricevuto: {type(task).__name__}")
         if reward < 0:
             raise ValueError(f"Ricompensa negativa non ammessa: {reward} euro")
         for idx, cue in enumerate(self.cue_ranking):
             if cue == Cue.DISTANZA:
-                dist_km = self.calculate_distance_to(task) / 1000.0
+                dist_km = (self.calculate_distance_to(task) if dist_m is None else dist_m) / 1000.0
                 cue_result = (dist_km <= self.soglia_distanza_km)
             elif cue == Cue.RICOMPENSA:
                 cue_result = (reward >= self.soglia_reward_base)
@@ -244,24 +262,44 @@ class BoundedRationalUser(UserBase):
         logger.warning(f"Utente {self.id}: L'euristica FFT non ha portato a una decisione esplicita, rifiuto di sicurezza.")
         return False, "rifiuto_default_finale"
 
+    def _evaluate_cues_batch(self, distances_m: np.ndarray, rewards: np.ndarray, community: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        n_tasks = len(distances_m)
+        if n_tasks and float(rewards.min()) < 0:
+            raise ValueError(f"Ricompensa negativa non ammessa: {float(rewards.min())} euro")
+        if not self.cue_ranking:
+            return np.zeros(n_tasks, dtype=bool), np.ones(n_tasks, dtype=bool)
+        cue_results = {Cue.DISTANZA: (distances_m / 1000.0) <= self.soglia_distanza_km, Cue.RICOMPENSA: rewards >= self.soglia_reward_base, Cue.COMMUNITY: community == self.prefers_community}
+        results = np.vstack([cue_results[cue] for cue in self.cue_ranking])
+        if self.fft_type == FFTType.LENIENT_PECTINATE:
+            return results.any(axis=0), np.zeros(n_tasks, dtype=bool)
+        if self.fft_type == FFTType.STRICT_PECTINATE:
+            return results.all(axis=0), np.zeros(n_tasks, dtype=bool)
+        if self.fft_type == FFTType.ZIGZAG_1:
+            accepted = results.any(axis=0)
+            return accepted, ~accepted
+        return np.zeros(n_tasks, dtype=bool), results.all(axis=0)
+
+    def _estimate_expected_payments(self, values: np.ndarray) -> np.ndarray:
+        return values * EXPECTED_PAYMENT_FACTOR
+
     def _select_fft_heuristic(self, all_tasks: List[Task], max_tasks: int = 5) -> List[Task]:
-        selected: List[Task] = []
         if self._local_rng.random() < self.deviation_prob:
             k = min(max_tasks, len(all_tasks))
             selected = self._local_rng.sample(all_tasks, k)
             logger.debug(f"Utente {self.id}: deviazione dall'euristica FFT, scelta casuale di {len(selected)} task")
             return selected
-        for task in all_tasks:
-            expected_reward = self._estimate_expected_payment(task)
-            decision, reason = self._evaluate_cue_sequential(task, expected_reward)
-            if decision:
-                selected.append(task)
-                logger.debug(f"Utente {self.id}: task {task.id} ACCETTATO (motivo={reason}, ricompensa_attesa={expected_reward:.2f} euro)")
-                if len(selected) >= max_tasks:
-                    break
-            else:
-                logger.debug(f"Utente {self.id}: task {task.id} rifiutato (motivo={reason})")
-        return selected
+        n_tasks = len(all_tasks)
+        values = np.fromiter((t.value for t in all_tasks), dtype=float, count=n_tasks)
+        community = np.fromiter((t.is_community_task for t in all_tasks), dtype=bool, count=n_tasks)
+        accepted, undecided = self._evaluate_cues_batch(self.distances_to(all_tasks), self._estimate_expected_payments(values), community)
+        limit = max(1, max_tasks)
+        accepted_idx = np.flatnonzero(accepted)[:limit]
+        n_evaluated = int(accepted_idx[-1]) + 1 if len(accepted_idx) == limit else n_tasks
+        n_undecided = int(undecided[:n_evaluated].sum())
+        if n_undecided:
+            logger.warning(f"Utente {self.id}: L'euristica FFT non ha portato a una decisione esplicita per {n_undecided} task, rifiuto di sicurezza.")
+        logger.debug(f"Utente {self.id}: FFT {self.fft_type.name} ha accettato {len(accepted_idx)} task su {n_evaluated} valutati")
+        return [all_tasks[i] for i in accepted_idx.tolist()]
 
     def select_task_set_bounded(self, all_tasks: List[Task], max_tasks: int = 5) -> List[Task]:
         return self._select_fft_heuristic(all_tasks, max_tasks)
@@ -273,50 +311,62 @@ class BoundedRationalUser(UserBase):
         if not self.tasks:
             return 0.0
         unique_tasks = list({t.id: t for t in self.tasks}.values())
+        bundle_m = self._bundle_distance_matrix_m(unique_tasks)
         if len(unique_tasks) == 1:
-            one_way_m = self._haversine(self.position, unique_tasks[0].position)
+            one_way_m = bundle_m[0][1]
             total_m = 2 * one_way_m
         elif self.rationality_level >= 0.70:
-            total_m = self._tsp_greedy_routing_m(unique_tasks)
+            total_m = self._tsp_greedy_routing_m(unique_tasks, bundle_m)
         elif self.rationality_level >= 0.50:
-            total_m = self._star_routing_distance_m(unique_tasks)
+            total_m = self._star_routing_distance_m(unique_tasks, bundle_m)
         else:
-            total_m = self._random_routing_distance_m(unique_tasks)
+            total_m = self._random_routing_distance_m(unique_tasks, bundle_m)
         correction = URBAN_CORRECTION_FACTOR_BASE * routing_inefficiency_factor(self.rationality_level)
         distance_km = (total_m * correction) / 1000.0
         logger.debug(f"Utente {self.id}: distanza stimata {distance_km:.2f} km ({len(unique_tasks)} task, rho={self.rationality_level:.2f}, fattore_correzione={correction:.3f}x)")
         return distance_km
 
-    def _star_routing_distance_m(self, tasks: List[Task]) -> float:
-        total_m = sum(2 * self._haversine(self.position, t.position) for t in tasks)
+    def _bundle_distance_matrix_m(self, tasks: List[Task]) -> List[List[float]]:
+        points = [self.position] + [t.position for t in tasks]
+        return haversine_matrix_m(points, points, self.EARTH_RADIUS_M).tolist()
+
+    def _star_routing_distance_m(self, tasks: List[Task], bundle_m: Optional[List[List[float]]] = None) -> float:
+        if bundle_m is None:
+            bundle_m = self._bundle_distance_matrix_m(tasks)
+        total_m = sum(2 * bundle_m[0][j] for j in range(1, len(tasks) + 1))
         return total_m
 
-    def _tsp_greedy_routing_m(self, tasks: List[Task]) -> float:
+    def _tsp_greedy_routing_m(self, tasks: List[Task], bundle_m: Optional[List[List[float]]] = None) -> float:
         if not tasks:
             return 0.0
-        remaining = tasks.copy()
-        route: List[Task] = []
-        current_pos = self.position
+        if bundle_m is None:
+            bundle_m = self._bundle_distance_matrix_m(tasks)
+        remaining = list(range(1, len(tasks) + 1))
+        route: List[int] = []
+        current = 0
         while remaining:
-            nearest = min(remaining, key=lambda t: self._haversine(current_pos, t.position))
+            row = bundle_m[current]
+            nearest = min(remaining, key=row.__getitem__)
             route.append(nearest)
             remaining.remove(nearest)
-            current_pos = nearest.position
-        total = self._haversine(self.position, route[0].position)
+            current = nearest
+        total = bundle_m[0][route[0]]
         for i in range(len(route) - 1):
-            total += self._haversine(route[i].position, route[i + 1].position)
-        total += self._haversine(route[-1].position, self.position)
+            total += bundle_m[route[i]][route[i + 1]]
+        total += bundle_m[route[-1]][0]
         return total
 
-    def _random_routing_distance_m(self, tasks: List[Task]) -> float:
+    def _random_routing_distance_m(self, tasks: List[Task], bundle_m: Optional[List[List[float]]] = None) -> float:
         if not tasks:
             return 0.0
-        shuffled = tasks.copy()
+        if bundle_m is None:
+            bundle_m = self._bundle_distance_matrix_m(tasks)
+        shuffled = list(range(1, len(tasks) + 1))
         self._local_rng.shuffle(shuffled)
-        total = self._haversine(self.position, shuffled[0].position)
+        total = bundle_m[0][shuffled[0]]
         for i in range(len(shuffled) - 1):
-            total += self._haversine(shuffled[i].position, shuffled[i + 1].position)
-        total += self._haversine(shuffled[-1].position, self.position)
+            total += bundle_m[shuffled[i]][shuffled[i + 1]]
+        total += bundle_m[shuffled[-1]][0]
         return total
 
     def _haversine(self, pos1: Tuple[float, float], pos2: Tuple[float, float]) -> float:
@@ -375,6 +425,12 @@ class BoundedRationalUser(UserBase):
         else:
             self.bid = self.generate_bid()
 
+    def completion_guaranteed(self) -> bool:
+        return False
+
+    def detection_penalty(self, payment: float, reputation: float) -> float:
+        return PENALTY_FACTOR * payment
+
     def attempt_task_completion(self) -> bool:
         delta_base = self.p_defect_base
         reputation_factor = 1.0 + BETA_REPUTATION * (1.0 - self.reputation)
@@ -384,7 +440,7 @@ class BoundedRationalUser(UserBase):
         if defect_attempt:
             detected = self._local_rng.random() < DETECTION_PROBABILITY
             if detected:
-                penalty = PENALTY_FACTOR * self.payment
+                penalty = self.detection_penalty(self.payment, self.reputation)
                 self.penalty_accumulated += penalty
                 self.reputation = max(0.0, self.reputation - 0.5)
                 self.completed = False
@@ -456,6 +512,146 @@ class BoundedRationalUser(UserBase):
         blacklist_str = f", strike={self.blacklist_strikes}" if self.blacklist_strikes > 0 else ""
         return f"Utente({self.id}, rho={self.rationality_level:.2f}, {self.honesty_profile}{blacklist_str})"
 
+def bundle_distance_tensor_m(users: Sequence[BoundedRationalUser]) -> Tuple[np.ndarray, np.ndarray]:
+    bundles = [list({t.id: t for t in u.tasks}.values()) for u in users]
+    sizes = np.fromiter((len(bundle) for bundle in bundles), dtype=np.int64, count=len(bundles))
+    k_max = int(sizes.max()) if len(bundles) else 0
+    points = np.repeat(positions_array(users)[:, None, :], k_max + 1, axis=1)
+    for i, bundle in enumerate(bundles):
+        if bundle:
+            points[i, 1:len(bundle) + 1] = positions_array(bundle)
+    return haversine_pairwise_m(points, UserBase.EARTH_RADIUS_M), sizes
+
+def _greedy_route_order(dist: np.ndarray, sizes: np.ndarray) -> np.ndarray:
+    n_users, k_max = len(sizes), dist.shape[-1] - 1
+    rows = np.arange(n_users)
+    visited = np.arange(k_max + 1)[None, :] > sizes[:, None]
+    visited[:, 0] = True
+    current = np.zeros(n_users, dtype=np.int64)
+    order = np.zeros((n_users, k_max), dtype=np.int64)
+    for step in range(k_max):
+        current = np.argmin(np.where(visited, np.inf, dist[rows, current]), axis=1)
+        order[:, step] = current
+        visited[rows, current] = True
+    return order
+
+def route_distances_m(dist: np.ndarray, sizes: np.ndarray, rationality: np.ndarray, rngs: Sequence[random.Random]) -> np.ndarray:
+    n_users, k_max = len(sizes), dist.shape[-1] - 1
+    if k_max == 0:
+        return np.zeros(n_users)
+    rows = np.arange(n_users)
+    star = np.zeros(n_users)
+    for j in range(k_max):
+        star = star + np.where(j < sizes, 2 * dist[:, 0, j + 1], 0.0)
+    tsp_mask = (sizes > 1) & (rationality >= 0.70)
+    random_mask = (sizes > 1) & (rationality < 0.50)
+    if not (tsp_mask.any() or random_mask.any()):
+        return star
+    order = np.zeros((n_users, k_max), dtype=np.int64)
+    if tsp_mask.any():
+        order[tsp_mask] = _greedy_route_order(dist[tsp_mask], sizes[tsp_mask])
+    for i in np.flatnonzero(random_mask).tolist():
+        shuffled = list(range(1, int(sizes[i]) + 1))
+        rngs[i].shuffle(shuffled)
+        order[i, :len(shuffled)] = shuffled
+    tour = dist[rows, 0, order[:, 0]]
+    for step in range(1, k_max):
+        tour = tour + np.where(step < sizes, dist[rows, order[:, step - 1], order[:, step]], 0.0)
+    tour = tour + dist[rows, order[rows, np.maximum(sizes - 1, 0)], 0]
+    return np.where(tsp_mask | random_mask, tour, star)
+
+def compute_travel_distances_km(users: Sequence[BoundedRationalUser]) -> np.ndarray:
+    dist, sizes = bundle_distance_tensor_m(users)
+    rationality = np.fromiter((u.rationality_level for u in users), dtype=float, count=len(users))
+    total_m = route_distances_m(dist, sizes, rationality, [u._local_rng for u in users])
+    correction = np.fromiter((URBAN_CORRECTION_FACTOR_BASE * routing_inefficiency_factor(u.rationality_level) for u in users), dtype=float, count=len(users))
+    return (total_m * correction) / 1000.0
+
+def compute_true_costs(users: Sequence[BoundedRationalUser]) -> np.ndarray:
+    return np.fromiter((u.cost_per_km for u in users), dtype=float, count=len(users)) * compute_travel_distances_km(users)
+
+def generate_bids(users: Sequence[BoundedRationalUser], skip_invalid: bool = False) -> np.ndarray:
+    costs = compute_true_costs(users)
+    valid = np.isfinite(costs) & (costs >= 0)
+    invalid = np.flatnonzero(~valid).tolist()
+    if invalid and not skip_invalid:
+        user = users[invalid[0]]
+        raise ValueError(f"Utente {user.id}: costo non valido da compute_true_cost() = {costs[invalid[0]]:.4f} euro ({len(invalid)} utenti con costo non valido)\n  Verificare l'assegnazione dei task e il calcolo del routing.")
+    for idx in invalid:
+        user = users[idx]
+        user.bid = -1.0
+        logger.warning(f"Utente {user.id}: costo non valido calcolato {costs[idx]:.4f} euro (costo_per_km={user.cost_per_km:.2f}), offerta esclusa")
+    rho = np.fromiter((u.rationality_level for u in users), dtype=float, count=len(users))[valid]
+    low = rho < RATIONALITY_THRESHOLD_LOW
+    mu_dev = np.where(low, 0.03, 0.02 + 0.06 * (1.0 - rho))
+    sigma_dev = np.where(low, 0.08 * (1.0 - rho), 0.03 * (1.0 - rho))
+    deviation = np.clip(np.random.normal(mu_dev, sigma_dev), -0.15, 0.15)
+    bids = np.full(len(users), -1.0)
+    bids[valid] = np.maximum(0.01, costs[valid] * (1.0 + deviation))
+    for idx, cost, bid in zip(np.flatnonzero(valid).tolist(), costs[valid].tolist(), bids[valid].tolist()):
+        users[idx].cost = cost
+        users[idx].bid = bid
+    logger.debug(f"Offerte generate in blocco per {int(valid.sum())}/{len(users)} utenti")
+    return bids
+
+MORAL_HAZARD_MC_CHUNK: int = 1024
+
+def moral_hazard_coverage(winners: Sequence[BoundedRationalUser]) -> Tuple[np.ndarray, np.ndarray]:
+    column: Dict[int, int] = {}
+    values: List[float] = []
+    rows: List[int] = []
+    cols: List[int] = []
+    for i, w in enumerate(winners):
+        for t in w.tasks:
+            j = column.get(t.id)
+            if j is None:
+                j = column[t.id] = len(values)
+                values.append(float(t.value))
+            rows.append(i)
+            cols.append(j)
+    coverage = np.zeros((len(winners), len(values)), dtype=float)
+    coverage[rows, cols] = 1.0
+    return coverage, np.asarray(values, dtype=float)
+
+def simulate_moral_hazard_replications(p_defect_base: np.ndarray, reputation: np.ndarray, payments: np.ndarray, costs: np.ndarray, coverage: np.ndarray, task_values: np.ndarray, n_replications: int, rng: Optional[np.random.Generator] = None, penalties: Optional[np.ndarray] = None, guaranteed: Optional[np.ndarray] = None) -> Dict[str, np.ndarray]:
+    if n_replications <= 0:
+        raise ValueError(f"Il numero di repliche Monte Carlo deve essere positivo, ricevuto: {n_replications}")
+    rng = np.random.default_rng() if rng is None else rng
+    payments = np.asarray(payments, dtype=float)
+    p_defect = np.minimum(0.95, np.asarray(p_defect_base, dtype=float) * (1.0 + BETA_REPUTATION * (1.0 - np.asarray(reputation, dtype=float))))
+    if guaranteed is not None:
+        p_defect = np.where(np.asarray(guaranteed, dtype=bool), 0.0, p_defect)
+    penalties = PENALTY_FACTOR * payments if penalties is None else np.asarray(penalties, dtype=float)
+    margin = payments - np.asarray(costs, dtype=float)
+    sum_payments = float(payments.sum())
+    n_winners = len(payments)
+    out = {name: np.empty(n_replications) for name in ("v_eff", "u0_eff", "ir_violation_rate", "completion_rate", "actual_completion_rate", "detection_rate")}
+    for start in range(0, n_replications, MORAL_HAZARD_MC_CHUNK):
+        k = min(MORAL_HAZARD_MC_CHUNK, n_replications - start)
+        block = slice(start, start + k)
+        defect = rng.random((k, n_winners)) < p_defect
+        detected = defect & (rng.random((k, n_winners)) < DETECTION_PROBABILITY)
+        honest = ~defect
+        covered = (honest.astype(float) @ coverage) > 0
+        out["v_eff"][block] = covered @ task_values
+        out["u0_eff"][block] = out["v_eff"][block] - sum_payments
+        out["ir_violation_rate"][block] = (margin - detected * penalties < -1e-6).sum(axis=1) / max(1, n_winners)
+        out["completion_rate"][block] = 1.0 - detected.mean(axis=1) if n_winners else 1.0
+        out["actual_completion_rate"][block] = honest.mean(axis=1) if n_winners else 1.0
+        out["detection_rate"][block] = detected.mean(axis=1) if n_winners else 0.0
+    return out
+
+def summarize_replications(samples: Dict[str, np.ndarray], confidence: float = 0.95) -> Dict[str, float]:
+    tail = 50.0 * (1.0 - confidence)
+    summary: Dict[str, float] = {}
+    for name, values in samples.items():
+        lower, upper = np.percentile(values, [tail, 100.0 - tail])
+        summary[f"mc_{name}_mean"] = float(values.mean())
+        summary[f"mc_{name}_std"] = float(values.std(ddof=1)) if len(values) > 1 else 0.0
+        summary[f"mc_{name}_ci_lower"] = float(lower)
+        summary[f"mc_{name}_ci_upper"] = float(upper)
+    return summary
+
 def validate_mechanism_health(winners: List[BoundedRationalUser], payments: Dict[int, float], v_eff: float, all_tasks: List[Task], baseline_efficiency: float = EFFICIENCY_BASELINE_FASE1, hour_label: str = "") -> Dict:
     if v_eff < 0:
         raise ValueError(f"Il valore effettivo (v_eff) non può essere negativo: {v_eff} euro")
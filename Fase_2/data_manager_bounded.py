@@ -24,7 +24,7 @@ except ImportError as e:
     raise ImportError(f"Impossibile importare DataManager dalla Fase 1. Controlla che esistano {_fase1_dir}/data_manager.py e {_fase1_dir}/__init__.py. Dettagli tecnici: {e}")
 
 try:
-    from Fase_2.classes_bounded import BoundedRationalUser, Task
+    from Fase_2.classes_bounded import BoundedRationalUser, Task, generate_bids
 except ImportError as e:
     raise ImportError(f"Impossibile importare le classi della Fase 2. Controlla che esista il file {_fase2_dir}/classes_bounded.py. Dettagli tecnici: {e}")
 
@@ -79,13 +79,7 @@ class DataManagerRational(DataManagerBase):
             day = first_partition[:10]
             hour = first_partition[11:13] if len(first_partition) > 10 else "00"
             logger.info(f"Parametri temporali rilevati automaticamente: giorno={day}, ora={hour}")
-        last_positions: Dict[int, Tuple[float, float, int]] = {}
-        for row in self.get_window_records(day=day, hour=hour, duration_hours=duration_hours):
-            driver_id = int(row["driver_id"])
-            epoch_ms = int(row["epoch_ms"])
-            lat, lon = float(row["lat"]), float(row["lon"])
-            if driver_id not in last_positions or epoch_ms > last_positions[driver_id][2]:
-                last_positions[driver_id] = (lat, lon, epoch_ms)
+        last_positions = self.get_last_positions(day=day, hour=hour, duration_hours=duration_hours)
         if not last_positions:
             warnings.warn(f"Nessun tassista attivo nella finestra specificata: giorno {day}, ora {hour}:00, durata {duration_hours} ore. Ritorno una lista vuota di utenti.")
             return []
@@ -97,20 +91,16 @@ class DataManagerRational(DataManagerBase):
                 driver_items = self._stratified_sampling(driver_items, max_users)
         driver_items.sort(key=lambda item: item[0])
         users: List[BoundedRationalUser] = []
+        task_index = self.build_task_index(tasks, radius_m=task_radius_m) if tasks is not None else None
         for driver_id, (lat, lon) in driver_items:
             cost_per_km = random.uniform(cost_min, cost_max)
             rationality_level = self._generate_rationality(rationality_distribution)
             user = BoundedRationalUser(user_id=driver_id, x=lon, y=lat, cost_per_km=cost_per_km, rationality_level=rationality_level, initial_reputation=1.0, deviation_prob=None, global_seed=self.random_seed)
-            candidate_tasks: List[Task] = []
-            if tasks is not None:
-                for task in tasks:
-                    dist_m = user.calculate_distance_to(task)
-                    if dist_m <= task_radius_m:
-                        candidate_tasks.append(task)
+            candidate_tasks: List[Task] = task_index.tasks_within_radius(user, task_radius_m) if task_index is not None else []
             desired_tasks: List[Task] = user.select_task_set_bounded(candidate_tasks)
             user.set_tasks(desired_tasks)
-            user.generate_bid()
             users.append(user)
+        generate_bids(users)
         logger.info(f"Creati {len(users)} utenti con razionalità limitata (distribuzione={rationality_distribution})")
         return users
 
@@ -154,13 +144,8 @@ class DataManagerRational(DataManagerBase):
             raise ValueError(f"Distribuzione di razionalità non riconosciuta: {distribution}")
 
     def create_tasks(self, day: Optional[str] = None, hour: Optional[str] = None, duration_hours: int = 1, cell_size_m: int = 500, value_mode: str = "uniform", uniform_low: Optional[float] = None, uniform_high: Optional[float] = None, seed: Optional[int] = None) -> List[Task]:
-        tasks_f1 = super().create_tasks(day=day, hour=hour, duration_hours=duration_hours, cell_size_m=cell_size_m, value_mode=value_mode, uniform_low=uniform_low, uniform_high=uniform_high, seed=seed)
-        if not tasks_f1:
+        task_set = self.create_task_set(day=day, hour=hour, duration_hours=duration_hours, cell_size_m=cell_size_m, value_mode=value_mode, uniform_low=uniform_low, uniform_high=uniform_high, seed=seed, task_cls=Task)
+        if not len(task_set):
             warnings.warn(f"Nessun task generato nella finestra specificata: giorno {day}, ora {hour}:00, durata {duration_hours} ore. Ritorno una lista vuota di task.")
             return []
-        tasks_f2: List[Task] = []
-        for t_f1 in tasks_f1:
-            lat_f1, lon_f1 = t_f1.position
-            task_f2 = Task(task_id=t_f1.id, x=lon_f1, y=lat_f1, value=t_f1.value)
-            tasks_f2.append(task_f2)
-        return tasks_f2
\ No newline at end of file
+        return task_set.to_list()
\ No newline at end of file
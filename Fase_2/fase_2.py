@@ -1,8 +1,8 @@
 from __future__ import annotations
 import os
 import sys
-from typing import Dict, Tuple, List, Any, Optional
-from dataclasses import dataclass
+from typing import Callable, Dict, Tuple, List, Any, Optional
+from dataclasses import dataclass, field
 import argparse
 import datetime as dt
 import numpy as np
@@ -15,18 +15,19 @@ _parent_dir = os.path.dirname(_current_dir)
 sys.path.insert(0, _parent_dir)
 
 try:
-    from Fase_1.fase_1 import ExperimentConfig as ExperimentConfigBase, setup_experiment_logger, save_experiment_metadata, safe_csv_write
+    from Fase_1.fase_1 import ExperimentConfig as ExperimentConfigBase, setup_experiment_logger, save_experiment_metadata, safe_csv_write, spill_hour_objects
 except ImportError as e:
     raise ImportError(f"Impossibile importare i moduli della Fase 1. Verifica che Fase_1/fase_1.py esista. Dettagli tecnici: {e}")
 
 try:
     from Fase_2.data_manager_bounded import DataManagerRational
-    from Fase_2.classes_bounded import BoundedRationalUser, Task, set_random_seed
+    from Fase_2.classes_bounded import BoundedRationalUser, Task, set_random_seed, generate_bids
 except ImportError as e:
     raise ImportError(f"Impossibile importare i moduli core della Fase 2. Verifica che data_manager_bounded.py e classes_bounded.py esistano. Dettagli tecnici: {e}")
 
 try:
     from Fase_2.imcu_bounded import run_imcu_auction_bounded
+    from Fase_1.imcu import VALIDATION_LEVELS
 except ImportError as e:
     raise ImportError(f"Impossibile importare imcu_bounded.py. Verifica che il modulo esista. Dettagli tecnici: {e}")
 
@@ -47,6 +48,7 @@ class ExperimentConfigPhase2(ExperimentConfigBase):
     fft_type: str = "LENIENT"
     task_value_min: float = 1.0
     task_value_max: float = 5.0
+    moral_hazard_replications: int = 0
 
     def validate(self) -> None:
         super().validate()
@@ -62,6 +64,8 @@ class ExperimentConfigPhase2(ExperimentConfigBase):
             raise ValueError(f"Valore minimo task (task_value_min) deve essere > 0, ricevuto: {self.task_value_min}")
         if self.task_value_max <= self.task_value_min:
             raise ValueError(f"Valore massimo task (task_value_max) deve essere maggiore del minimo, ricevuto: min={self.task_value_min}, max={self.task_value_max}")
+        if self.moral_hazard_replications < 0:
+            raise ValueError(f"Numero di repliche Monte Carlo (moral_hazard_replications) deve essere >= 0, ricevuto: {self.moral_hazard_replications}")
 
     def to_dict(self) -> Dict[str, Any]:
         base_dict = super().to_dict()
@@ -71,9 +75,33 @@ class ExperimentConfigPhase2(ExperimentConfigBase):
             "tipo_fft": self.fft_type,
             "valore_task_min": self.task_value_min,
             "valore_task_max": self.task_value_max,
+            "repliche_monte_carlo_azzardo_morale": self.moral_hazard_replications,
         }
         return base_dict
 
+@dataclass(slots=True)
+class HourlyResultPhase2:
+    day: str
+    hour: int
+    n_tasks: int
+    n_users: int
+    n_users_with_tasks: int
+    n_winners: int
+    v_mech: float
+    sumP: float
+    u0_mech: float
+    v_eff: float
+    u0_eff: float
+    eff_ratio: float
+    winner_profiles: Dict[str, int]
+    payments: np.ndarray
+    winner_ids: np.ndarray
+    n_defections_detected: int = 0
+    n_defections_total: int = 0
+    n_users_blacklisted: int = 0
+    spill_path: Optional[str] = None
+    moral_hazard_bands: Dict[str, float] = field(default_factory=dict)
+
 def compute_winners_profile_distribution(users: List[BoundedRationalUser], winners_set: set[int]) -> Dict[str, int]:
     distribuzione = {prof: 0 for prof in PROFILE_NAMES}
     for user in users:
@@ -84,7 +112,7 @@ def compute_winners_profile_distribution(users: List[BoundedRationalUser], winne
             distribuzione[profilo] += 1
     return distribuzione
 
-def run_hourly_simulation_phase2(dm: DataManagerRational, config: ExperimentConfigPhase2, day: str, hour: int, persistent_users: List[BoundedRationalUser], logger: Any) -> Optional[Dict[str, Any]]:
+def run_hourly_simulation_phase2(dm: DataManagerRational, config: ExperimentConfigPhase2, day: str, hour: int, persistent_users: List[BoundedRationalUser], logger: Any) -> Optional[HourlyResultPhase2]:
     try:
         logger.info(f"[{day} H{hour:02d}] Avvio simulazione oraria Fase 2 (coorte persistente)")
         tasks = dm.create_tasks(
@@ -109,26 +137,31 @@ def run_hourly_simulation_phase2(dm: DataManagerRational, config: ExperimentConf
             logger.warning(f"[{day} H{hour:02d}] Nessun task generato. L'ora viene saltata.")
             return None
         users_with_tasks: List[BoundedRationalUser] = []
+        task_index = dm.build_task_index(tasks, radius_m=config.task_radius_m)
         for user in persistent_users:
-            candidate_tasks: List[Task] = []
-            for task in tasks:
-                dist_m = user.calculate_distance_to(task)
-                if dist_m <= config.task_radius_m:
-                    candidate_tasks.append(task)
+            candidate_tasks: List[Task] = task_index.tasks_within_radius(user, config.task_radius_m)
             if candidate_tasks:
                 desired_tasks = user.select_task_set_bounded(candidate_tasks)
                 user.set_tasks(desired_tasks)
                 if desired_tasks:
-                    user.generate_bid()
                     users_with_tasks.append(user)
+        generate_bids(users_with_tasks)
         logger.info(f"  Utenti con almeno un task selezionato (post-FFT): {len(users_with_tasks)} su {len(persistent_users)}")
         if not users_with_tasks:
             logger.warning(f"[{day} H{hour:02d}] Nessun utente ha selezionato task. L'ora viene saltata.")
             return None
-        winners_set, _, diagnostics = run_imcu_auction_bounded(
+        winners_set, payments, diagnostics = run_imcu_auction_bounded(
             users_with_tasks,
             verify_properties=config.verify_properties,
+            fast_verification=config.fast_verification,
+            lazy_greedy=config.lazy_greedy,
+            incremental_payments=config.incremental_payments,
+            compiled_coverage=config.compiled_coverage,
+            verification_workers=config.verification_workers,
             debug=False,
+            moral_hazard_replications=config.moral_hazard_replications,
+            moral_hazard_rng=np.random.default_rng([config.random_seed, dt.date.fromisoformat(day).toordinal(), hour]) if config.moral_hazard_replications else None,
+            validation=config.validation_level,
         )
         winners = [u for u in users_with_tasks if u.id in winners_set]
         logger.info(f"[STEP 3] Risultati asta (ex-ante) H{hour:02d}")
@@ -148,53 +181,70 @@ def run_hourly_simulation_phase2(dm: DataManagerRational, config: ExperimentConf
         if n_defections_total > 0:
             logger.info(f"  Defezioni totali (reali): {n_defections_total} su {len(winners)} vincitori")
             logger.info(f"  Defezioni rilevate (sanzionate): {n_defections_detected} su {len(winners)} vincitori")
+        bounded_metrics = diagnostics.get("property_checks", {}).get("BoundedRationalityMetrics", {})
+        moral_hazard_bands = {k: float(v) for k, v in bounded_metrics.items() if k.startswith("mc_")}
+        if moral_hazard_bands:
+            logger.info(f"  Monte Carlo ({int(moral_hazard_bands['mc_replications'])} repliche): v_eff={moral_hazard_bands['mc_v_eff_mean']:.2f} [{moral_hazard_bands['mc_v_eff_ci_lower']:.2f}, {moral_hazard_bands['mc_v_eff_ci_upper']:.2f}] euro, u0_eff={moral_hazard_bands['mc_u0_eff_mean']:.2f} [{moral_hazard_bands['mc_u0_eff_ci_lower']:.2f}, {moral_hazard_bands['mc_u0_eff_ci_upper']:.2f}] euro")
+            logger.info(f"  Monte Carlo: completamento={moral_hazard_bands['mc_completion_rate_mean']:.3f} [{moral_hazard_bands['mc_completion_rate_ci_lower']:.3f}, {moral_hazard_bands['mc_completion_rate_ci_upper']:.3f}], violazioni IR={moral_hazard_bands['mc_ir_violation_rate_mean']:.3f} [{moral_hazard_bands['mc_ir_violation_rate_ci_lower']:.3f}, {moral_hazard_bands['mc_ir_violation_rate_ci_upper']:.3f}]")
         v_mech = diagnostics.get("platform_value_vS", 0.0)
         sumP = diagnostics.get("payments_sum", 0.0)
         u0_mech = diagnostics.get("platform_utility_u0", 0.0)
-        v_eff = diagnostics.get("property_checks", {}).get("BoundedRationalityMetrics", {}).get("v_eff_expost", 0.0)
+        v_eff = bounded_metrics.get("v_eff_expost", 0.0)
         completed_count = sum(1 for w in winners if hasattr(w, "actually_completed") and w.actually_completed)
         logger.info(f"[{day} H{hour:02d}] Valore effettivo v_eff = {v_eff:.2f} euro, completamenti reali = {completed_count}/{len(winners)}")
         u0_eff = v_eff - sumP
         eff_ratio = v_eff / v_mech if v_mech > 1e-9 else 0.0
         winner_profiles = compute_winners_profile_distribution(persistent_users, winners_set)
-        return {
-            "day": day,
-            "hour": hour,
-            "n_tasks": len(tasks),
-            "n_users": len(persistent_users),
-            "n_users_with_tasks": len(users_with_tasks),
-            "n_winners": len(winners_set),
-            "v_mech": v_mech,
-            "sumP": sumP,
-            "u0_mech": u0_mech,
-            "v_eff": v_eff,
-            "u0_eff": u0_eff,
-            "eff_ratio": eff_ratio,
-            "winner_profiles": winner_profiles,
-            "diagnostics": diagnostics,
-            "n_defections_detected": n_defections_detected,
-            "n_defections_total": n_defections_total,
-            "n_users_blacklisted": 0,
-        }
+        spill_path = None
+        if config.save_raw_logs:
+            spill_path = spill_hour_objects(
+                os.path.join(config.output_dir, f"giorno_{day}_fase2", "raw_logs"),
+                day,
+                hour,
+                {"users": users_with_tasks, "tasks": tasks, "winners_set": winners_set, "payments": payments, "diagnostics": diagnostics},
+                logger,
+            )
+        return HourlyResultPhase2(
+            day=day,
+            hour=hour,
+            n_tasks=len(tasks),
+            n_users=len(persistent_users),
+            n_users_with_tasks=len(users_with_tasks),
+            n_winners=len(winners_set),
+            v_mech=v_mech,
+            sumP=sumP,
+            u0_mech=u0_mech,
+            v_eff=v_eff,
+            u0_eff=u0_eff,
+            eff_ratio=eff_ratio,
+            winner_profiles=winner_profiles,
+            payments=np.fromiter(payments.values(), dtype=float, count=len(payments)),
+            winner_ids=np.fromiter(sorted(winners_set), dtype=np.int64, count=len(winners_set)),
+            n_defections_detected=n_defections_detected,
+            n_defections_total=n_defections_total,
+            n_users_blacklisted=0,
+            spill_path=spill_path,
+            moral_hazard_bands=moral_hazard_bands,
+        )
     except Exception as e:
         logger.error(f"[{day} H{hour:02d}] Errore critico nella simulazione oraria: {e}", exc_info=True)
         return None
 
-def generate_summary_report_phase2(output_dir: str, day: str, hourly_results: List[Dict[str, Any]], config: ExperimentConfigPhase2, logger: Any) -> None:
+def generate_summary_report_phase2(output_dir: str, day: str, hourly_results: List[HourlyResultPhase2], config: ExperimentConfigPhase2, logger: Any) -> None:
     report_path = os.path.join(output_dir, f"{day}_REPORT_RIEPILOGATIVO_FASE2.txt")
     try:
-        hours = [r["hour"] for r in hourly_results]
-        v_mech_arr = [r["v_mech"] for r in hourly_results]
-        v_eff_arr = [r["v_eff"] for r in hourly_results]
-        u0_mech_arr = [r["u0_mech"] for r in hourly_results]
-        u0_eff_arr = [r["u0_eff"] for r in hourly_results]
-        eff_ratio_arr = [r["eff_ratio"] for r in hourly_results]
-        winners_arr = [r["n_winners"] for r in hourly_results]
-        defections_detected_arr = [r.get("n_defections_detected", 0) for r in hourly_results]
-        defections_total_arr = [r.get("n_defections_total", 0) for r in hourly_results]
+        hours = [r.hour for r in hourly_results]
+        v_mech_arr = [r.v_mech for r in hourly_results]
+        v_eff_arr = [r.v_eff for r in hourly_results]
+        u0_mech_arr = [r.u0_mech for r in hourly_results]
+        u0_eff_arr = [r.u0_eff for r in hourly_results]
+        eff_ratio_arr = [r.eff_ratio for r in hourly_results]
+        winners_arr = [r.n_winners for r in hourly_results]
+        defections_detected_arr = [r.n_defections_detected for r in hourly_results]
+        defections_total_arr = [r.n_defections_total for r in hourly_results]
         total_profiles = {prof: 0 for prof in PROFILE_NAMES}
         for r in hourly_results:
-            for prof, count in r["winner_profiles"].items():
+            for prof, count in r.winner_profiles.items():
                 if prof in total_profiles:
                     total_profiles[prof] += count
         with open(report_path, "w", encoding="utf-8") as f:
@@ -268,7 +318,12 @@ def generate_summary_report_phase2(output_dir: str, day: str, hourly_results: Li
     except Exception as e:
         logger.error(f"Errore durante la generazione del report riepilogativo: {e}", exc_info=True)
 
-def run_experiment_phase2(config: ExperimentConfigPhase2) -> None:
+HOURLY_KPI_FIELDS_PHASE2 = ("n_tasks", "n_users_with_tasks", "n_winners", "v_mech", "sumP", "u0_mech", "v_eff", "u0_eff", "eff_ratio", "n_defections_detected", "n_defections_total")
+
+def hourly_kpi_row_phase2(result: HourlyResultPhase2) -> Dict[str, Any]:
+    return {"day": result.day, "hour": result.hour, **{name: float(getattr(result, name)) for name in HOURLY_KPI_FIELDS_PHASE2}, **result.moral_hazard_bands}
+
+def run_experiment_phase2(config: ExperimentConfigPhase2, kpi_sink: Optional[Callable[[Dict[str, Any]], None]] = None) -> None:
     experiment_id = f"imcu_fase2_{config.day}_{config.hour_start:02d}-{config.hour_end:02d}"
     day_output_dir = os.path.join(config.output_dir, f"giorno_{config.day}_fase2")
     os.makedirs(day_output_dir, exist_ok=True)
@@ -289,14 +344,13 @@ def run_experiment_phase2(config: ExperimentConfigPhase2) -> None:
     logger.info(f"Caricamento DataManagerRational da: {config.raw_data_path}")
     dm = DataManagerRational(
         raw_txt_path=config.raw_data_path,
-        out_dir=os.path.join(config.output_dir, "dataset_processato"),
+        out_dir=config.dataset_out if config.dataset_out else os.path.join(config.output_dir, "dataset_processato"),
         bbox=config.bbox,
         random_seed=config.random_seed,
     )
-    partitions_exist = os.path.exists(dm.part_dir) and len([f for f in os.listdir(dm.part_dir) if f.endswith(".csv")]) > 0
-    if not partitions_exist:
-        logger.info("Partizioni dati non trovate, avvio del processo ETL (parsing dei dati grezzi).")
-        metadata_etl = dm.parse_raw_to_csv(compute_total_lines=True, partition_by="day-hour", write_master_sample=True)
+    if dm.needs_etl():
+        logger.info("Partizioni dati assenti o file grezzo aggiornato, avvio del processo ETL (parsing dei dati grezzi).")
+        metadata_etl = dm.parse_raw_to_csv(compute_total_lines=True, partition_by="day-hour", write_master_sample=True, workers=config.etl_workers, incremental=True)
         logger.info(f"ETL completato: {metadata_etl['records_written']:,} record processati.")
     else:
         logger.info("Partizioni dati già presenti, fase di parsing saltata.")
@@ -332,7 +386,7 @@ def run_experiment_phase2(config: ExperimentConfigPhase2) -> None:
     logger.info("=" * 80)
     logger.info(f"Inizio loop orario su {len(hours_range)} ore con coorte persistente...")
     logger.info("=" * 80)
-    all_hourly_results: List[Dict[str, Any]] = []
+    all_hourly_results: List[HourlyResultPhase2] = []
     with logging_redirect_tqdm():
         for hour in tqdm(hours_range, desc=f"Simulazione giorno {config.day}", unit="ora"):
             result = run_hourly_simulation_phase2(
@@ -345,6 +399,8 @@ def run_experiment_phase2(config: ExperimentConfigPhase2) -> None:
             )
             if result:
                 all_hourly_results.append(result)
+                if kpi_sink is not None:
+                    kpi_sink(hourly_kpi_row_phase2(result))
     if not all_hourly_results:
         logger.error("Nessun risultato orario valido disponibile. Impossibile generare KPI e report.")
         return
@@ -354,13 +410,13 @@ def run_experiment_phase2(config: ExperimentConfigPhase2) -> None:
     csv_rows_hourly = []
     for r in all_hourly_results:
         csv_rows_hourly.append(
-            f"{r['hour']},{r['v_mech']},{r['sumP']},{r['u0_mech']},{r['v_eff']},{r['u0_eff']},{r['eff_ratio']},{r['n_winners']},{r.get('n_users_with_tasks', 0)},{r.get('n_defections_detected', 0)},{r.get('n_defections_total', 0)}\n"
+            f"{r.hour},{r.v_mech},{r.sumP},{r.u0_mech},{r.v_eff},{r.u0_eff},{r.eff_ratio},{r.n_winners},{r.n_users_with_tasks},{r.n_defections_detected},{r.n_defections_total}\n"
         )
     safe_csv_write(csv_header_hourly + "".join(csv_rows_hourly), os.path.join(day_output_dir, f"{config.day}_kpi_orari_fase2.csv"), logger)
-    v_mech_sum = sum(r["v_mech"] for r in all_hourly_results)
-    sumP_sum = sum(r["sumP"] for r in all_hourly_results)
-    v_eff_sum = sum(r["v_eff"] for r in all_hourly_results)
-    eff_ratio_mean = float(np.mean([r["eff_ratio"] for r in all_hourly_results]))
+    v_mech_sum = sum(r.v_mech for r in all_hourly_results)
+    sumP_sum = sum(r.sumP for r in all_hourly_results)
+    v_eff_sum = sum(r.v_eff for r in all_hourly_results)
+    eff_ratio_mean = float(np.mean([r.eff_ratio for r in all_hourly_results]))
     csv_daily = "v_mech_tot,sumP_tot,u0_mech_tot,v_eff_tot,u0_eff_tot,eff_ratio_media\n"
     csv_daily += f"{v_mech_sum},{sumP_sum},{v_mech_sum - sumP_sum},{v_eff_sum},{v_eff_sum - sumP_sum},{eff_ratio_mean}\n"
     safe_csv_write(csv_daily, os.path.join(day_output_dir, f"{config.day}_kpi_giornalieri_fase2.csv"), logger)
@@ -369,14 +425,14 @@ def run_experiment_phase2(config: ExperimentConfigPhase2) -> None:
         figures_dir = os.path.join(day_output_dir, "grafici")
         os.makedirs(figures_dir, exist_ok=True)
         plotter = ScientificPlotterRational(output_dir=figures_dir, lang="it", dpi=config.plot_dpi, style="publication")
-        hours = [r["hour"] for r in all_hourly_results]
-        v_mech_arr = [r["v_mech"] for r in all_hourly_results]
-        v_eff_arr = [r["v_eff"] for r in all_hourly_results]
-        u0_mech_arr = [r["u0_mech"] for r in all_hourly_results]
-        u0_eff_arr = [r["u0_eff"] for r in all_hourly_results]
+        hours = [r.hour for r in all_hourly_results]
+        v_mech_arr = [r.v_mech for r in all_hourly_results]
+        v_eff_arr = [r.v_eff for r in all_hourly_results]
+        u0_mech_arr = [r.u0_mech for r in all_hourly_results]
+        u0_eff_arr = [r.u0_eff for r in all_hourly_results]
         total_profiles = {prof: 0 for prof in PROFILE_NAMES}
         for r in all_hourly_results:
-            for prof, count in r["winner_profiles"].items():
+            for prof, count in r.winner_profiles.items():
                 if prof in total_profiles:
                     total_profiles[prof] += count
         plotter.plot_mech_vs_eff_timeseries(
@@ -445,8 +501,17 @@ def main():
     parser.add_argument("--p_low", type=float, default=2.0, help="Percentile basso per normalizzazione colormap")
     parser.add_argument("--p_high", type=float, default=98.0, help="Percentile alto per normalizzazione colormap")
     parser.add_argument("--block", type=int, default=4, help="Ampiezza blocchi ore (non usato)")
-    parser.add_argument("--save_raw_logs", action="store_true", help="Salva eventuali log grezzi JSON/CSV (non usato)")
+    parser.add_argument("--save_raw_logs", action="store_true", help="Salva su disco gli oggetti orari completi (utenti, task, vincitori, diagnostica)")
     parser.add_argument("--no_verify", action="store_true", help="Disabilita la verifica delle proprietà IMCU")
+    parser.add_argument("--fast_verify", action="store_true", help="Verifica rapida delle proprietà IMCU (replay della traccia di selezione, senza clonare utenti)")
+    parser.add_argument("--verify_workers", type=int, default=0, help="Numero di processi paralleli per la verifica delle proprietà dei vincitori (0 = sequenziale)")
+    parser.add_argument("--lazy_greedy", action="store_true", help="Selezione lazy-greedy (CELF), stessi vincitori della greedy standard")
+    parser.add_argument("--incremental_payments", action="store_true", help="Pagamenti critici incrementali a partire dalla traccia di selezione")
+    parser.add_argument("--compiled_coverage", action="store_true", help="Valori marginali su modello di copertura NumPy compilato")
+    parser.add_argument("--etl_workers", type=int, default=0, help="Numero di processi paralleli per l'ETL (0 = sequenziale)")
+    parser.add_argument("--dataset_out", default=None, help="Percorso del dataset ETL condiviso")
+    parser.add_argument("--mc_replications", type=int, default=0, help="Repliche Monte Carlo dell'azzardo morale per ora (0 = disabilitato)")
+    parser.add_argument("--validation", choices=VALIDATION_LEVELS, default="full", help="Validazione utenti nell'asta: full (ogni costruzione), hourly (una volta per snapshot), off")
     args = parser.parse_args()
     config = ExperimentConfigPhase2(
         raw_data_path=args.raw,
@@ -468,11 +533,20 @@ def main():
         random_seed=args.seed,
         save_raw_logs=args.save_raw_logs,
         verify_properties=not args.no_verify,
+        fast_verification=args.fast_verify,
+        lazy_greedy=args.lazy_greedy,
+        incremental_payments=args.incremental_payments,
+        compiled_coverage=args.compiled_coverage,
+        verification_workers=args.verify_workers,
         rationality_distribution=args.rationality,
         defection_mode=args.defection,
         fft_type=args.fft,
         task_value_min=args.value_min,
         task_value_max=args.value_max,
+        etl_workers=args.etl_workers,
+        dataset_out=args.dataset_out,
+        moral_hazard_replications=args.mc_replications,
+        validation_level=args.validation,
     )
     try:
         run_experiment_phase2(config)
@@ -17,7 +17,7 @@ for p in [str(_fase1_dir), str(_fase2_dir)]:
         sys.path.insert(0, p)
 
 try:
-    from Fase_2.classes_bounded import BoundedRationalUser as User, compute_anomaly_threshold
+    from Fase_2.classes_bounded import BoundedRationalUser as User, compute_anomaly_threshold, moral_hazard_coverage, simulate_moral_hazard_replications, summarize_replications
 except ImportError:
     try:
         from Fase_1.classes import User
@@ -26,7 +26,7 @@ except ImportError:
         raise ImportError(f"Impossibile importare User/Task dalla Fase 2 o Fase 1: {e}\nVerificare che esista classes_bounded.py o Fase_1/classes.py")
 
 try:
-    from Fase_1.imcu import IMCUAuction, IMCUDiagnostics, _unique_tasks
+    from Fase_1.imcu import IMCUAuction, IMCUDiagnostics, _unique_tasks, _as_list, validate_users_cached
     import Fase_1.imcu as imcu_base
 except ImportError as e:
     raise ImportError(f"Impossibile importare Fase_1.imcu: {e}\nVerificare che esista Fase_1/__init__.py e Fase_1/imcu.py")
@@ -37,6 +37,8 @@ logger = logging.getLogger(__name__)
 class IMCURationalConfig:
     BID_DEVIATION_WARNING_PCT: float = 15.0
     SIMULATE_MORAL_HAZARD: bool = True
+    MORAL_HAZARD_REPLICATIONS: int = 0
+    MORAL_HAZARD_CONFIDENCE: float = 0.95
 
 class BoundedRationalityMetrics(TypedDict, total=False):
     avg_rationality_all: float
@@ -108,6 +110,7 @@ def _validate_user_rational(user: User) -> None:
 def _validate_users_rational(users: Optional[List[User]]) -> List[User]:
     if users is None:
         raise TypeError("La lista 'users' è None.\nÈ necessario passare una lista (anche vuota) di `BoundedRationalUser`.")
+    users = _as_list(users)
     if not isinstance(users, list):
         raise TypeError(f"L'input 'users' deve essere una lista, ricevuto: {type(users).__name__}.\nVerificare la chiamata: run_imcu_auction_bounded(users=[...])")
     if not users:
@@ -117,17 +120,26 @@ def _validate_users_rational(users: Optional[List[User]]) -> List[User]:
     return sorted(users, key=lambda u: u.id)
 
 class IMCUAuctionRational(IMCUAuction):
-    def __init__(self, users: List[User], debug: bool = True, verify_properties: bool = True, check_truthfulness_acceptance: bool = True, simulate_moral_hazard: bool = None):
-        validated = _validate_users_rational(users)
-        super().__init__(validated, debug, verify_properties)
+    def __init__(self, users: List[User], debug: bool = True, verify_properties: bool = True, check_truthfulness_acceptance: bool = True, simulate_moral_hazard: bool = None, lazy_greedy: bool = False, incremental_payments: bool = False, compiled_coverage: bool = False, fast_verification: bool = False, verification_workers: int = 0, moral_hazard_replications: Optional[int] = None, moral_hazard_rng: Optional[np.random.Generator] = None, validation: str = "full"):
+        super().__init__(users, debug, verify_properties, lazy_greedy=lazy_greedy, incremental_payments=incremental_payments, compiled_coverage=compiled_coverage, fast_verification=fast_verification, verification_workers=verification_workers, validation=validation)
         self.check_truthfulness_acceptance = check_truthfulness_acceptance
         if simulate_moral_hazard is None:
             simulate_moral_hazard = IMCURationalConfig.SIMULATE_MORAL_HAZARD
         self.simulate_moral_hazard = simulate_moral_hazard
-        self._original_users = validated
-        self._eligible_users = validated
-        logger.info(f"IMCUAuctionRational inizializzata: {len(validated)} utenti, simula_azzardo_morale={self.simulate_moral_hazard}, controlla_accettazione_fft={self.check_truthfulness_acceptance}")
+        if moral_hazard_replications is None:
+            moral_hazard_replications = IMCURationalConfig.MORAL_HAZARD_REPLICATIONS
+        if moral_hazard_replications < 0:
+            raise ValueError(f"Il numero di repliche Monte Carlo (moral_hazard_replications) non può essere negativo, ricevuto: {moral_hazard_replications}")
+        self.moral_hazard_replications = moral_hazard_replications
+        self.moral_hazard_rng = moral_hazard_rng
+        self._reputation_exante: Dict[int, float] = {}
+        self._original_users = self.users
+        self._eligible_users = self.users
+        logger.info(f"IMCUAuctionRational inizializzata: {len(self.users)} utenti, simula_azzardo_morale={self.simulate_moral_hazard}, controlla_accettazione_fft={self.check_truthfulness_acceptance}")
     
+    def _validated_users(self, users: List[User], validation: str) -> List[User]:
+        return validate_users_cached(users, _validate_users_rational, validation)
+
     def _check_properties(self, winners: List[User], payments: Dict[int, float]) -> Dict[str, Any]:
         report = super()._check_properties(winners, payments)
         if "Truthfulness" in report:
@@ -266,6 +278,8 @@ class IMCUAuctionRational(IMCUAuction):
             deficit_expost = (u0_expost < 0)
             ir_breakdown_expost = (ir_violation_rate_expost > 0.05)
             diag['mechanism_breakdown_expost'] = {'deficit': deficit_expost, 'ir_violation': ir_breakdown_expost, 'severity': int(deficit_expost) + int(ir_breakdown_expost), 'note': "Diagnosi di rottura ex-post (dopo defezioni). Estensione oltre l'Assunzione 2.1 di Yang (2015)."}
+        if self.moral_hazard_replications and winners:
+            diag.update(self._monte_carlo_moral_hazard(winners, payments))
         tot_penalty = sum(u.penalty_accumulated for u in winners if hasattr(u, 'penalty_accumulated'))
         diag['total_penalties_accumulated'] = float(tot_penalty)
         if winners:
@@ -292,6 +306,28 @@ class IMCUAuctionRational(IMCUAuction):
         diag['eligible_users_count'] = len(self._eligible_users)
         return diag
     
+    def _monte_carlo_moral_hazard(self, winners: List[User], payments: Dict[int, float]) -> Dict[str, Any]:
+        n = len(winners)
+        coverage, task_values = moral_hazard_coverage(winners)
+        reputation = np.fromiter((self._reputation_exante.get(w.id, w.reputation) for w in winners), dtype=float, count=n)
+        winner_payments = np.fromiter((payments.get(w.id, 0.0) for w in winners), dtype=float, count=n)
+        samples = simulate_moral_hazard_replications(
+            p_defect_base=np.fromiter((w.p_defect_base for w in winners), dtype=float, count=n),
+            reputation=reputation,
+            payments=winner_payments,
+            costs=np.fromiter((w.cost for w in winners), dtype=float, count=n),
+            coverage=coverage,
+            task_values=task_values,
+            n_replications=self.moral_hazard_replications,
+            rng=self.moral_hazard_rng,
+            penalties=np.fromiter((w.detection_penalty(p, r) for w, p, r in zip(winners, winner_payments.tolist(), reputation.tolist())), dtype=float, count=n),
+            guaranteed=np.fromiter((w.completion_guaranteed() for w in winners), dtype=bool, count=n)
+        )
+        summary = summarize_replications(samples, IMCURationalConfig.MORAL_HAZARD_CONFIDENCE)
+        summary['mc_replications'] = int(self.moral_hazard_replications)
+        logger.info(f"Monte Carlo azzardo morale ({self.moral_hazard_replications} repliche): v_eff={summary['mc_v_eff_mean']:.2f} [{summary['mc_v_eff_ci_lower']:.2f}, {summary['mc_v_eff_ci_upper']:.2f}] euro, completamento={summary['mc_completion_rate_mean']:.3f} [{summary['mc_completion_rate_ci_lower']:.3f}, {summary['mc_completion_rate_ci_upper']:.3f}], violazioni IR={summary['mc_ir_violation_rate_mean']:.3f}")
+        return summary
+
     def run(self) -> Tuple[Set[int], Dict[int, float], IMCUDiagnostics]:
         logger.info("Esecuzione asta IMCU base (selezione e pagamento)...")
         winners_set, payments, diagnostics = super().run()
@@ -301,6 +337,7 @@ class IMCUAuctionRational(IMCUAuction):
             w.utility = w.payment - w.cost
             w.is_winner = True
         logger.info(f"Asta (ex-ante) completata: {len(winners)} vincitori, somma pagamenti={sum(payments.values()):.2f} euro")
+        self._reputation_exante = {w.id: w.reputation for w in winners}
         if self.simulate_moral_hazard:
             logger.info("Simulazione azzardo morale (defezioni probabilistiche)...")
             for w in winners:
@@ -312,10 +349,10 @@ class IMCUAuctionRational(IMCUAuction):
         logger.info("Asta IMCU razionale (Fase 2) completata con successo.")
         return winners_set, payments, diagnostics
 
-def run_imcu_auction_bounded(users: List[User], debug: bool = True, debug_level: str = "full", verify_properties: bool = True, check_truthfulness_acceptance: bool = True, simulate_moral_hazard: bool = None) -> Tuple[Set[int], Dict[int, float], Dict[str, Any]]:
+def run_imcu_auction_bounded(users: List[User], debug: bool = True, debug_level: str = "full", verify_properties: bool = True, check_truthfulness_acceptance: bool = True, simulate_moral_hazard: bool = None, lazy_greedy: bool = False, incremental_payments: bool = False, compiled_coverage: bool = False, fast_verification: bool = False, verification_workers: int = 0, moral_hazard_replications: Optional[int] = None, moral_hazard_rng: Optional[np.random.Generator] = None, validation: str = "full") -> Tuple[Set[int], Dict[int, float], Dict[str, Any]]:
     if debug_level not in ("none", "summary", "full"):
         raise ValueError(f"Il livello di debug (debug_level) deve essere 'none', 'summary' o 'full', ricevuto: '{debug_level}'")
-    auction = IMCUAuctionRational(users, debug=debug, verify_properties=verify_properties, check_truthfulness_acceptance=check_truthfulness_acceptance, simulate_moral_hazard=simulate_moral_hazard)
+    auction = IMCUAuctionRational(users, debug=debug, verify_properties=verify_properties, check_truthfulness_acceptance=check_truthfulness_acceptance, simulate_moral_hazard=simulate_moral_hazard, lazy_greedy=lazy_greedy, incremental_payments=incremental_payments, compiled_coverage=compiled_coverage, fast_verification=fast_verification, verification_workers=verification_workers, moral_hazard_replications=moral_hazard_replications, moral_hazard_rng=moral_hazard_rng, validation=validation)
     winners_set, payments, diag_obj = auction.run()
     all_task_ids = {t.id for u in auction.users for t in _unique_tasks(u.tasks)}
     diagnostics = {"winners_count": diag_obj.winners_count, "covered_tasks_count": diag_obj.covered_tasks_count, "payments_sum": diag_obj.payments_sum, "platform_value_vS": diag_obj.platform_value_vS, "platform_utility_u0": diag_obj.platform_utility_u0, "selection_time_s": diag_obj.selection_time_s, "payment_time_s": diag_obj.payment_time_s, "total_time_s": diag_obj.total_time_s, "mv_calls_selection": diag_obj.mv_calls_selection, "mv_calls_payment": diag_obj.mv_calls_payment, "property_checks": diag_obj.property_checks, "n_users": len(auction._original_users), "m_tasks": len(all_task_ids)}
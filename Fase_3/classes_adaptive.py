@@ -3,7 +3,7 @@ import sys
 import math
 import logging
 import time
-from typing import Any, Optional, List, Dict
+from typing import Any, Optional, List, Dict, Iterable, Sequence, Set, Tuple
 import numpy as np
 from pathlib import Path
 
@@ -111,6 +111,47 @@ class TaskAdaptive(TaskBounded):
         self.completion_timestamp: Optional[float] = None
         self.feedback_notes = str(feedback_notes)
     
+    @classmethod
+    def _from_columns(
+        cls,
+        task_id: int,
+        lat: float,
+        lon: float,
+        value: float,
+        is_community_task: bool = False,
+        quality_target: Optional[float] = None,
+        group_id: Optional[int] = None,
+        required_reliability: float = 0.0,
+        feedback_weight: float = 1.0,
+        feedback_notes: str = ""
+    ) -> TaskAdaptive:
+        task = super()._from_columns(task_id, lat, lon, value, is_community_task, quality_target, group_id)
+        task.required_reliability = float(required_reliability)
+        task.feedback_weight = float(feedback_weight)
+        task.feedback_quality = None
+        task.completion_timestamp = None
+        task.feedback_notes = str(feedback_notes)
+        return task
+    
+    @classmethod
+    def _validate_columns(cls, columns: Dict[str, Sequence[Any]]) -> None:
+        super()._validate_columns(columns)
+        if "required_reliability" in columns:
+            reliability = np.asarray(columns["required_reliability"], dtype=float)
+            invalid = ~((reliability >= 0.0) & (reliability <= 1.0))
+            if invalid.any():
+                raise ValueError(
+                    f"required_reliability deve essere in [0, 1], "
+                    f"ricevuto: {reliability[invalid][0]}"
+                )
+        if "feedback_weight" in columns:
+            weights = np.asarray(columns["feedback_weight"], dtype=float)
+            if (weights < 0).any():
+                raise ValueError(
+                    f"feedback_weight non può essere negativo, "
+                    f"ricevuto: {weights[weights < 0][0]}"
+                )
+    
     def mark_completed_by_platform(
         self,
         quality: float,
@@ -362,8 +403,14 @@ class AdaptiveUser(BoundedRationalUser):
                 f"Utente {self.id}: stato di apprendimento gap resettato ai prior"
             )
 
+    def completion_guaranteed(self) -> bool:
+        return self.rationality_level >= RATIONALITY_MAX
+
+    def detection_penalty(self, payment: float, reputation: float) -> float:
+        return max(MIN_PENALTY_FLOOR * payment, PENALTY_BASE_FACTOR * payment * (1.0 + (1.0 - reputation)))
+
     def attempt_task_completion(self) -> bool:
-        if self.rationality_level >= RATIONALITY_MAX:
+        if self.completion_guaranteed():
             self.completed = True
             self.actually_completed = True
             self.p_defect = 0.0
@@ -396,11 +443,7 @@ class AdaptiveUser(BoundedRationalUser):
             return True
         base_penalty = PENALTY_BASE_FACTOR * self.payment
         reputation_multiplier = 1.0 + (1.0 - self.reputation)
-        adaptive_penalty = base_penalty * reputation_multiplier
-        final_penalty = max(
-            MIN_PENALTY_FLOOR * self.payment,
-            adaptive_penalty
-        )
+        final_penalty = self.detection_penalty(self.payment, self.reputation)
         self.penalty_accumulated += final_penalty
         penalty_rep = PENALTY_REPUTATION_DECAY * self.reputation
         self.reputation = max(0.0, self.reputation - penalty_rep)
@@ -501,6 +544,140 @@ class AdaptiveUser(BoundedRationalUser):
         }
 
 
+class HourlyContext:
+    __slots__ = ("users_by_id", "tasks_by_id", "payments", "winner_ids", "cohort")
+
+    def __init__(self, users: Iterable[AdaptiveUser], tasks: Iterable[TaskAdaptive], cohort: Optional[CohortState] = None) -> None:
+        self.cohort = cohort
+        self.users_by_id: Dict[int, AdaptiveUser] = {u.id: u for u in users}
+        self.tasks_by_id: Dict[int, TaskAdaptive] = {t.id: t for t in tasks}
+        self.payments: Dict[int, float] = {}
+        self.winner_ids: Set[int] = set()
+
+    def user(self, user_id: int) -> Optional[AdaptiveUser]:
+        return self.users_by_id.get(user_id)
+
+    def task(self, task_id: int) -> Optional[TaskAdaptive]:
+        return self.tasks_by_id.get(task_id)
+
+    def record_auction(self, winner_ids: Set[int], payments: Dict[int, float]) -> None:
+        self.winner_ids = set(winner_ids)
+        self.payments = dict(payments)
+
+
+class CohortState:
+    __slots__ = ("users", "ids", "rows_by_id", "rho_alpha", "rho_beta", "rho_observation_count", "estimated_rationality", "reputation_reliability", "reputation_quality", "reputation", "mdr_observation_count", "penalty_accumulated", "blacklist_strikes", "blacklisted_until")
+    FLOAT_FIELDS = ("rho_alpha", "rho_beta", "estimated_rationality", "reputation_reliability", "reputation_quality", "reputation")
+    INT_FIELDS = ("rho_observation_count", "mdr_observation_count")
+    LEARNING_FIELDS = FLOAT_FIELDS + INT_FIELDS
+    SANCTION_FIELDS = ("penalty_accumulated", "blacklist_strikes", "blacklisted_until")
+    STATE_FIELDS = LEARNING_FIELDS + SANCTION_FIELDS
+    INT_COLUMNS = INT_FIELDS + ("blacklist_strikes",)
+
+    def __init__(self, users: Sequence[AdaptiveUser]) -> None:
+        self.users = list(users)
+        self.ids = np.fromiter((u.id for u in self.users), dtype=np.int64, count=len(self.users))
+        self.rows_by_id: Dict[int, int] = {uid: i for i, uid in enumerate(self.ids.tolist())}
+        self.pull()
+
+    def __len__(self) -> int:
+        return len(self.users)
+
+    def pull(self, fields: Sequence[str] = STATE_FIELDS) -> None:
+        n = len(self.users)
+        rows = [tuple(getattr(u, name) for name in fields) for u in self.users]
+        columns = list(zip(*rows)) if n else [()] * len(fields)
+        for name, column in zip(fields, columns):
+            if name == "blacklisted_until":
+                column = [-np.inf if value is None else value for value in column]
+            setattr(self, name, np.array(column, dtype=np.int64 if name in self.INT_COLUMNS else float))
+
+    def push(self, rows: Optional[np.ndarray] = None, fields: Sequence[str] = STATE_FIELDS) -> None:
+        rows = np.arange(len(self.users)) if rows is None else np.asarray(rows, dtype=np.int64)
+        columns = [getattr(self, name)[rows].tolist() for name in fields]
+        if "blacklisted_until" in fields:
+            k = fields.index("blacklisted_until")
+            columns[k] = [None if value == -np.inf else value for value in columns[k]]
+        users = self.users
+        for i, values in zip(rows.tolist(), zip(*columns)):
+            user = users[i]
+            for name, value in zip(fields, values):
+                setattr(user, name, value)
+
+    def rows_of(self, users: Iterable[AdaptiveUser]) -> np.ndarray:
+        rows_by_id = self.rows_by_id
+        return np.fromiter((rows_by_id[u.id] for u in users), dtype=np.int64)
+
+    def eligible_mask(self, current_time: float, rows: Optional[np.ndarray] = None) -> np.ndarray:
+        rows = slice(None) if rows is None else rows
+        return (current_time > self.blacklisted_until[rows]) & (self.reputation[rows] >= REPUTATION_ABSOLUTE_MIN_THRESHOLD)
+
+    def update_platform_beliefs(self, winner_ids: Iterable[int]) -> Tuple[np.ndarray, List[int]]:
+        users = self.users
+        rows_by_id = self.rows_by_id
+        candidates = sorted(rows_by_id[uid] for uid in winner_ids if uid in rows_by_id)
+        kept, failed, success = [], [], []
+        owners, weights, qualities = [], [], []
+        for i in candidates:
+            user = users[i]
+            if not user.tasks:
+                continue
+            try:
+                user_weights, user_qualities = [], []
+                for task in user.tasks:
+                    if isinstance(task, TaskAdaptive) and task.feedback_quality is not None:
+                        user_weights.append(float(task.feedback_weight))
+                        user_qualities.append(float(task.feedback_quality))
+                completed = bool(user.actually_completed)
+            except Exception as e:
+                logger.error(f"Utente {user.id}: aggiornamento credenze: {e}", exc_info=True)
+                failed.append(user.id)
+                continue
+            owners.extend([len(kept)] * len(user_weights))
+            weights.extend(user_weights)
+            qualities.extend(user_qualities)
+            success.append(completed)
+            kept.append(i)
+        rows = np.asarray(kept, dtype=np.int64)
+        if not rows.size:
+            return rows, failed
+        success = np.asarray(success, dtype=bool)
+        weights = np.asarray(weights, dtype=float)
+        total_weight = np.bincount(np.asarray(owners, dtype=np.int64), weights=weights, minlength=rows.size)
+        quality_sum = np.bincount(np.asarray(owners, dtype=np.int64), weights=np.asarray(qualities, dtype=float) * weights, minlength=rows.size)
+        avg_quality = np.full(rows.size, 0.5)
+        np.divide(quality_sum, total_weight, out=avg_quality, where=total_weight > 0)
+        alpha = self.rho_alpha[rows] + np.where(success, RHO_OBS, 0.0)
+        beta = self.rho_beta[rows] + np.where(success, 0.0, RHO_OBS)
+        total = alpha + beta
+        raw_estimate = np.divide(alpha, total, out=np.zeros(rows.size), where=total > 0)
+        estimate = np.clip(RATIONALITY_MIN + raw_estimate * (RATIONALITY_MAX - RATIONALITY_MIN), RATIONALITY_MIN, RATIONALITY_MAX)
+        self.rho_alpha[rows] = alpha
+        self.rho_beta[rows] = beta
+        self.rho_observation_count[rows] += 1
+        self.estimated_rationality[rows] = np.where(total > 0, estimate, RATIONALITY_MIN)
+        decay = LAMBDA_REPUTATION_DECAY
+        current_weight = 1.0 - decay
+        reliability = decay * self.reputation_reliability[rows] + current_weight * success.astype(float)
+        quality = decay * self.reputation_quality[rows] + current_weight * np.where(success, avg_quality, 0.0)
+        self.reputation_reliability[rows] = reliability
+        self.reputation_quality[rows] = quality
+        self.mdr_observation_count[rows] += 1
+        if _MDR_TOTAL_WEIGHT <= 0:
+            self.reputation[rows] = 0.0
+        else:
+            self.reputation[rows] = np.clip((reliability * MDR_WEIGHT_RELIABILITY + quality * MDR_WEIGHT_QUALITY) / _MDR_TOTAL_WEIGHT, 0.0, 1.0)
+        self.push(rows, self.LEARNING_FIELDS)
+        return rows, failed
+
+    def reset_hour(self) -> None:
+        for u in self.users:
+            u.reset_state(reset_reputation=False, reset_learning=False)
+        self.pull()
+        self.penalty_accumulated[:] = 0.0
+        self.push(fields=("penalty_accumulated",))
+
+
 def check_adaptive_eligibility(
     user: AdaptiveUser, 
     task: TaskAdaptive, 
@@ -85,7 +85,7 @@ class DataManagerAdaptive(DataManagerRational):
                 f"Feedback weight critico deve rispettare 0 <= min <= max, "
                 f"ricevuto: min={min_feedback_weight_critical}, max={max_feedback_weight_critical}"
             )
-        tasks_f1: List[TaskBase] = super(DataManagerRational, self).create_tasks(
+        task_set = self.create_task_set(
             day=day, 
             hour=hour, 
             duration_hours=duration_hours, 
@@ -95,7 +95,7 @@ class DataManagerAdaptive(DataManagerRational):
             uniform_high=uniform_high, 
             seed=seed
         )
-        if not tasks_f1:
+        if not len(task_set):
             warnings.warn(
                 f"Nessun task generato nella finestra "
                 f"[{day} {hour}:00 + {duration_hours}h], ritorno lista vuota"
@@ -115,15 +115,16 @@ class DataManagerAdaptive(DataManagerRational):
             f"({high_value_threshold_pct*100:.0f} percentile, "
             f"range [{uniform_low:.2f}, {uniform_high:.2f}])"
         )
-        tasks_f3: List[TaskAdaptive] = []
+        quality_targets: List[Optional[float]] = []
+        required_reliabilities: List[float] = []
+        feedback_weights: List[float] = []
         critical_tasks_count = 0
-        for t_f1 in tasks_f1:
-            lat_f1, lon_f1 = t_f1.position
+        for task_id, task_value in zip(task_set.ids.tolist(), task_set.values.tolist()):
             req_rel = 0.0
             feed_weight = 1.0
             quality_target = None
-            if t_f1.value >= value_threshold:
-                normalized_value = (t_f1.value - value_threshold) / value_range_critical
+            if task_value >= value_threshold:
+                normalized_value = (task_value - value_threshold) / value_range_critical
                 normalized_value = max(0.0, min(1.0, normalized_value))
                 req_rel = (
                     min_reliability_critical + 
@@ -140,20 +141,21 @@ class DataManagerAdaptive(DataManagerRational):
                 critical_tasks_count += 1
                 required_rho = 0.3 + 0.7 * quality_target
                 logger.debug(
-                    f"Task {t_f1.id}: critico (v={t_f1.value:.2f} euro, norm={normalized_value:.2f}), "
+                    f"Task {task_id}: critico (v={task_value:.2f} euro, norm={normalized_value:.2f}), "
                     f"req_rel={req_rel:.2f}, quality_target={quality_target:.2f} "
                     f"(rho_min={required_rho:.2f}), weight={feed_weight:.1f}"
                 )
-            task_f3 = TaskAdaptive(
-                task_id=t_f1.id, 
-                x=lon_f1,
-                y=lat_f1,
-                value=t_f1.value,
-                quality_target=quality_target,
-                required_reliability=req_rel,
-                feedback_weight=feed_weight
-            )
-            tasks_f3.append(task_f3)
+            quality_targets.append(quality_target)
+            required_reliabilities.append(req_rel)
+            feedback_weights.append(feed_weight)
+        tasks_f3: List[TaskAdaptive] = task_set.with_task_cls(
+            TaskAdaptive,
+            columns={
+                "quality_target": quality_targets,
+                "required_reliability": required_reliabilities,
+                "feedback_weight": feedback_weights
+            }
+        ).to_list()
         critical_pct = (critical_tasks_count / len(tasks_f3) * 100) if tasks_f3 else 0.0
         logger.info(
             f"Creati {len(tasks_f3)} task adaptive fase 3, "
@@ -239,7 +241,8 @@ class DataManagerAdaptive(DataManagerRational):
         excluded_no_tasks = 0
         excluded_by_quality = 0
         task_counts = []
-        for user_f1 in users_f1:
+        distances_m = self.distance_matrix(users_f1, tasks).tolist()
+        for user_f1, user_distances_m in zip(users_f1, distances_m):
             rationality_level = self._generate_rationality(rationality_distribution)
             user = AdaptiveUser(
                 user_id=user_f1.id, 
@@ -251,8 +254,7 @@ class DataManagerAdaptive(DataManagerRational):
             )
             candidate_tasks: List[TaskAdaptive] = []
             tasks_filtered_quality = 0
-            for task in tasks:
-                dist_m = user.calculate_distance_to(task)
+            for task, dist_m in zip(tasks, user_distances_m):
                 if dist_m > task_radius_m:
                     continue
                 if prefilter_quality and task.quality_target is not None:
@@ -1,7 +1,7 @@
 from __future__ import annotations
 import os
 import sys
-from typing import Dict, List, Any
+from typing import Callable, Dict, List, Any, Optional
 from dataclasses import dataclass
 import argparse
 import datetime as dt
@@ -22,7 +22,8 @@ try:
     from Fase_1.fase_1 import (
         setup_experiment_logger, 
         save_experiment_metadata, 
-        safe_csv_write
+        safe_csv_write,
+        spill_hour_objects
     )
     from Fase_1.classes import Task
 except ImportError as e:
@@ -30,14 +31,15 @@ except ImportError as e:
 
 try:
     from Fase_2.fase_2 import ExperimentConfigPhase2
-    from Fase_2.classes_bounded import set_random_seed
+    from Fase_2.classes_bounded import set_random_seed, generate_bids
 except ImportError as e:
     raise ImportError(f"Impossibile importare moduli fase 2: {e}")
 
 try:
     from Fase_3.data_manager_adaptive import DataManagerAdaptive
-    from Fase_3.classes_adaptive import AdaptiveUser, TaskAdaptive
+    from Fase_3.classes_adaptive import AdaptiveUser, TaskAdaptive, CohortState, HourlyContext
     from Fase_3.imcu_adaptive import run_imcu_auction_adaptive
+    from Fase_1.imcu import VALIDATION_LEVELS
     from Fase_3.plot_adaptive import ScientificPlotterAdaptive 
 except ImportError as e:
     raise ImportError(f"Impossibile importare moduli core fase 3: {e}")
@@ -102,6 +104,7 @@ class ExperimentConfigPhase3(ExperimentConfigPhase2):
     max_quality_target_critical: float = 0.60
     min_feedback_weight_critical: float = 1.5
     max_feedback_weight_critical: float = 2.5
+    enforce_reliability: bool = True
 
     def validate(self) -> None:
         super().validate()
@@ -129,6 +132,29 @@ class ExperimentConfigPhase3(ExperimentConfigPhase2):
         }
         return base_dict
 
+@dataclass(slots=True)
+class HourlyResultPhase3:
+    day: str
+    hour: int
+    n_tasks: int
+    n_users_eligible: int
+    n_winners: int
+    v_mech: float
+    sumP: float
+    u0_mech: float
+    gap_metrics: Dict[str, Any]
+    payments: np.ndarray
+    winner_ids: np.ndarray
+    completed_winner_ids: np.ndarray
+    feedback_tasks_processed: int = 0
+    spill_path: Optional[str] = None
+
+def compact_gap_metrics(gap_m: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        key: value for key, value in gap_m.items()
+        if isinstance(value, (bool, int, float, np.integer, np.floating)) or key == "mechanism_health_expost"
+    }
+
 def compute_effective_value(winners: List[AdaptiveUser]) -> float:
     covered_tasks: Dict[int, Task] = {}
     for user in winners:
@@ -160,6 +186,7 @@ def compute_winners_profile_distribution(
 def assign_tasks_to_users(
     users: List[AdaptiveUser], 
     tasks: List[TaskAdaptive], 
+    dm: DataManagerAdaptive,
     radius_m: float,
     logger_instance: logging.Logger
 ) -> int:
@@ -173,15 +200,13 @@ def assign_tasks_to_users(
         return 0
     users_with_tasks = 0
     total_assignments = 0
+    task_index = dm.build_task_index(tasks, radius_m=radius_m)
     for user in users:
-        candidate_tasks = []
-        for task in tasks:
-            try:
-                dist_m = user.calculate_distance_to(task)
-                if dist_m <= radius_m:
-                    candidate_tasks.append(task)
-            except Exception as e:
-                logger_instance.error(f"Calcolo distanza user {user.id} - task {task.id}: {e}")
+        try:
+            candidate_tasks = task_index.query(user, radius_m)[0]
+        except Exception as e:
+            logger_instance.error(f"Calcolo distanze user {user.id}: {e}")
+            candidate_tasks = []
         user.set_tasks(candidate_tasks)
         if candidate_tasks:
             users_with_tasks += 1
@@ -193,9 +218,18 @@ def assign_tasks_to_users(
     )
     return users_with_tasks
 
+def sample_feedback_quality(rationality: np.ndarray) -> np.ndarray:
+    quality = np.ones(len(rationality))
+    sampled = rationality < 0.75
+    if sampled.any():
+        rho = rationality[sampled]
+        low = np.where(rho >= 0.60, 0.7, np.where(rho >= 0.45, 0.5, 0.3))
+        high = np.where(rho >= 0.60, 1.0, np.where(rho >= 0.45, 0.9, 0.7))
+        quality[sampled] = np.random.uniform(low, high)
+    return quality
+
 def process_feedback_quality_loop(
-    all_users: List[AdaptiveUser],
-    tasks_for_this_hour: List[TaskAdaptive],
+    context: HourlyContext,
     diagnostics: Dict[str, Any],
     current_time_sec: float,
     config_day: str,
@@ -214,37 +248,35 @@ def process_feedback_quality_loop(
         f"  Mappa task completati: {len(completed_tasks_map)} vincitori, "
         f"totale task={sum(len(v) for v in completed_tasks_map.values())}"
     )
+    pairs = []
     for winner_id, task_ids in completed_tasks_map.items():
-        winner = next((u for u in all_users if u.id == winner_id), None)
+        winner = context.user(winner_id)
         if not winner:
             logger_instance.warning(f"  Utente {winner_id} non trovato")
             continue
         for task_id in task_ids:
-            task = next((t for t in tasks_for_this_hour if t.id == task_id), None)
+            task = context.task(task_id)
             if not task or not isinstance(task, TaskAdaptive):
                 continue
-            try:
-                if winner.rationality_level >= 0.75:
-                    quality = 1.0
-                elif winner.rationality_level >= 0.60:
-                    quality = float(np.random.uniform(0.7, 1.0))
-                elif winner.rationality_level >= 0.45:
-                    quality = float(np.random.uniform(0.5, 0.9))
-                else:
-                    quality = float(np.random.uniform(0.3, 0.7))
-                task.mark_completed_by_platform(
-                    quality=quality,
-                    timestamp=current_time_sec,
-                    notes=f"User {winner.id} (rho={winner.rationality_level:.3f})"
-                )
-                feedback_count += 1
-                logger_instance.debug(
-                    f"  Task {task.id}: qualita={quality:.3f}, "
-                    f"user={winner.id} (rho={winner.rationality_level:.3f})"
-                )
-            except Exception as e:
-                feedback_errors += 1
-                logger_instance.error(f"  Feedback task {task.id}: {e}", exc_info=True)
+            pairs.append((winner, task))
+    qualities = sample_feedback_quality(
+        np.fromiter((w.rationality_level for w, _ in pairs), dtype=float, count=len(pairs))
+    )
+    for (winner, task), quality in zip(pairs, qualities.tolist()):
+        try:
+            task.mark_completed_by_platform(
+                quality=quality,
+                timestamp=current_time_sec,
+                notes=f"User {winner.id} (rho={winner.rationality_level:.3f})"
+            )
+            feedback_count += 1
+            logger_instance.debug(
+                f"  Task {task.id}: qualita={quality:.3f}, "
+                f"user={winner.id} (rho={winner.rationality_level:.3f})"
+            )
+        except Exception as e:
+            feedback_errors += 1
+            logger_instance.error(f"  Feedback task {task.id}: {e}", exc_info=True)
     logger_instance.info(
         f"[{config_day} h{hour:02d}] Feedback: {feedback_count} task processati, "
         f"{feedback_errors} con problemi"
@@ -291,23 +323,23 @@ def save_final_user_state(
 def generate_summary_report_phase3(
     output_dir: str, 
     day: str, 
-    hourly_results: List[Dict[str, Any]], 
+    hourly_results: List[HourlyResultPhase3], 
     config: ExperimentConfigPhase3, 
     logger_instance: logging.Logger
 ) -> None:
     report_path = os.path.join(output_dir, f"{day}_{config.report_name}")
     try:
-        hours = [r["hour"] for r in hourly_results]
-        v_mech_arr = [r.get("v_mech", 0) for r in hourly_results]
-        v_eff_arr = [r.get('gap_metrics', {}).get('v_eff_expost', 0) for r in hourly_results]
-        u0_eff_arr = [r.get('gap_metrics', {}).get('u0_expost', 0) for r in hourly_results]
-        mae_rho_arr = [r.get('gap_metrics', {}).get('mae_rho_estimation', np.nan) for r in hourly_results]
-        avg_rho_true = [r.get('gap_metrics', {}).get('avg_rho_true_eligible', np.nan) for r in hourly_results]
-        avg_rho_est = [r.get('gap_metrics', {}).get('avg_rho_estimated_eligible', np.nan) for r in hourly_results]
-        avg_rep = [r.get('gap_metrics', {}).get('avg_reputation_agg_eligible', np.nan) for r in hourly_results]
-        payment_base_arr = [r.get('gap_metrics', {}).get('sum_payment_base', 0) for r in hourly_results]
-        payment_final_arr = [r.get('gap_metrics', {}).get('sum_payment_final', 0) for r in hourly_results]
-        health_reports = [r.get('gap_metrics', {}).get('mechanism_health_expost', {}) for r in hourly_results]
+        hours = [r.hour for r in hourly_results]
+        v_mech_arr = [r.v_mech for r in hourly_results]
+        v_eff_arr = [r.gap_metrics.get('v_eff_expost', 0) for r in hourly_results]
+        u0_eff_arr = [r.gap_metrics.get('u0_expost', 0) for r in hourly_results]
+        mae_rho_arr = [r.gap_metrics.get('mae_rho_estimation', np.nan) for r in hourly_results]
+        avg_rho_true = [r.gap_metrics.get('avg_rho_true_eligible', np.nan) for r in hourly_results]
+        avg_rho_est = [r.gap_metrics.get('avg_rho_estimated_eligible', np.nan) for r in hourly_results]
+        avg_rep = [r.gap_metrics.get('avg_reputation_agg_eligible', np.nan) for r in hourly_results]
+        payment_base_arr = [r.gap_metrics.get('sum_payment_base', 0) for r in hourly_results]
+        payment_final_arr = [r.gap_metrics.get('sum_payment_final', 0) for r in hourly_results]
+        health_reports = [r.gap_metrics.get('mechanism_health_expost', {}) for r in hourly_results]
         completion_rate_arr = [h.get('completion_rate_tasks', 0) for h in health_reports]
         ir_violation_rate_arr = [h.get('ir_violation_rate', 0) for h in health_reports]
         health_score_arr = [h.get('health_score', 0) for h in health_reports]
@@ -445,7 +477,29 @@ def generate_summary_report_phase3(
     except Exception as e:
         logger_instance.error(f"Generazione report: {e}", exc_info=True)
 
-def run_experiment_phase3(config: ExperimentConfigPhase3) -> None:
+def hourly_kpi_row_phase3(result: HourlyResultPhase3) -> Dict[str, Any]:
+    gap_m = result.gap_metrics
+    health_m = gap_m.get("mechanism_health_expost", {})
+    return {
+        "day": result.day,
+        "hour": result.hour,
+        "n_tasks": float(result.n_tasks),
+        "n_users_eligible": float(result.n_users_eligible),
+        "n_winners": float(result.n_winners),
+        "v_mech": float(result.v_mech),
+        "sumP": float(result.sumP),
+        "u0_mech": float(result.u0_mech),
+        "v_eff": float(gap_m.get("v_eff_expost", 0.0)),
+        "u0_eff": float(gap_m.get("u0_expost", 0.0)),
+        "sumP_final": float(gap_m.get("sum_payment_final", 0.0)),
+        "completion_rate": float(health_m.get("completion_rate_tasks", 0.0)),
+        "health_score": float(health_m.get("health_score", 0.0)),
+        "mae_rho": float(gap_m.get("mae_rho_estimation", float("nan"))),
+        "incentive_eur": float(gap_m.get("total_incentive_bonus_malus", 0.0)),
+        "feedback_tasks": float(result.feedback_tasks_processed),
+    }
+
+def run_experiment_phase3(config: ExperimentConfigPhase3, kpi_sink: Optional[Callable[[Dict[str, Any]], None]] = None) -> None:
     experiment_id = f"imcu_fase3_{config.day}_{config.hour_start:02d}-{config.hour_end:02d}"
     day_output_dir = os.path.join(config.output_dir, f"giorno_{config.day}_fase3")
     os.makedirs(day_output_dir, exist_ok=True)
@@ -469,21 +523,19 @@ def run_experiment_phase3(config: ExperimentConfigPhase3) -> None:
     logger_exp.info(f"Seed globale: {config.random_seed}")
     dm = DataManagerAdaptive(
         raw_txt_path=config.raw_data_path, 
-        out_dir=os.path.join(config.output_dir, "dataset_processato"), 
+        out_dir=config.dataset_out if config.dataset_out else os.path.join(config.output_dir, "dataset_processato"), 
         bbox=config.bbox, 
         random_seed=config.random_seed
     )
-    partitions_exist = (
-        os.path.exists(dm.part_dir) and 
-        len([f for f in os.listdir(dm.part_dir) if f.endswith('.csv')]) > 0
-    )
-    if not partitions_exist:
+    if dm.needs_etl():
         logger_exp.info("Avvio processo etl")
         try:
             dm.parse_raw_to_csv(
                 compute_total_lines=True, 
                 partition_by="day-hour", 
-                write_master_sample=True
+                write_master_sample=True,
+                workers=config.etl_workers,
+                incremental=True
             )
             logger_exp.info("Etl completato")
         except Exception as e:
@@ -507,8 +559,9 @@ def run_experiment_phase3(config: ExperimentConfigPhase3) -> None:
         f"Popolazione creata: {len(all_users)} utenti, "
         f"rho medio={np.mean([u.rationality_level for u in all_users]):.3f}"
     )
+    cohort = CohortState(all_users)
     hours_range = list(range(config.hour_start, config.hour_end))
-    all_hourly_diagnostics = []
+    all_hourly_diagnostics: List[HourlyResultPhase3] = []
     all_winner_ids_fase3 = set()
     for hour_idx, hour in enumerate(hours_range):
         current_time_sec = float(hour * 3600)
@@ -542,6 +595,7 @@ def run_experiment_phase3(config: ExperimentConfigPhase3) -> None:
             users_with_tasks = assign_tasks_to_users(
                 all_users, 
                 tasks_for_this_hour, 
+                dm,
                 config.task_radius_m,
                 logger_exp
             )
@@ -551,6 +605,7 @@ def run_experiment_phase3(config: ExperimentConfigPhase3) -> None:
             logger_exp.info(f"[{config.day} h{hour:02d}] Step 3: selezione bundle e generazione bid")
             PARAM_MAX_TASKS = 5
             users_ready_to_bid = []
+            bidders = []
             bid_generated_count = 0
             for user in all_users:
                 if not user.tasks:
@@ -562,15 +617,17 @@ def run_experiment_phase3(config: ExperimentConfigPhase3) -> None:
                     )
                     if selected_bundle:
                         user.set_tasks(selected_bundle)
-                        user.generate_bid()
-                        if user.bid >= 0:
-                            users_ready_to_bid.append(user)
-                            bid_generated_count += 1
-                        else:
-                            logger_exp.warning(f"Utente {user.id}: bid={user.bid:.2f} non valido")
+                        bidders.append(user)
                 except Exception as e:
                     logger_exp.error(f"Utente {user.id}: selezione bundle: {e}", exc_info=True)
                     user.bid = -1.0
+            generate_bids(bidders, skip_invalid=True)
+            for user in bidders:
+                if user.bid >= 0:
+                    users_ready_to_bid.append(user)
+                    bid_generated_count += 1
+                else:
+                    logger_exp.warning(f"Utente {user.id}: bid={user.bid:.2f} non valido")
             logger_exp.info(
                 f"[{config.day} h{hour:02d}] Step 3: {bid_generated_count}/{users_with_tasks} "
                 f"utenti pronti (post-euristica, bid validi)"
@@ -579,19 +636,23 @@ def run_experiment_phase3(config: ExperimentConfigPhase3) -> None:
                 logger_exp.warning(f"[{config.day} h{hour:02d}] Nessun bid valido")
                 continue
             logger_exp.info(f"[{config.day} h{hour:02d}] Step 4: esecuzione asta")
-            winners_set, _, diagnostics = run_imcu_auction_adaptive(
+            context = HourlyContext(all_users, tasks_for_this_hour, cohort=cohort)
+            winners_set, payments, diagnostics = run_imcu_auction_adaptive(
                 users=users_ready_to_bid,
                 tasks=tasks_for_this_hour,
                 current_time=current_time_sec,
                 debug=True,
-                debug_level="summary"
+                debug_level="summary",
+                context=context,
+                compiled_coverage=config.compiled_coverage,
+                validation=config.validation_level,
+                enforce_reliability=config.enforce_reliability
             )
             n_winners = diagnostics.get("winners_count", 0)
             all_winner_ids_fase3.update(winners_set)
             logger_exp.info(f"[{config.day} h{hour:02d}] Step 4: {n_winners} vincitori")
             feedback_count = process_feedback_quality_loop(
-                all_users=all_users,
-                tasks_for_this_hour=tasks_for_this_hour,
+                context=context,
                 diagnostics=diagnostics,
                 current_time_sec=current_time_sec,
                 config_day=config.day,
@@ -599,41 +660,48 @@ def run_experiment_phase3(config: ExperimentConfigPhase3) -> None:
                 logger_instance=logger_exp
             )
             logger_exp.info(f"[{config.day} h{hour:02d}] Step 6: aggiornamento credenze")
-            learning_count = 0
-            for user in all_users:
-                try:
-                    user.update_platform_beliefs(
-                        was_winner=(user.id in winners_set),
-                        task_list=user.tasks
-                    )
-                    learning_count += 1
-                    if user.id in winners_set:
-                        logger_exp.debug(
-                            f"  User {user.id} (vincitore): rho_stimato={user.estimated_rationality:.3f}, "
-                            f"r_stimato={user.reputation:.3f}"
-                        )
-                except Exception as e:
-                    logger_exp.error(f"Utente {user.id}: aggiornamento credenze: {e}", exc_info=True)
+            learned_rows, failed_ids = cohort.update_platform_beliefs(context.winner_ids)
+            learning_count = len(cohort) - len(failed_ids)
+            for i in learned_rows.tolist():
+                logger_exp.debug(
+                    f"  User {cohort.users[i].id} (vincitore): rho_stimato={cohort.estimated_rationality[i]:.3f}, "
+                    f"r_stimato={cohort.reputation[i]:.3f}"
+                )
             logger_exp.info(
                 f"[{config.day} h{hour:02d}] Step 6: {learning_count} utenti aggiornati "
                 f"(vincitori={len(winners_set)}, perdenti={learning_count - len(winners_set)})"
             )
             gap_m = diagnostics.get("property_checks", {}).get("AdaptiveGAPMetrics", {})
             v_mech = gap_m.get("v_mech", sum(t.value for t in tasks_for_this_hour))
-            hourly_result = {
-                "day": config.day,
-                "hour": hour,
-                "n_tasks": len(tasks_for_this_hour),
-                "n_users_eligible": diagnostics.get("n_users_eligible", 0),
-                "n_winners": n_winners,
-                "v_mech": v_mech,
-                "sumP": diagnostics.get("payments_sum", 0.0),
-                "u0_mech": diagnostics.get("platform_utility_u0", 0.0),
-                "gap_metrics": gap_m,
-                "diagnostics_full": diagnostics,
-                "feedback_tasks_processed": feedback_count
-            }
+            spill_path = None
+            if config.save_raw_logs:
+                spill_path = spill_hour_objects(
+                    os.path.join(day_output_dir, "raw_logs"),
+                    config.day,
+                    hour,
+                    {"users": users_ready_to_bid, "tasks": tasks_for_this_hour, "winners_set": winners_set, "payments": payments, "diagnostics": diagnostics},
+                    logger_exp
+                )
+            completed_map = gap_m.get("completed_tasks_by_winner", {})
+            hourly_result = HourlyResultPhase3(
+                day=config.day,
+                hour=hour,
+                n_tasks=len(tasks_for_this_hour),
+                n_users_eligible=diagnostics.get("n_users_eligible", 0),
+                n_winners=n_winners,
+                v_mech=v_mech,
+                sumP=diagnostics.get("payments_sum", 0.0),
+                u0_mech=diagnostics.get("platform_utility_u0", 0.0),
+                gap_metrics=compact_gap_metrics(gap_m),
+                payments=np.fromiter(payments.values(), dtype=float, count=len(payments)),
+                winner_ids=np.fromiter(sorted(winners_set), dtype=np.int64, count=len(winners_set)),
+                completed_winner_ids=np.fromiter(completed_map.keys(), dtype=np.int64, count=len(completed_map)),
+                feedback_tasks_processed=feedback_count,
+                spill_path=spill_path
+            )
             all_hourly_diagnostics.append(hourly_result)
+            if kpi_sink is not None:
+                kpi_sink(hourly_kpi_row_phase3(hourly_result))
             logger_exp.info(
                 f"[{config.day} h{hour:02d}] Completato: "
                 f"v_eff={gap_m.get('v_eff_expost', 0):.2f}€, "
@@ -643,21 +711,7 @@ def run_experiment_phase3(config: ExperimentConfigPhase3) -> None:
         except Exception as e:
             logger_exp.error(f"[{config.day} h{hour:02d}] Problema durante l'esecuzione: {e}", exc_info=True)
         finally:
-            for u in all_users:
-                if hasattr(u, 'reset_state'):
-                    u.reset_state(reset_reputation=False, reset_learning=False)
-                else:
-                    u.tasks = []
-                    u.bid = -1.0
-                    u.completed = False
-                    if hasattr(u, 'actually_completed'):
-                        u.actually_completed = False
-                    if hasattr(u, 'payment_base'):
-                        u.payment_base = 0.0
-                    if hasattr(u, 'payment_final'):
-                        u.payment_final = 0.0
-                if hasattr(u, 'penalty_accumulated'):
-                    u.penalty_accumulated = 0.0
+            cohort.reset_hour()
     if not all_hourly_diagnostics:
         logger_exp.error("Nessun risultato valido")
         return
@@ -672,18 +726,18 @@ def run_experiment_phase3(config: ExperimentConfigPhase3) -> None:
     )
     csv_rows = []
     for r in all_hourly_diagnostics:
-        gap_m = r.get('gap_metrics', {})
+        gap_m = r.gap_metrics
         health_m = gap_m.get('mechanism_health_expost', {})
         csv_rows.append(
-            f"{r['hour']},{r.get('v_mech', 0):.2f},"
+            f"{r.hour},{r.v_mech:.2f},"
             f"{gap_m.get('u0_expost', 0):.2f},"
             f"{gap_m.get('v_eff_expost', 0):.2f},{gap_m.get('sum_payment_final', 0):.2f},"
             f"{health_m.get('completion_rate_tasks', 0):.4f},"
             f"{gap_m.get('mae_rho_estimation', 0):.4f},"
             f"{gap_m.get('total_incentive_bonus_malus', 0):.2f},"
-            f"{r['n_winners']},{r['n_users_eligible']},"
+            f"{r.n_winners},{r.n_users_eligible},"
             f"{health_m.get('health_score', 0):.4f},"
-            f"{r.get('feedback_tasks_processed', 0)}\n"
+            f"{r.feedback_tasks_processed}\n"
         )
     safe_csv_write(
         csv_header + "".join(csv_rows), 
@@ -706,15 +760,15 @@ def run_experiment_phase3(config: ExperimentConfigPhase3) -> None:
     logger_exp.info(f"\n{'='*60}\nStep 9: generazione grafici\n{'='*60}")
     try:
         plotter = ScientificPlotterAdaptive(output_dir=day_output_dir)
-        hours_plot = [r['hour'] for r in all_hourly_diagnostics]
-        mae_history = [r['gap_metrics'].get('mae_rho_estimation', float('nan')) for r in all_hourly_diagnostics]
-        health_scores = [r['gap_metrics'].get('mechanism_health_expost', {}).get('health_score', 0.0) for r in all_hourly_diagnostics]
-        ir_violations = [r['gap_metrics'].get('mechanism_health_expost', {}).get('ir_violation_rate', 0.0) for r in all_hourly_diagnostics]
-        compl_rates = [r['gap_metrics'].get('mechanism_health_expost', {}).get('completion_rate_tasks', 0.0) for r in all_hourly_diagnostics]
-        sum_base = [r['gap_metrics'].get('sum_payment_base', 0.0) for r in all_hourly_diagnostics]
-        sum_final = [r['gap_metrics'].get('sum_payment_final', 0.0) for r in all_hourly_diagnostics]
-        v_eff = [r['gap_metrics'].get('v_eff_expost', 0.0) for r in all_hourly_diagnostics]
-        v_mech = [r.get('v_mech', 0.0) for r in all_hourly_diagnostics]
+        hours_plot = [r.hour for r in all_hourly_diagnostics]
+        mae_history = [r.gap_metrics.get('mae_rho_estimation', float('nan')) for r in all_hourly_diagnostics]
+        health_scores = [r.gap_metrics.get('mechanism_health_expost', {}).get('health_score', 0.0) for r in all_hourly_diagnostics]
+        ir_violations = [r.gap_metrics.get('mechanism_health_expost', {}).get('ir_violation_rate', 0.0) for r in all_hourly_diagnostics]
+        compl_rates = [r.gap_metrics.get('mechanism_health_expost', {}).get('completion_rate_tasks', 0.0) for r in all_hourly_diagnostics]
+        sum_base = [r.gap_metrics.get('sum_payment_base', 0.0) for r in all_hourly_diagnostics]
+        sum_final = [r.gap_metrics.get('sum_payment_final', 0.0) for r in all_hourly_diagnostics]
+        v_eff = [r.gap_metrics.get('v_eff_expost', 0.0) for r in all_hourly_diagnostics]
+        v_mech = [r.v_mech for r in all_hourly_diagnostics]
         plotter.plot_learning_convergence(
             hours=hours_plot,
             mae_history=mae_history,
@@ -734,11 +788,9 @@ def run_experiment_phase3(config: ExperimentConfigPhase3) -> None:
         last_hour_winners = []
         try:
             if all_hourly_diagnostics:
-                last_diag = all_hourly_diagnostics[-1].get("diagnostics_full", {})
-                gap_metrics = last_diag.get("property_checks", {}).get("AdaptiveGAPMetrics", {})
-                completed_map = gap_metrics.get("completed_tasks_by_winner", {})
-                if completed_map:
-                    last_hour_winners_ids = set(completed_map.keys())
+                completed_ids = all_hourly_diagnostics[-1].completed_winner_ids
+                if len(completed_ids):
+                    last_hour_winners_ids = set(completed_ids.tolist())
                     last_hour_winners = [u for u in all_users if u.id in last_hour_winners_ids]
                     logger_exp.info(f"Ultimi vincitori: {len(last_hour_winners)}")
                 else:
@@ -819,8 +871,13 @@ def main():
     parser.add_argument("--p_low", type=float, default=2.0)
     parser.add_argument("--p_high", type=float, default=98.0)
     parser.add_argument("--block", type=int, default=4)
-    parser.add_argument("--save_raw_logs", action="store_true")
+    parser.add_argument("--save_raw_logs", action="store_true", help="Salva su disco gli oggetti orari completi (utenti, task, vincitori, diagnostica)")
     parser.add_argument("--no_verify", action="store_true")
+    parser.add_argument("--etl_workers", type=int, default=0)
+    parser.add_argument("--dataset_out", default=None)
+    parser.add_argument("--validation", choices=VALIDATION_LEVELS, default="full")
+    parser.add_argument("--compiled_coverage", action="store_true", help="Valori marginali su modello di copertura NumPy compilato")
+    parser.add_argument("--no_reliability_filter", action="store_true", help="Non escludere le coppie utente-task con reputazione inferiore a required_reliability del task")
     args = parser.parse_args()
     config = ExperimentConfigPhase3(
         raw_data_path=args.raw, 
@@ -851,7 +908,12 @@ def main():
         min_quality_target_critical=args.min_qual_crit,
         max_quality_target_critical=args.max_qual_crit,
         min_feedback_weight_critical=args.min_weight_crit,
-        max_feedback_weight_critical=args.max_weight_crit
+        max_feedback_weight_critical=args.max_weight_crit,
+        etl_workers=args.etl_workers,
+        dataset_out=args.dataset_out,
+        validation_level=args.validation,
+        compiled_coverage=args.compiled_coverage,
+        enforce_reliability=not args.no_reliability_filter
     )
     try:
         run_experiment_phase3(config)
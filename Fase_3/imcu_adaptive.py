@@ -22,6 +22,8 @@ try:
     from Fase_3.classes_adaptive import (
         AdaptiveUser, 
         TaskAdaptive, 
+        HourlyContext,
+        CohortState,
         REPUTATION_ABSOLUTE_MIN_THRESHOLD
     )
 except ImportError as e:
@@ -32,6 +34,8 @@ try:
         IMCUAuction, 
         IMCUDiagnostics, 
         _unique_tasks,
+        _as_list,
+        validate_users_cached,
         SelectionStepLog,
         PaymentStepLog,
         total_value_of_users
@@ -69,6 +73,7 @@ def _validate_user_adaptive(user: AdaptiveUser) -> None:
 def _validate_users_adaptive(users: Optional[List[AdaptiveUser]]) -> List[AdaptiveUser]:
     if users is None:
         raise TypeError("users non puo essere none")
+    users = _as_list(users)
     if not isinstance(users, list):
         raise TypeError(f"users deve essere lista, ricevuto: {type(users).__name__}")
     valid_users: List[AdaptiveUser] = []
@@ -82,18 +87,69 @@ def _validate_users_adaptive(users: Optional[List[AdaptiveUser]]) -> List[Adapti
     return sorted(valid_users, key=lambda u: u.id)
 
 
+def compute_eligibility_masks(
+    users: List[AdaptiveUser],
+    tasks_map: Dict[int, TaskAdaptive],
+    current_time: float,
+    enforce_reliability: bool = True,
+    cohort: Optional[CohortState] = None
+) -> Tuple[np.ndarray, np.ndarray, List[TaskAdaptive], np.ndarray]:
+    n = len(users)
+    if cohort is not None:
+        rows = cohort.rows_of(users)
+        estimated = cohort.estimated_rationality[rows]
+        reputation = cohort.reputation[rows]
+        user_mask = cohort.eligible_mask(current_time, rows)
+    else:
+        estimated = np.fromiter((u.estimated_rationality for u in users), dtype=float, count=n)
+        reputation = np.fromiter((u.reputation for u in users), dtype=float, count=n)
+        blacklisted_until = np.fromiter(
+            (-np.inf if u.blacklisted_until is None else u.blacklisted_until for u in users), dtype=float, count=n
+        )
+        user_mask = (current_time > blacklisted_until) & (reputation >= REPUTATION_ABSOLUTE_MIN_THRESHOLD)
+    owners: List[int] = []
+    pair_tasks: List[TaskAdaptive] = []
+    for i, u in enumerate(users):
+        for task in _unique_tasks(u.tasks):
+            task_obj = tasks_map.get(task.id)
+            if task_obj is not None and isinstance(task_obj, TaskAdaptive):
+                owners.append(i)
+                pair_tasks.append(task_obj)
+    m = len(pair_tasks)
+    owner_idx = np.asarray(owners, dtype=np.int64)
+    quality_target = np.fromiter(
+        (np.nan if t.quality_target is None else t.quality_target for t in pair_tasks), dtype=float, count=m
+    )
+    required_rationality = 0.3 + 0.7 * quality_target
+    pair_mask = user_mask[owner_idx] & (np.isnan(quality_target) | (estimated[owner_idx] >= required_rationality))
+    if enforce_reliability:
+        required_reliability = np.fromiter((t.required_reliability for t in pair_tasks), dtype=float, count=m)
+        pair_mask &= reputation[owner_idx] >= required_reliability
+    return user_mask, owner_idx, pair_tasks, pair_mask
+
+
 class IMCUAuctionAdaptive(IMCUAuction):
     def __init__(
         self,
         all_users: List[AdaptiveUser],
         all_tasks: List[TaskAdaptive],
         current_time: float,
-        debug: bool = True
+        debug: bool = True,
+        compiled_coverage: bool = False,
+        context: Optional[HourlyContext] = None,
+        enforce_reliability: bool = True,
+        validation: str = "full"
     ):
-        self._original_users: List[AdaptiveUser] = _validate_users_adaptive(all_users)
-        self._all_tasks_map: Dict[int, TaskAdaptive] = {t.id: t for t in all_tasks}
+        self.enforce_reliability = enforce_reliability
+        self._original_users: List[AdaptiveUser] = validate_users_cached(
+            all_users, _validate_users_adaptive, validation
+        )
+        self._cohort: Optional[CohortState] = context.cohort if context is not None else None
+        self._all_tasks_map: Dict[int, TaskAdaptive] = (
+            context.tasks_by_id if context is not None else {t.id: t for t in all_tasks}
+        )
         self._current_time: float = current_time
-        self._eligible_users: List[AdaptiveUser] = self._filter_eligible_users(
+        self._eligible_users, eligible_tasks = self._filter_eligible_users(
             self._original_users,
             self._all_tasks_map,
             self._current_time
@@ -104,57 +160,53 @@ class IMCUAuctionAdaptive(IMCUAuction):
             f"Asta imcu adaptive: {len(self._eligible_users)}/{len(self._original_users)} "
             f"utenti idonei per {len(all_tasks)} task"
         )
-        super().__init__(users=self._eligible_users, debug=debug, verify_properties=True)
+        super().__init__(
+            users=self._eligible_users,
+            debug=debug,
+            verify_properties=True,
+            compiled_coverage=compiled_coverage,
+            validation=validation,
+            task_lists=eligible_tasks
+        )
+
+    def _validated_users(self, users: List[AdaptiveUser], validation: str) -> List[AdaptiveUser]:
+        return sorted(users, key=lambda u: u.id)
 
     def _filter_eligible_users(
         self, 
         users: List[AdaptiveUser], 
         tasks_map: Dict[int, TaskAdaptive],
         current_time: float
-    ) -> List[AdaptiveUser]:
-        import copy
+    ) -> Tuple[List[AdaptiveUser], Dict[int, List[TaskAdaptive]]]:
+        user_mask, owners, pair_tasks, pair_mask = compute_eligibility_masks(
+            users, tasks_map, current_time, enforce_reliability=self.enforce_reliability, cohort=self._cohort
+        )
+        buckets: Dict[int, List[TaskAdaptive]] = {}
+        for i, task, ok in zip(owners.tolist(), pair_tasks, pair_mask.tolist()):
+            if ok:
+                buckets.setdefault(i, []).append(task)
         eligible_auction_users: List[AdaptiveUser] = []
-        total_tasks_before = 0
-        total_tasks_after = 0
-        for u in users:
-            candidate_tasks = _unique_tasks(u.tasks)
-            total_tasks_before += len(candidate_tasks)
-            eligible_tasks_for_user: List[TaskAdaptive] = []
-            for task in candidate_tasks:
-                task_obj = tasks_map.get(task.id)
-                if not task_obj or not isinstance(task_obj, TaskAdaptive):
-                    continue
-                if not u.is_eligible_at_time(current_time):
-                    continue
-                if task_obj.quality_target is not None:
-                    required_rationality = 0.3 + 0.7 * task_obj.quality_target
-                    if u.estimated_rationality < required_rationality:
-                        logger.debug(
-                            f"Utente {u.id}: task {task_obj.id} filtrato "
-                            f"(rho_stima={u.estimated_rationality:.2f} < {required_rationality:.2f})"
-                        )
-                        continue
-                if u.reputation < REPUTATION_ABSOLUTE_MIN_THRESHOLD:
-                    logger.debug(
-                        f"Utente {u.id} escluso: reputazione={u.reputation:.2f} < {REPUTATION_ABSOLUTE_MIN_THRESHOLD}"
-                    )
-                    continue
-                eligible_tasks_for_user.append(task_obj)
-            total_tasks_after += len(eligible_tasks_for_user)
+        eligible_tasks: Dict[int, List[TaskAdaptive]] = {}
+        for i, u in enumerate(users):
+            eligible_tasks_for_user = buckets.get(i)
             if eligible_tasks_for_user:
-                u_copy = copy.copy(u)
-                u_copy.set_tasks(eligible_tasks_for_user)
-                eligible_auction_users.append(u_copy)
+                eligible_tasks[u.id] = eligible_tasks_for_user
+                eligible_auction_users.append(u)
         logger.info(
             f"Filtro eligibilita: {len(eligible_auction_users)}/{len(users)} utenti ammessi, "
-            f"{total_tasks_after}/{total_tasks_before} task idonei"
+            f"{int(pair_mask.sum())}/{len(pair_tasks)} task idonei"
         )
-        return eligible_auction_users
+        logger.debug(f"Filtro eligibilita: {int((~user_mask).sum())} utenti esclusi da blacklist o soglia minima di reputazione")
+        return eligible_auction_users, eligible_tasks
+
+    def _assign_awarded_tasks(self, winners: List[AdaptiveUser]) -> None:
+        for w in winners:
+            w.set_tasks(self._tasks_of(w), dedupe=False)
 
     def _selection_phase(self) -> List[AdaptiveUser]:
         winners: List[AdaptiveUser] = []
         remaining: List[AdaptiveUser] = list(self.users)
-        covered: Set[int] = set()
+        covered = self._new_covered()
         iteration = 0
         logger.info(f"Selezione gap: {len(remaining)} utenti idonei in competizione")
         while True:
@@ -162,8 +214,8 @@ class IMCUAuctionAdaptive(IMCUAuction):
             best_candidate: Optional[AdaptiveUser] = None
             best_gain = float("-inf")
             candidates_log: List[Dict[str, float]] = []
-            for u in remaining:
-                mv = self._marginal_value(u, covered, count_for="sel")
+            mvs = self._marginal_values(remaining, covered, count_for="sel")
+            for u, mv in zip(remaining, mvs):
                 effective_bid = u.get_effective_bid()
                 gain = mv - effective_bid
                 if self.debug:
@@ -198,7 +250,7 @@ class IMCUAuctionAdaptive(IMCUAuction):
                 if self.debug:
                     self._logs_selection.append(SelectionStepLog(
                         iteration=iteration,
-                        covered_count_before=len(covered) - len(_unique_tasks(best_candidate.tasks)),
+                        covered_count_before=len(covered) - len(_unique_tasks(self._tasks_of(best_candidate))),
                         candidates=candidates_log,
                         chosen_user_id=best_candidate.id,
                         chosen_gain=float(best_gain),
@@ -226,7 +278,7 @@ class IMCUAuctionAdaptive(IMCUAuction):
         for w in winners:
             others: List[AdaptiveUser] = [u for u in self.users if u.id != w.id]
             critical_base = w.get_effective_bid()
-            temp_covered: Set[int] = set()
+            temp_covered = self._new_covered()
             prefix_T: List[AdaptiveUser] = []
             steps_log: List[Dict[str, float]] = []
             k_last = 0
@@ -234,10 +286,9 @@ class IMCUAuctionAdaptive(IMCUAuction):
             while True:
                 best_competitor: Optional[AdaptiveUser] = None
                 best_competitor_gain = float("-inf")
-                for c in others:
-                    if c in prefix_T:
-                        continue
-                    mv_c = self._marginal_value(c, temp_covered, count_for="pay")
+                candidates = [c for c in others if c not in prefix_T]
+                mvs_c = self._marginal_values(candidates, temp_covered, count_for="pay")
+                for c, mv_c in zip(candidates, mvs_c):
                     effective_bid_c = c.get_effective_bid()
                     gain_c = mv_c - effective_bid_c
                     should_update = (
@@ -283,7 +334,7 @@ class IMCUAuctionAdaptive(IMCUAuction):
                 prefix_T.append(best_competitor)
                 self._add_user_tasks_to_covered(best_competitor, temp_covered)
             max_budget = float('inf')
-            for task in _unique_tasks(w.tasks):
+            for task in _unique_tasks(self._tasks_of(w)):
                 if hasattr(task, 'budget') and task.budget is not None:
                     max_budget = min(max_budget, task.budget)
             if max_budget < float('inf') and critical_base > max_budget:
@@ -352,14 +403,14 @@ class IMCUAuctionAdaptive(IMCUAuction):
         seen_task_ids: Set[int] = set()
         for w in winners:
             if w.actually_completed:
-                for t in _unique_tasks(w.tasks):
+                for t in _unique_tasks(self._tasks_of(w)):
                     if t.id not in seen_task_ids:
                         completed_tasks.append(cast(TaskAdaptive, t))
                         seen_task_ids.add(t.id)
         v_eff_expost = sum(float(t.value) for t in completed_tasks)
         sumP_final = sum(payments.values())
         u0_expost = v_eff_expost - sumP_final
-        eligible_task_ids = {t.id for u in self.users for t in _unique_tasks(u.tasks)}
+        eligible_task_ids = {t.id for u in self.users for t in _unique_tasks(self._tasks_of(u))}
         eligible_tasks_value = sum(float(t.value) for t in self._all_tasks_map.values() if t.id in eligible_task_ids)
         diag['v_eff_expost'] = float(v_eff_expost)
         diag['sumP_final_expost'] = float(sumP_final)
@@ -389,7 +440,7 @@ class IMCUAuctionAdaptive(IMCUAuction):
         actual_rate_winners = actual_compl / max(1, len(winners))
         diag['actual_completion_rate_winners'] = float(actual_rate_winners)
         total_tasks_available = len(
-            {t.id for u in all_eligible for t in _unique_tasks(u.tasks)}
+            {t.id for u in all_eligible for t in _unique_tasks(self._tasks_of(u))}
         )
         completion_rate_tasks = len(seen_task_ids) / max(1, total_tasks_available)
         diag['completion_rate_tasks'] = float(completion_rate_tasks)
@@ -415,7 +466,7 @@ class IMCUAuctionAdaptive(IMCUAuction):
         completed_tasks_map: Dict[int, List[int]] = {}
         for w in winners:
             if w.actually_completed:
-                task_ids = [t.id for t in _unique_tasks(w.tasks)]
+                task_ids = [t.id for t in _unique_tasks(self._tasks_of(w))]
                 if task_ids:
                     completed_tasks_map[w.id] = task_ids
         diag['completed_tasks_by_winner'] = completed_tasks_map
@@ -437,6 +488,7 @@ class IMCUAuctionAdaptive(IMCUAuction):
         t2 = time.perf_counter()
         logger.info(f"  Pagamenti calcolati ({t2-t1:.3f}s)")
         winners_set: Set[int] = {u.id for u in winners}
+        self._assign_awarded_tasks(winners)
         logger.info("Step 3: simulazione completamento")
         completion_stats = {
             'completed': 0,
@@ -478,11 +530,11 @@ class IMCUAuctionAdaptive(IMCUAuction):
             logger.info("  Nessuna violazione ir rilevata")
         logger.info("Step 5: apprendimento delegato a orchestratore fase 3")
         logger.info("Step 6: diagnostica estesa")
-        vS_exante = total_value_of_users(winners)
+        vS_exante = total_value_of_users(winners, self._task_lists)
         sumP_final = sum(payments.values())
         diagnostics = IMCUDiagnostics(
             winners_count=len(winners),
-            covered_tasks_count=len({t.id for u in winners for t in _unique_tasks(u.tasks)}),
+            covered_tasks_count=len({t.id for u in winners for t in _unique_tasks(self._tasks_of(u))}),
             payments_sum=sumP_final,
             platform_value_vS=vS_exante,
             platform_utility_u0=vS_exante - sumP_final,
@@ -505,7 +557,11 @@ def run_imcu_auction_adaptive(
     tasks: List[TaskAdaptive],
     current_time: float,
     debug: bool = True,
-    debug_level: str = "summary"
+    debug_level: str = "summary",
+    compiled_coverage: bool = False,
+    context: Optional[HourlyContext] = None,
+    enforce_reliability: bool = True,
+    validation: str = "full"
 ) -> Tuple[Set[int], Dict[int, float], Dict[str, Any]]:
     if debug_level not in ("none", "summary", "full"):
         raise ValueError(f"debug_level non valido: '{debug_level}'")
@@ -513,9 +569,15 @@ def run_imcu_auction_adaptive(
         all_users=users,
         all_tasks=tasks,
         current_time=current_time,
-        debug=debug
+        debug=debug,
+        compiled_coverage=compiled_coverage,
+        context=context,
+        enforce_reliability=enforce_reliability,
+        validation=validation
     )
     winners_set, payments, diag_obj = auction.run()
+    if context is not None:
+        context.record_auction(winners_set, payments)
     diagnostics: Dict[str, Any] = {
         "winners_count": diag_obj.winners_count,
         "covered_tasks_count": diag_obj.covered_tasks_count,
@@ -14,11 +14,9 @@ readonly GIORNO="2014-02-01"
 readonly SEED=42
 
 readonly F1_RADS=(1500 2500 4000)
-readonly F1_OUTS=("${SCRIPT_DIR_F1}/experiments_radius_1500" "${SCRIPT_DIR_F1}/experiments_radius_2500" "${SCRIPT_DIR_F1}/experiments_radius_4000")
 readonly F2_CONFIGS=("high" "mixed" "low")
-readonly F2_OUTS=("${SCRIPT_DIR_F2}/esperimenti_fase2_high" "${SCRIPT_DIR_F2}/esperimenti_fase2_mixed" "${SCRIPT_DIR_F2}/esperimenti_fase2_low")
 readonly F3_CONFIGS=("high" "mixed" "low")
-readonly F3_OUTS=("${SCRIPT_DIR_F3}/esperimenti_fase3_high" "${SCRIPT_DIR_F3}/esperimenti_fase3_mixed" "${SCRIPT_DIR_F3}/esperimenti_fase3_low")
+readonly SWEEP_WORKERS="${SWEEP_WORKERS:-$(nproc 2>/dev/null || echo 1)}"
 
 init_logging() { mkdir -p "$(dirname "$LOG_FILE")"; exec > >(tee -a "$LOG_FILE"); exec 2>&1; log "info" "Log attivo su: $LOG_FILE"; }
 log() { echo "[$(date '+%Y-%m-%d %H:%M:%S')] [$1] ${*:2}"; }
@@ -38,12 +36,13 @@ run_cmd() {
     eval "$1" && log "info" "Completato in $(( $(date +%s) - s ))s: $2" || { log "errore" "Fallito (codice $?): $2"; return 1; }
 }
 
-link_dataset() { mkdir -p "$1"; ln -sf "$SHARED_DATASET_DIR" "$1/dataset_processato"; log "info" "Link dati creato in $1"; }
+link_dataset() { mkdir -p "$1"; ln -sfn "$SHARED_DATASET_DIR" "$1/dataset_processato"; log "info" "Link dati creato in $1"; }
 
 check_prerequisites() {
     log "info" "Verifica prerequisiti..."
     ! command -v python >/dev/null 2>&1 && { log "errore" "Python non trovato."; return 1; }
     [ ! -f "${ROOT_DIR}/${DATA_FILE}" ] && { log "errore" "Dati mancanti: ${DATA_FILE}"; return 1; }
+    [ ! -f "${ROOT_DIR}/sweep.py" ] && { log "errore" "Manca sweep.py in ${ROOT_DIR}"; return 1; }
     local missing=0
     local f1_files=("fase_1.py" "classes.py" "imcu.py" "data_manager.py" "plot.py" "statistic_analysis.py" "radius_analysis.py" "advanced_analysis.py" "generate_radius_comparison_figures.py")
     local f2_files=("fase_2.py" "classes_bounded.py" "imcu_bounded.py" "data_manager_bounded.py" "plot_bounded.py")
@@ -65,24 +64,15 @@ setup_dataset() {
     fi
 }
 
-get_params() {
-    echo "--raw ${ROOT_DIR}/${DATA_FILE} --day $GIORNO --start 8 --end 20 --cell 500 --max_users 316 --dpi 300 --seed $SEED --out $1"
-}
-
-run_sim() {
-    link_dataset "$2"; local p=$(get_params "$2"); local extra="$3"
-    [ "$4" == "F1" ] && p="$p --cost_min 0.45 --cost_max 0.70 --value_mode uniform --dataset_out $SHARED_DATASET_DIR"
-    [ "$4" == "F2" ] && p="$p --radius 2500 --cost_min 0.45 --cost_max 0.70 --value_mode demand_log --value_min 1.8 --value_max 15.0 --no_verify"
-    [ "$4" == "F3" ] && p="$p --radius 2500 --cost_min 0.45 --cost_max 0.70 --value_mode demand_log --value_min 1.8 --value_max 15.0 --high_value_pct 0.80 --min_rel_crit 0.70 --max_rel_crit 0.85 --min_qual_crit 0.40 --max_qual_crit 0.60 --min_weight_crit 1.5 --max_weight_crit 2.5"
-    run_cmd "python $1 $p $extra" "$5"
+run_sweep() {
+    run_cmd "python ${ROOT_DIR}/sweep.py --raw ${ROOT_DIR}/${DATA_FILE} --days $GIORNO --seeds $SEED --start 8 --end 20 --cell 500 --max_users 316 --dpi 300 --dataset_out $SHARED_DATASET_DIR --workers $SWEEP_WORKERS $1" "$2"
 }
 
 main_fase1() {
     log "info" "Avvio fase 1"
     [ "$SKIP_ETL" = false ] && log "info" "Dataset verrà generato al primo passo."
-    for i in "${!F1_RADS[@]}"; do
-        run_sim "${SCRIPT_DIR_F1}/fase_1.py" "${F1_OUTS[$i]}" "--radius ${F1_RADS[$i]}" "F1" "Simulazione fase 1 (raggio=${F1_RADS[$i]})" || return 1
-    done
+    for r in "${F1_RADS[@]}"; do link_dataset "${SCRIPT_DIR_F1}/experiments_radius_${r}"; done
+    run_sweep "--phases F1 --radii ${F1_RADS[*]}" "Simulazioni fase 1 (raggi=${F1_RADS[*]})" || return 1
 
     log "info" "Analisi statistica e figure teoriche fase 1..."
     pushd "$SCRIPT_DIR_F1" >/dev/null
@@ -109,18 +99,16 @@ main_fase1() {
 main_fase2() {
     log "info" "Avvio fase 2"
     [ ! "$(ls -A $SHARED_DATASET_DIR 2>/dev/null)" ] && { log "errore" "Dataset mancante. Esegui fase 1."; return 1; }
-    for i in "${!F2_CONFIGS[@]}"; do
-        run_sim "${SCRIPT_DIR_F2}/fase_2.py" "${F2_OUTS[$i]}" "--rationality ${F2_CONFIGS[$i]}" "F2" "Simulazione fase 2 (razionalità=${F2_CONFIGS[$i]})" || return 1
-    done
+    for c in "${F2_CONFIGS[@]}"; do link_dataset "${SCRIPT_DIR_F2}/esperimenti_fase2_${c}"; done
+    run_sweep "--phases F2 --rationality ${F2_CONFIGS[*]} --no_verify" "Simulazioni fase 2 (razionalità=${F2_CONFIGS[*]})" || return 1
     log "info" "Fase 2 completata"; return 0
 }
 
 main_fase3() {
     log "info" "Avvio fase 3"
     [ ! "$(ls -A $SHARED_DATASET_DIR 2>/dev/null)" ] && { log "errore" "Dataset mancante. Esegui fase 1."; return 1; }
-    for i in "${!F3_CONFIGS[@]}"; do
-        run_sim "${SCRIPT_DIR_F3}/fase_3.py" "${F3_OUTS[$i]}" "--rationality ${F3_CONFIGS[$i]}" "F3" "Simulazione fase 3 (razionalità=${F3_CONFIGS[$i]})" || return 1
-    done
+    for c in "${F3_CONFIGS[@]}"; do link_dataset "${SCRIPT_DIR_F3}/esperimenti_fase3_${c}"; done
+    run_sweep "--phases F3 --rationality ${F3_CONFIGS[*]}" "Simulazioni fase 3 (razionalità=${F3_CONFIGS[*]})" || return 1
     log "info" "Fase 3 completata"; return 0
 }
 
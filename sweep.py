@@ -0,0 +1,298 @@
+from __future__ import annotations
+import os
+import sys
+import csv
+import json
+import math
+import time
+import argparse
+import tempfile
+import itertools
+import traceback
+import datetime as dt
+from dataclasses import dataclass, asdict
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from statistics import NormalDist
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+ROOT_DIR = os.path.dirname(os.path.abspath(__file__))
+if ROOT_DIR not in sys.path:
+    sys.path.insert(0, ROOT_DIR)
+
+try:
+    from scipy import stats as scipy_stats
+except ImportError:
+    scipy_stats = None
+
+from Fase_1.imcu import VALIDATION_LEVELS
+
+PHASES: Tuple[str, ...] = ("F1", "F2", "F3")
+F1_PARAMS: Dict[str, Any] = {"cost_params": (0.45, 0.70), "value_mode": "uniform"}
+F2_PARAMS: Dict[str, Any] = {"task_radius_m": 2500.0, "cost_params": (0.45, 0.70), "value_mode": "demand_log", "task_value_min": 1.8, "task_value_max": 15.0}
+F3_PARAMS: Dict[str, Any] = dict(F2_PARAMS, high_value_threshold_pct=0.80, min_reliability_critical=0.70, max_reliability_critical=0.85, min_quality_target_critical=0.40, max_quality_target_critical=0.60, min_feedback_weight_critical=1.5, max_feedback_weight_critical=2.5)
+
+@dataclass
+class SweepRun:
+    phase: str
+    day: str
+    seed: int
+    radius_m: Optional[float]
+    rationality: Optional[str]
+    output_dir: str
+
+    @property
+    def label(self) -> str:
+        variant = f"raggio={self.radius_m:g}" if self.phase == "F1" else f"razionalità={self.rationality}"
+        return f"{self.phase} {variant} giorno={self.day} seed={self.seed}"
+
+    @property
+    def variant(self) -> str:
+        return f"raggio_{self.radius_m:g}" if self.phase == "F1" else str(self.rationality)
+
+class RunningStats:
+    __slots__ = ("n", "mean", "m2")
+
+    def __init__(self):
+        self.n = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+
+    def add(self, value: float) -> None:
+        self.n += 1
+        delta = value - self.mean
+        self.mean += delta / self.n
+        self.m2 += delta * (value - self.mean)
+
+    @property
+    def std(self) -> float:
+        return math.sqrt(self.m2 / (self.n - 1)) if self.n > 1 else 0.0
+
+    def interval(self, confidence: float) -> Tuple[float, float]:
+        if self.n < 2:
+            return (self.mean, self.mean)
+        q = float(scipy_stats.t.ppf(0.5 + confidence / 2, self.n - 1)) if scipy_stats is not None else NormalDist().inv_cdf(0.5 + confidence / 2)
+        half = q * self.std / math.sqrt(self.n)
+        return (self.mean - half, self.mean + half)
+
+class KpiAggregator:
+    STORE_FIELDS = ("phase", "variant", "day", "seed", "hour", "kpi", "value")
+    CI_FIELDS = ("phase", "variant", "kpi", "n_repliche", "media_oraria", "dev_std", "ci_low", "ci_high", "confidenza")
+
+    def __init__(self, store_path: str, ci_path: str, confidence: float = 0.95):
+        if not 0 < confidence < 1:
+            raise ValueError(f"Livello di confidenza non valido: {confidence}. Deve essere in (0, 1)")
+        self.store_path = store_path
+        self.ci_path = ci_path
+        self.confidence = confidence
+        self.stats: Dict[Tuple[str, str, str], RunningStats] = {}
+        self.rows_written = 0
+        for path in (store_path, ci_path):
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        if not os.path.exists(store_path) or os.path.getsize(store_path) == 0:
+            with open(store_path, "w", encoding="utf-8", newline="") as f:
+                csv.writer(f).writerow(self.STORE_FIELDS)
+
+    def add_run(self, run: SweepRun, rows: Iterable[Dict[str, Any]]) -> None:
+        per_kpi: Dict[str, List[float]] = {}
+        with open(self.store_path, "a", encoding="utf-8", newline="") as f:
+            writer = csv.writer(f)
+            for row in rows:
+                for kpi, value in row.items():
+                    if kpi in ("day", "hour"):
+                        continue
+                    writer.writerow((run.phase, run.variant, row["day"], run.seed, row["hour"], kpi, value))
+                    if math.isfinite(value):
+                        totals = per_kpi.setdefault(kpi, [0.0, 0])
+                        totals[0] += value
+                        totals[1] += 1
+                    self.rows_written += 1
+        if not per_kpi:
+            return
+        for kpi, (total, count) in per_kpi.items():
+            self.stats.setdefault((run.phase, run.variant, kpi), RunningStats()).add(total / count)
+        self.write_intervals()
+
+    def write_intervals(self) -> None:
+        tmp_path = f"{self.ci_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(self.CI_FIELDS)
+            for (phase, variant, kpi), stats in sorted(self.stats.items()):
+                low, high = stats.interval(self.confidence)
+                writer.writerow((phase, variant, kpi, stats.n, stats.mean, stats.std, low, high, self.confidence))
+        os.replace(tmp_path, self.ci_path)
+
+def expand_date_range(start: str, end: str) -> List[str]:
+    first, last = dt.date.fromisoformat(start), dt.date.fromisoformat(end)
+    if last < first:
+        raise ValueError(f"Intervallo date invalido: {start} > {end}")
+    return [(first + dt.timedelta(days=i)).isoformat() for i in range((last - first).days + 1)]
+
+def run_output_dir(out_root: str, phase: str, radius_m: Optional[float], rationality: Optional[str], seed: int, multi_seed: bool) -> str:
+    suffix = f"_seed{seed}" if multi_seed else ""
+    if phase == "F1":
+        return os.path.join(out_root, "Fase_1", f"experiments_radius_{radius_m:g}{suffix}")
+    if phase == "F2":
+        return os.path.join(out_root, "Fase_2", f"esperimenti_fase2_{rationality}{suffix}")
+    return os.path.join(out_root, "Fase_3", f"esperimenti_fase3_{rationality}{suffix}")
+
+def build_grid(phases: List[str], days: List[str], seeds: List[int], radii: List[float], rationalities: List[str], out_root: str = ROOT_DIR) -> List[SweepRun]:
+    runs: List[SweepRun] = []
+    multi_seed = len(seeds) > 1
+    for phase in phases:
+        variants = [(radius_m, None) for radius_m in radii] if phase == "F1" else [(None, rationality) for rationality in rationalities]
+        for (radius_m, rationality), seed, day in itertools.product(variants, seeds, days):
+            runs.append(SweepRun(phase=phase, day=day, seed=seed, radius_m=radius_m, rationality=rationality, output_dir=run_output_dir(out_root, phase, radius_m, rationality, seed, multi_seed)))
+    return runs
+
+def build_config(run: SweepRun, settings: Dict[str, Any]) -> Any:
+    common = dict(raw_data_path=settings["raw"], day=run.day, hour_start=settings["start"], hour_end=settings["end"], block_size=settings["block"], cell_size_m=settings["cell"], bbox=None, max_users=settings["max_users"], norm_mode=settings["norm"], percentile_low=settings["p_low"], percentile_high=settings["p_high"], plot_dpi=settings["dpi"], output_dir=run.output_dir, random_seed=run.seed, save_raw_logs=settings["save_raw_logs"], verify_properties=not settings["no_verify"], fast_verification=settings["fast_verify"], lazy_greedy=settings["lazy_greedy"], incremental_payments=settings["incremental_payments"], compiled_coverage=settings["compiled_coverage"], verification_workers=settings["verify_workers"], dataset_out=settings["dataset_out"], validation_level=settings["validation"])
+    if run.phase == "F1":
+        from Fase_1.fase_1 import ExperimentConfig
+        return ExperimentConfig(task_radius_m=run.radius_m, **F1_PARAMS, **common)
+    if run.phase == "F2":
+        from Fase_2.fase_2 import ExperimentConfigPhase2
+        return ExperimentConfigPhase2(rationality_distribution=run.rationality, moral_hazard_replications=settings["mc_replications"], **F2_PARAMS, **common)
+    from Fase_3.fase_3 import ExperimentConfigPhase3
+    return ExperimentConfigPhase3(rationality_distribution=run.rationality, enforce_reliability=not settings["no_reliability_filter"], **F3_PARAMS, **common)
+
+def read_kpi_spool(path: str) -> Iterator[Dict[str, Any]]:
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            yield json.loads(line)
+
+def execute_run(run: SweepRun, settings: Dict[str, Any]) -> Dict[str, Any]:
+    start = time.perf_counter()
+    fd, spool_path = tempfile.mkstemp(prefix="kpi_orari_", suffix=".jsonl", dir=settings.get("kpi_spool_dir"))
+    n_rows = 0
+    with os.fdopen(fd, "w", encoding="utf-8") as spool:
+        def kpi_sink(row: Dict[str, Any]) -> None:
+            nonlocal n_rows
+            spool.write(json.dumps(row) + "\n")
+            spool.flush()
+            n_rows += 1
+        try:
+            config = build_config(run, settings)
+            if run.phase == "F1":
+                from Fase_1.fase_1 import run_experiment
+                run_experiment(config, kpi_sink=kpi_sink)
+            elif run.phase == "F2":
+                from Fase_2.fase_2 import run_experiment_phase2
+                run_experiment_phase2(config, kpi_sink=kpi_sink)
+            else:
+                from Fase_3.fase_3 import run_experiment_phase3
+                run_experiment_phase3(config, kpi_sink=kpi_sink)
+            if not n_rows:
+                return {"run": asdict(run), "ok": False, "duration_s": time.perf_counter() - start, "error": "Nessun risultato orario prodotto", "traceback": "", "kpi_spool": spool_path, "kpi_rows": n_rows}
+            return {"run": asdict(run), "ok": True, "duration_s": time.perf_counter() - start, "error": None, "kpi_spool": spool_path, "kpi_rows": n_rows}
+        except Exception as e:
+            return {"run": asdict(run), "ok": False, "duration_s": time.perf_counter() - start, "error": f"{type(e).__name__}: {e}", "traceback": traceback.format_exc(), "kpi_spool": spool_path, "kpi_rows": n_rows}
+
+def ingest_kpi_spool(aggregator: KpiAggregator, run: SweepRun, result: Dict[str, Any]) -> None:
+    spool_path = result.pop("kpi_spool", None)
+    if spool_path is None:
+        return
+    try:
+        aggregator.add_run(run, read_kpi_spool(spool_path))
+    finally:
+        os.remove(spool_path)
+
+def prepare_dataset(settings: Dict[str, Any]) -> None:
+    from Fase_1.data_manager import DataManager
+    dm = DataManager(raw_txt_path=settings["raw"], out_dir=settings["dataset_out"], random_seed=settings["seeds"][0])
+    if dm.needs_etl():
+        print(f"Preparazione dataset condiviso in {settings['dataset_out']}")
+        dm.parse_raw_to_csv(compute_total_lines=True, partition_by="day-hour", write_master_sample=True, workers=settings["etl_workers"], incremental=True)
+    else:
+        print(f"Dataset condiviso aggiornato: {settings['dataset_out']}")
+
+def log(level: str, message: str) -> None:
+    print(f"[{dt.datetime.now():%Y-%m-%d %H:%M:%S}] [{level}] {message}", flush=True)
+
+def run_sweep(runs: List[SweepRun], settings: Dict[str, Any], workers: int, on_result: Optional[Callable[[SweepRun, Dict[str, Any]], None]] = None) -> List[Dict[str, Any]]:
+    results: List[Dict[str, Any]] = []
+    if workers <= 1:
+        for run in runs:
+            log("info", f"Avvio: {run.label}")
+            results.append(execute_run(run, settings))
+            if on_result is not None:
+                on_result(run, results[-1])
+            log("info" if results[-1]["ok"] else "errore", f"{'Completato' if results[-1]['ok'] else 'Fallito'} in {results[-1]['duration_s']:.0f}s: {run.label}")
+        return results
+    ordered: List[Optional[Dict[str, Any]]] = [None] * len(runs)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(execute_run, run, settings): idx for idx, run in enumerate(runs)}
+        log("info", f"{len(runs)} simulazioni in coda su {workers} processi")
+        for done, future in enumerate(as_completed(futures), start=1):
+            idx = futures[future]
+            result = ordered[idx] = future.result()
+            if on_result is not None:
+                on_result(runs[idx], result)
+            log("info" if result["ok"] else "errore", f"{'Completato' if result['ok'] else 'Fallito'} in {result['duration_s']:.0f}s: {runs[idx].label} ({done}/{len(runs)})")
+    return ordered
+
+def main():
+    parser = argparse.ArgumentParser(description="Sweep parametrico delle simulazioni IMCU (raggio × razionalità × seed × giorno)", formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument("--raw", default=os.path.join(ROOT_DIR, "dati", "taxi_february.txt"), help="Path file dati grezzo")
+    parser.add_argument("--phases", nargs="+", choices=PHASES, default=list(PHASES), help="Fasi da eseguire")
+    days_group = parser.add_mutually_exclusive_group()
+    days_group.add_argument("--days", nargs="+", default=["2014-02-01"], help="Giorni da simulare (YYYY-MM-DD)")
+    days_group.add_argument("--date_range", nargs=2, metavar=("INIZIO", "FINE"), default=None, help="Intervallo di giorni inclusivo (YYYY-MM-DD YYYY-MM-DD), in alternativa a --days")
+    parser.add_argument("--seeds", nargs="+", type=int, default=[42], help="Seed RNG")
+    parser.add_argument("--radii", nargs="+", type=float, default=[1500.0, 2500.0, 4000.0], help="Raggi assegnazione task Fase 1 (m)")
+    parser.add_argument("--rationality", nargs="+", choices=["high", "mixed", "low"], default=["high", "mixed", "low"], help="Distribuzioni di razionalità Fasi 2 e 3")
+    parser.add_argument("--start", type=int, default=8, help="Ora inizio (0-23)")
+    parser.add_argument("--end", type=int, default=20, help="Ora fine esclusa (1-24)")
+    parser.add_argument("--block", type=int, default=4, help="Ampiezza blocchi ore")
+    parser.add_argument("--cell", type=int, default=500, help="Dimensione cella griglia (m)")
+    parser.add_argument("--max_users", type=int, default=316, help="Max utenti per ora")
+    parser.add_argument("--dpi", type=int, default=300, help="DPI figure")
+    parser.add_argument("--norm", choices=["percentiles", "log", "power"], default="percentiles", help="Normalizzazione colormap")
+    parser.add_argument("--p_low", type=float, default=2.0, help="Percentile inferiore")
+    parser.add_argument("--p_high", type=float, default=98.0, help="Percentile superiore")
+    parser.add_argument("--no_verify", action="store_true", help="Disabilita verifica proprietà IMCU")
+    parser.add_argument("--fast_verify", action="store_true", help="Verifica proprietà IMCU rapida (replay della traccia di selezione, senza clonare utenti)")
+    parser.add_argument("--lazy_greedy", action="store_true", help="Selezione lazy-greedy (CELF) nelle aste F1/F2")
+    parser.add_argument("--incremental_payments", action="store_true", help="Pagamenti critici incrementali nelle aste F1/F2")
+    parser.add_argument("--compiled_coverage", action="store_true", help="Modello di copertura NumPy compilato per i valori marginali (F1/F2/F3)")
+    parser.add_argument("--verify_workers", type=int, default=0, help="Processi paralleli per la verifica delle proprietà dei vincitori (0 = sequenziale)")
+    parser.add_argument("--validation", choices=VALIDATION_LEVELS, default="full", help="Validazione utenti nell'asta: full, hourly (una volta per snapshot), off")
+    parser.add_argument("--save_raw_logs", action="store_true", help="Salva su disco gli oggetti orari completi di ogni simulazione")
+    parser.add_argument("--dataset_out", default=os.path.join(ROOT_DIR, "dataset_processato_condiviso"), help="Path dataset ETL condiviso")
+    parser.add_argument("--no_reliability_filter", action="store_true", help="Fase 3: non escludere le coppie utente-task con reputazione inferiore a required_reliability del task")
+    parser.add_argument("--mc_replications", type=int, default=0, help="Repliche Monte Carlo orarie dell'azzardo morale in Fase 2 (0 = disabilitato)")
+    parser.add_argument("--out_root", default=ROOT_DIR, help="Radice delle directory di output per fase")
+    parser.add_argument("--etl_workers", type=int, default=0, help="Processi paralleli per ETL (0 = sequenziale)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Simulazioni eseguite in parallelo")
+    parser.add_argument("--summary", default=None, help="Path riepilogo JSON dello sweep")
+    parser.add_argument("--kpi_store", default=None, help="Path CSV append-only dei KPI orari (formato lungo)")
+    parser.add_argument("--confidence", type=float, default=0.95, help="Livello di confidenza degli intervalli tra repliche (giorno × seed)")
+    args = parser.parse_args()
+    if not os.path.exists(args.raw):
+        print(f"File dati non trovato: {args.raw}", file=sys.stderr)
+        sys.exit(1)
+    if args.date_range:
+        args.days = expand_date_range(*args.date_range)
+    settings = dict(vars(args))
+    runs = build_grid(args.phases, args.days, args.seeds, args.radii, args.rationality, out_root=args.out_root)
+    log("info", f"Sweep: {len(runs)} simulazioni ({', '.join(args.phases)}, {len(args.days)} giorni × {len(args.seeds)} seed), {args.workers} processi")
+    prepare_dataset(settings)
+    stamp = f"{dt.datetime.now():%Y%m%d_%H%M%S}"
+    summary_path = args.summary or os.path.join(ROOT_DIR, "logs_pipeline", f"sweep_{stamp}.json")
+    store_path = args.kpi_store or os.path.join(ROOT_DIR, "logs_pipeline", f"sweep_{stamp}_kpi_orari.csv")
+    ci_path = f"{os.path.splitext(store_path)[0]}_intervalli.csv"
+    aggregator = KpiAggregator(store_path, ci_path, confidence=args.confidence)
+    settings["kpi_spool_dir"] = os.path.dirname(os.path.abspath(store_path))
+    start = time.perf_counter()
+    results = run_sweep(runs, settings, args.workers, on_result=lambda run, result: ingest_kpi_spool(aggregator, run, result))
+    failed = [r for r in results if not r["ok"]]
+    os.makedirs(os.path.dirname(summary_path), exist_ok=True)
+    with open(summary_path, "w", encoding="utf-8") as f:
+        json.dump({"settings": settings, "duration_s": time.perf_counter() - start, "kpi_store": store_path, "kpi_intervals": ci_path, "kpi_rows": aggregator.rows_written, "runs": results}, f, indent=2, ensure_ascii=False)
+    for result in failed:
+        log("errore", f"{result['error']}\n{result['traceback']}")
+    log("info", f"Sweep concluso in {time.perf_counter() - start:.0f}s: {len(results) - len(failed)}/{len(results)} simulazioni riuscite. Riepilogo: {summary_path}, KPI: {store_path}, intervalli: {ci_path}")
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,44 @@
+import os
+import sys
+import random
+from typing import List
+
+import pytest
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for p in (ROOT_DIR, os.path.join(ROOT_DIR, "Fase_1")):
+    if p not in sys.path:
+        sys.path.insert(0, p)
+
+
+def make_auction_users(n_users: int = 25, n_tasks: int = 60, bundle: int = 5, seed: int = 3, duplicates: bool = False) -> List:
+    from classes import User, Task
+    rnd = random.Random(seed)
+    tasks = [Task(j, 12.45 + rnd.random() * 0.05, 41.88 + rnd.random() * 0.05, value=rnd.uniform(1.0, 10.0)) for j in range(n_tasks)]
+    users = []
+    for i in range(n_users):
+        u = User(i + 1, 12.45, 41.88, cost_per_km=0.5)
+        u.tasks = rnd.sample(tasks, bundle)
+        if duplicates:
+            first = u.tasks[0]
+            u.tasks.append(Task(first.id, first.position[1], first.position[0], value=first.value + 7.0))
+        u.cost = rnd.uniform(2.0, 15.0)
+        u.bid = u.cost
+        users.append(u)
+    return users
+
+
+@pytest.fixture
+def auction_users():
+    return make_auction_users
+
+
+def make_raw_lines(n_lines: int = 600, n_drivers: int = 12, seed: int = 5, day: str = "2014-02-01") -> List[str]:
+    rnd = random.Random(seed)
+    lines = []
+    for k in range(n_lines):
+        hour, minute, second = (k * 3 // 60) % 4, (k * 3) % 60, rnd.randrange(60)
+        lines.append(f"{rnd.randrange(1, n_drivers + 1)};{day} {hour:02d}:{minute:02d}:{second:02d}+01;POINT({41.86 + rnd.random() * 0.08} {12.44 + rnd.random() * 0.1})")
+        if k % 97 == 0:
+            lines.append("riga;malformata")
+    return lines
@@ -0,0 +1,43 @@
+import pytest
+
+from conftest import make_raw_lines
+from Fase_1.data_manager import DataManager, latlon_to_cell
+
+
+@pytest.fixture
+def dataset(tmp_path):
+    raw_path = tmp_path / "raw.txt"
+    raw_path.write_text("\n".join(make_raw_lines(n_lines=1200)) + "\n", encoding="utf-8")
+    dm = DataManager(str(raw_path), out_dir=str(tmp_path / "ds"))
+    dm.parse_raw_to_csv(build_columnar=True)
+    return dm
+
+
+def _raw_last_positions(dm, hour, duration_hours):
+    latest = {}
+    for row in dm.get_window_records("2014-02-01", hour, duration_hours):
+        did, epoch = int(row["driver_id"]), int(row["epoch_ms"])
+        if did not in latest or epoch > latest[did][2]:
+            latest[did] = (float(row["lat"]), float(row["lon"]), epoch)
+    return latest
+
+
+def _raw_cell_counts(dm, hour, duration_hours, origin, cell_m):
+    counts = {}
+    for row in dm.get_window_records("2014-02-01", hour, duration_hours):
+        key = latlon_to_cell(float(row["lat"]), float(row["lon"]), origin[0], origin[1], cell_m)
+        counts[key] = counts.get(key, 0) + 1
+    return counts
+
+
+@pytest.mark.parametrize("hour,duration_hours", [("00", 1), ("01", 2), ("00", 4)])
+def test_aggregates_match_raw_records(dataset, hour, duration_hours):
+    origin, cell_m = (dataset.bbox[0], dataset.bbox[2]), 500.0
+    expected_last = _raw_last_positions(dataset, hour, duration_hours)
+    expected_cells = _raw_cell_counts(dataset, hour, duration_hours, origin, cell_m)
+    for _ in range(2):
+        assert dataset.get_last_positions("2014-02-01", hour, duration_hours) == expected_last
+        assert dataset.count_cells("2014-02-01", hour, duration_hours, origin, cell_m) == expected_cells
+    reloaded = DataManager(dataset.raw_txt_path, out_dir=dataset.out_dir)
+    assert reloaded.get_last_positions("2014-02-01", hour, duration_hours) == expected_last
+    assert reloaded.count_cells("2014-02-01", hour, duration_hours, origin, cell_m) == expected_cells
@@ -0,0 +1,173 @@
+import copy
+
+import numpy as np
+import pytest
+
+from Fase_2.classes_bounded import BoundedRationalUser, Task, FFTType, generate_bids, set_random_seed
+
+
+def make_bounded_users(n_users: int = 60, n_tasks: int = 40, seed: int = 9):
+    rng = np.random.default_rng(seed)
+    tasks = [Task(j, 12.40 + rng.random() * 0.15, 41.85 + rng.random() * 0.1, value=float(rng.uniform(1.8, 15.0)), is_community_task=bool(j % 2), quality_target=None) for j in range(n_tasks)]
+    users = []
+    for i in range(n_users):
+        user = BoundedRationalUser(i + 1, 12.40 + rng.random() * 0.15, 41.85 + rng.random() * 0.1, cost_per_km=float(rng.uniform(0.45, 0.70)), rationality_level=float(rng.uniform(0.3, 0.9)), global_seed=seed)
+        bundle = rng.choice(n_tasks, size=int(rng.integers(1, 7)), replace=True)
+        user.set_tasks([tasks[j] for j in bundle.tolist()])
+        users.append(user)
+    return users, tasks
+
+
+def _scalar_bids(users, skip=()):
+    set_random_seed(17)
+    out = {}
+    for user in users:
+        if user.id not in skip:
+            user.generate_bid()
+            out[user.id] = (user.cost, user.bid)
+    return out, np.random.random()
+
+
+def _batch_bids(users, skip_invalid=False):
+    set_random_seed(17)
+    bids = generate_bids(users, skip_invalid=skip_invalid)
+    return bids, np.random.random()
+
+
+def test_generate_bids_matches_scalar_path():
+    users, _ = make_bounded_users()
+    scalar_users = copy.deepcopy(users)
+    expected, next_draw = _scalar_bids(scalar_users)
+    bids, batch_next_draw = _batch_bids(users)
+    assert batch_next_draw == next_draw
+    assert bids.tolist() == [expected[u.id][1] for u in users]
+    for user in users:
+        assert (user.cost, user.bid) == expected[user.id]
+    assert [u._local_rng.random() for u in users] == [u._local_rng.random() for u in scalar_users]
+
+
+def test_generate_bids_isolates_invalid_users():
+    users, _ = make_bounded_users(n_users=20)
+    users[4].cost_per_km = float("nan")
+    users[11].cost_per_km = -1.0
+    scalar_users = copy.deepcopy(users)
+    expected, next_draw = _scalar_bids(scalar_users, skip={users[4].id, users[11].id})
+    with pytest.raises(ValueError, match=f"Utente {users[4].id}"):
+        generate_bids(copy.deepcopy(users))
+    bids, batch_next_draw = _batch_bids(users, skip_invalid=True)
+    assert batch_next_draw == next_draw
+    assert bids[4] == bids[11] == -1.0
+    assert users[4].bid == users[11].bid == -1.0
+    for idx, user in enumerate(users):
+        if idx not in (4, 11):
+            assert (user.cost, user.bid) == expected[user.id]
+            assert bids[idx] == user.bid
+
+
+def _scalar_fft_selection(user, tasks, max_tasks):
+    if user._local_rng.random() < user.deviation_prob:
+        return user._local_rng.sample(tasks, min(max_tasks, len(tasks)))
+    selected = []
+    for task, dist_m in zip(tasks, user.distances_to(tasks).tolist()):
+        decision, _ = user._evaluate_cue_sequential(task, user._estimate_expected_payment(task), dist_m)
+        if decision:
+            selected.append(task)
+            if len(selected) >= max_tasks:
+                break
+    return selected
+
+
+@pytest.mark.parametrize("fft_type", list(FFTType))
+@pytest.mark.parametrize("max_tasks", [0, 1, 3, 8])
+def test_fft_batch_selection_matches_sequential_cues(fft_type, max_tasks):
+    users, tasks = make_bounded_users(n_users=40, n_tasks=30, seed=max_tasks + 1)
+    rng = np.random.default_rng(5)
+    for k, user in enumerate(users):
+        user.fft_type = fft_type
+        user.deviation_prob = 0.0 if k % 4 else 0.5
+        if k % 5 == 0:
+            user.cue_ranking = user.cue_ranking[:1 + k % 3]
+        candidates = [tasks[j] for j in rng.choice(len(tasks), size=int(rng.integers(0, 25)), replace=True).tolist()]
+        reference = copy.deepcopy(user)
+        assert [t.id for t in user._select_fft_heuristic(candidates, max_tasks)] == [t.id for t in _scalar_fft_selection(reference, candidates, max_tasks)]
+        assert user._local_rng.random() == reference._local_rng.random()
+
+
+def test_fft_batch_cues_match_sequential_cues():
+    users, tasks = make_bounded_users(n_users=10, n_tasks=30)
+    values = np.array([t.value for t in tasks])
+    community = np.array([t.is_community_task for t in tasks])
+    for user in users:
+        for fft_type in FFTType:
+            user.fft_type = fft_type
+            distances = user.distances_to(tasks)
+            accepted, undecided = user._evaluate_cues_batch(distances, user._estimate_expected_payments(values), community)
+            sequential = [user._evaluate_cue_sequential(t, user._estimate_expected_payment(t), d) for t, d in zip(tasks, distances.tolist())]
+            assert accepted.tolist() == [decision for decision, _ in sequential]
+            assert undecided.tolist() == [reason == "rifiuto_default_finale" for _, reason in sequential]
+
+
+def test_moral_hazard_replications_match_analytic_means():
+    from Fase_2.classes_bounded import DETECTION_PROBABILITY, simulate_moral_hazard_replications, summarize_replications
+    p_defect = np.array([0.0, 0.2, 0.5, 0.3])
+    coverage = np.array([[1, 1, 0, 0, 0], [0, 1, 1, 0, 0], [0, 0, 1, 1, 0], [0, 0, 0, 0, 1]], dtype=float)
+    task_values = np.array([4.0, 2.0, 6.0, 3.0, 5.0])
+    payments, costs = np.array([5.0, 4.0, 3.0, 2.0]), np.array([4.0, 3.9, 2.5, 1.0])
+    samples = simulate_moral_hazard_replications(p_defect, np.ones(4), payments, costs, coverage, task_values, 40_000, rng=np.random.default_rng(0))
+    uncovered = np.prod(np.where(coverage > 0, p_defect[:, None], 1.0), axis=0)
+    expected_v = float(task_values @ (1.0 - uncovered))
+    assert samples["v_eff"].mean() == pytest.approx(expected_v, rel=0.01)
+    assert samples["u0_eff"] == pytest.approx(samples["v_eff"] - payments.sum())
+    assert samples["completion_rate"].mean() == pytest.approx(1.0 - DETECTION_PROBABILITY * p_defect.mean(), abs=0.005)
+    assert samples["actual_completion_rate"].mean() == pytest.approx(1.0 - p_defect.mean(), abs=0.005)
+    assert samples["detection_rate"].mean() == pytest.approx(DETECTION_PROBABILITY * p_defect.mean(), abs=0.005)
+    summary = summarize_replications(samples, confidence=0.9)
+    assert set(summary) == {f"mc_{name}_{stat}" for name in samples for stat in ("mean", "std", "ci_lower", "ci_upper")}
+    for name, values in samples.items():
+        assert summary[f"mc_{name}_mean"] == pytest.approx(values.mean())
+        assert summary[f"mc_{name}_std"] == pytest.approx(values.std(ddof=1))
+        assert summary[f"mc_{name}_ci_lower"] <= summary[f"mc_{name}_mean"] <= summary[f"mc_{name}_ci_upper"]
+    assert summary["mc_v_eff_ci_lower"] == pytest.approx(np.percentile(samples["v_eff"], 5.0))
+
+
+def test_moral_hazard_replications_degenerate_cases():
+    from Fase_2.classes_bounded import simulate_moral_hazard_replications, summarize_replications
+    coverage, task_values = np.eye(3), np.array([1.0, 2.0, 3.0])
+    payments, costs = np.array([2.0, 2.0, 2.0]), np.array([1.0, 2.5, 1.5])
+    samples = simulate_moral_hazard_replications(np.zeros(3), np.ones(3), payments, costs, coverage, task_values, 2500, rng=np.random.default_rng(1))
+    assert (samples["v_eff"] == 6.0).all() and (samples["completion_rate"] == 1.0).all() and (samples["detection_rate"] == 0.0).all()
+    assert (samples["actual_completion_rate"] == 1.0).all()
+    guaranteed = simulate_moral_hazard_replications(np.full(3, 0.9), np.zeros(3), payments, costs, coverage, task_values, 500, rng=np.random.default_rng(3), penalties=np.array([0.0, 0.0, 5.0]), guaranteed=np.array([True, False, False]))
+    assert (guaranteed["v_eff"] >= 1.0).all() and (guaranteed["actual_completion_rate"] >= 1.0 / 3.0).all()
+    assert guaranteed["detection_rate"].max() <= 2.0 / 3.0
+    assert (guaranteed["ir_violation_rate"] >= 1.0 / 3.0).all() and guaranteed["ir_violation_rate"].max() == pytest.approx(2.0 / 3.0)
+    assert samples["ir_violation_rate"] == pytest.approx(np.full(2500, 1.0 / 3.0))
+    first, second = (simulate_moral_hazard_replications(np.full(3, 0.4), np.full(3, 0.5), payments, costs, coverage, task_values, 1500, rng=np.random.default_rng(2)) for _ in range(2))
+    assert all((first[name] == second[name]).all() for name in first)
+    assert summarize_replications({"v_eff": np.array([3.0])})["mc_v_eff_std"] == 0.0
+    with pytest.raises(ValueError):
+        simulate_moral_hazard_replications(np.zeros(3), np.ones(3), payments, costs, coverage, task_values, 0)
+
+
+def test_moral_hazard_replications_follow_scalar_completion_model():
+    from Fase_2.classes_bounded import simulate_moral_hazard_replications
+    from Fase_3.classes_adaptive import AdaptiveUser
+    users = [AdaptiveUser(i + 1, 12.45, 41.9, cost_per_km=0.3, rationality_level=rho, global_seed=5) for i, rho in enumerate((0.9, 0.4))]
+    for user in users:
+        user.payment, user.cost, user.reputation = 4.0, 3.0, 0.6
+    assert users[0].completion_guaranteed() and not users[1].completion_guaranteed()
+    outcomes = []
+    for _ in range(4000):
+        for user in users:
+            user.reputation, user.penalty_accumulated = 0.6, 0.0
+            user.attempt_task_completion()
+        outcomes.append([(u.completed, u.actually_completed, u.penalty_accumulated) for u in users])
+    assert all(o[0] == (True, True, 0.0) for o in outcomes)
+    penalties = {o[1][2] for o in outcomes} - {0.0}
+    assert penalties == {users[1].detection_penalty(4.0, 0.6)}
+    scalar_completed = np.mean([o[1][0] for o in outcomes])
+    scalar_honest = np.mean([o[1][1] for o in outcomes])
+    samples = simulate_moral_hazard_replications(np.array([u.p_defect_base for u in users]), np.full(2, 0.6), np.full(2, 4.0), np.full(2, 3.0), np.eye(2), np.ones(2), 40_000, rng=np.random.default_rng(7), penalties=np.array([u.detection_penalty(4.0, 0.6) for u in users]), guaranteed=np.array([u.completion_guaranteed() for u in users]))
+    assert samples["completion_rate"].mean() == pytest.approx((1.0 + scalar_completed) / 2.0, abs=0.01)
+    assert samples["actual_completion_rate"].mean() == pytest.approx((1.0 + scalar_honest) / 2.0, abs=0.01)
+    assert samples["ir_violation_rate"].mean() == pytest.approx((1.0 - scalar_completed) / 2.0, abs=0.01)
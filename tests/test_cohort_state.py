@@ -0,0 +1,112 @@
+import copy
+
+import numpy as np
+import pytest
+
+from Fase_3.classes_adaptive import AdaptiveUser, TaskAdaptive, CohortState
+
+
+def make_cohort(n_users: int = 30, seed: int = 4):
+    rng = np.random.default_rng(seed)
+    tasks = [TaskAdaptive(j, 12.4 + rng.random() * 0.1, 41.85 + rng.random() * 0.1, value=float(rng.uniform(1.8, 15.0)), is_community_task=False, quality_target=0.5, required_reliability=0.2, feedback_weight=float(rng.uniform(1.0, 2.5))) for j in range(50)]
+    users = []
+    for i in range(n_users):
+        user = AdaptiveUser(i + 1, 12.4 + rng.random() * 0.1, 41.85 + rng.random() * 0.1, cost_per_km=0.5, rationality_level=float(rng.uniform(0.3, 0.9)), global_seed=seed)
+        user.set_tasks([tasks[j] for j in rng.choice(50, size=int(rng.integers(0, 5)), replace=False).tolist()])
+        users.append(user)
+    return users, tasks, rng
+
+
+def _state(users):
+    return [tuple(getattr(u, name) for name in CohortState.LEARNING_FIELDS) for u in users]
+
+
+def test_cohort_state_round_trip():
+    users, _, _ = make_cohort()
+    cohort = CohortState(users)
+    assert len(cohort) == len(users)
+    assert cohort.ids.tolist() == [u.id for u in users]
+    assert list(zip(*(getattr(cohort, name).tolist() for name in CohortState.LEARNING_FIELDS))) == _state(users)
+    before = _state(users)
+    rows = np.array([2, 5, 17])
+    cohort.reputation[rows] = 0.25
+    cohort.rho_observation_count[rows] = 9
+    cohort.push(rows)
+    after = _state(users)
+    for i, user in enumerate(users):
+        if i in rows:
+            assert user.reputation == 0.25 and user.rho_observation_count == 9
+            assert type(user.rho_observation_count) is int
+        else:
+            assert after[i] == before[i]
+    users[3].reputation_quality = 0.4
+    cohort.pull()
+    assert cohort.reputation_quality[3] == 0.4 and cohort.reputation[2] == 0.25
+
+
+@pytest.mark.parametrize("n_rounds", [1, 3])
+def test_cohort_update_matches_per_user_update(n_rounds):
+    users, tasks, rng = make_cohort()
+    reference = copy.deepcopy(users)
+    cohort = CohortState(users)
+    ref_tasks = {t.id: t for u in reference for t in u.tasks}
+    for _ in range(n_rounds):
+        winner_ids = set(rng.choice([u.id for u in users], size=12, replace=False).tolist())
+        completed = {u.id: bool(rng.random() < 0.7) for u in users}
+        for task in tasks:
+            task.feedback_quality = float(rng.uniform(0.3, 1.0)) if rng.random() < 0.6 else None
+            if task.id in ref_tasks:
+                ref_tasks[task.id].feedback_quality = task.feedback_quality
+        for user, ref in zip(users, reference):
+            user.actually_completed = ref.actually_completed = completed[user.id]
+        rows, failed = cohort.update_platform_beliefs(winner_ids)
+        assert failed == []
+        for ref in reference:
+            ref.update_platform_beliefs(was_winner=ref.id in winner_ids, task_list=ref.tasks)
+        assert sorted(users[i].id for i in rows.tolist()) == sorted(u.id for u in users if u.id in winner_ids and u.tasks)
+        for got, expected in zip(_state(users), _state(reference)):
+            assert got == pytest.approx(expected, rel=1e-12, abs=1e-15)
+
+
+def test_cohort_update_isolates_failing_user():
+    users, tasks, rng = make_cohort()
+    reference = copy.deepcopy(users)
+    cohort = CohortState(users)
+    winners = [u for u in users if u.tasks][:6]
+    for task in tasks:
+        task.feedback_quality = 0.8
+    for ref in reference:
+        for task in ref.tasks:
+            task.feedback_quality = 0.8
+    bad = winners[2]
+    bad_before = tuple(getattr(bad, name) for name in CohortState.LEARNING_FIELDS)
+    bad.tasks[0].feedback_weight = "n/d"
+    rows, failed = cohort.update_platform_beliefs({u.id for u in winners})
+    assert failed == [bad.id]
+    assert sorted(users[i].id for i in rows.tolist()) == sorted(u.id for u in winners if u is not bad and bad.tasks[0] not in u.tasks)
+    assert tuple(getattr(bad, name) for name in CohortState.LEARNING_FIELDS) == bad_before
+    by_id = {u.id: u for u in reference}
+    for i in rows.tolist():
+        ref = by_id[users[i].id]
+        ref.update_platform_beliefs(was_winner=True, task_list=ref.tasks)
+        assert _state([users[i]])[0] == pytest.approx(_state([ref])[0], rel=1e-12, abs=1e-15)
+
+
+def test_cohort_reset_hour_keeps_sanctions_in_state():
+    users, _, _ = make_cohort(n_users=5)
+    cohort = CohortState(users)
+    assert np.isneginf(cohort.blacklisted_until).all() and cohort.eligible_mask(0.0).all()
+    users[1].payment = 3.0
+    users[1].is_winner = True
+    users[1].penalty_accumulated = 1.5
+    users[1].record_defection_detected(0.0)
+    users[1].record_defection_detected(0.0)
+    users[1].record_defection_detected(0.0)
+    cohort.reset_hour()
+    assert users[1].payment == 0.0 and not users[1].is_winner
+    assert cohort.penalty_accumulated[1] == 0.0 and users[1].penalty_accumulated == 0.0 and cohort.blacklist_strikes[1] == 3
+    assert cohort.blacklisted_until[1] == users[1].blacklisted_until
+    assert cohort.eligible_mask(3600.0).tolist() == [True, False, True, True, True]
+    cohort.blacklisted_until[1] = -np.inf
+    cohort.push(np.array([1]), CohortState.SANCTION_FIELDS)
+    assert users[1].blacklisted_until is None
@@ -0,0 +1,99 @@
+import json
+import os
+
+import pytest
+
+from conftest import make_raw_lines
+from Fase_1.data_manager import DataManager
+
+
+def _read_partitions(dm: DataManager):
+    return {name: open(os.path.join(dm.part_dir, name), encoding="utf-8").read() for name in sorted(os.listdir(dm.part_dir))}
+
+
+@pytest.mark.parametrize("workers", [0, 2])
+def test_incremental_etl_matches_full_with_partial_trailing_line(tmp_path, workers):
+    lines = make_raw_lines()
+    raw_path = tmp_path / "raw.txt"
+    head, partial = "\n".join(lines[:400]) + "\n", lines[400][:17]
+    raw_path.write_text(head + partial, encoding="utf-8")
+    inc = DataManager(str(raw_path), out_dir=str(tmp_path / "inc"))
+    inc.parse_raw_to_csv(workers=workers, build_columnar=False)
+    manifest = inc.load_manifest()
+    assert manifest["raw_bytes_processed"] == len(head.encode())
+    assert manifest["raw_size"] == len((head + partial).encode())
+    assert not inc.needs_etl()
+    raw_path.write_text(head + "\n".join(lines[400:]) + "\n", encoding="utf-8")
+    assert inc.needs_etl()
+    inc_meta = inc.parse_raw_to_csv(workers=workers, build_columnar=False, incremental=True)
+    full = DataManager(str(raw_path), out_dir=str(tmp_path / "full"))
+    full_meta = full.parse_raw_to_csv(workers=workers, build_columnar=False)
+    assert _read_partitions(inc) == _read_partitions(full)
+    for key in ("records_written", "records_rejected", "unique_drivers", "effective_bbox", "time_range", "master_records_written"):
+        assert inc_meta[key] == full_meta[key]
+    inc_manifest, full_manifest = inc.load_manifest(), full.load_manifest()
+    assert inc_manifest["partitions"] == full_manifest["partitions"]
+    assert inc_manifest["raw_bytes_processed"] == full_manifest["raw_bytes_processed"] == os.path.getsize(raw_path)
+    assert not inc.needs_etl()
+
+
+def test_sequential_and_parallel_etl_agree(tmp_path):
+    raw_path = tmp_path / "raw.txt"
+    raw_path.write_text("\n".join(make_raw_lines(n_lines=900)) + "\n", encoding="utf-8")
+    outputs = []
+    for workers in (0, 3):
+        dm = DataManager(str(raw_path), out_dir=str(tmp_path / f"w{workers}"))
+        dm.parse_raw_to_csv(workers=workers, build_columnar=False)
+        extras = [open(os.path.join(dm.out_dir, name), encoding="utf-8").read() for name in ("rejects.csv", "master_sample.csv")]
+        outputs.append((_read_partitions(dm), json.load(open(dm.manifest_path))["partitions"], extras))
+        assert not os.path.exists(os.path.join(dm.out_dir, "_etl_chunks"))
+    assert outputs[0] == outputs[1]
+
+
+def test_sequential_etl_reports_partial_progress_on_write_error(tmp_path, monkeypatch, capsys):
+    raw_path = tmp_path / "raw.txt"
+    raw_path.write_text("\n".join(make_raw_lines()) + "\n", encoding="utf-8")
+    dm = DataManager(str(raw_path), out_dir=str(tmp_path / "out"))
+    calls = []
+    def failing_fsync(fd):
+        calls.append(fd)
+        if len(calls) == 1:
+            raise OSError("disco pieno")
+    monkeypatch.setattr(os, "fsync", failing_fsync)
+    with pytest.raises(OSError, match="disco pieno"):
+        dm.parse_raw_to_csv(build_columnar=False, checkpoint_interval=50)
+    out = capsys.readouterr().out
+    assert "Errore I/O critico" in out and "Record scritti: 50" in out
+
+
+def test_legacy_dataset_without_manifest_is_reindexed(tmp_path):
+    raw_path = tmp_path / "raw.txt"
+    raw_path.write_text("\n".join(make_raw_lines()) + "\n", encoding="utf-8")
+    dm = DataManager(str(raw_path), out_dir=str(tmp_path / "out"))
+    dm.parse_raw_to_csv(build_columnar=False)
+    expected = _read_partitions(dm)
+    os.remove(dm.manifest_path)
+    assert dm._iter_partitions_for_window("2014-02-01", "00", 2)
+    assert dm.needs_etl()
+    with pytest.warns(UserWarning, match="rimozione di"):
+        dm.parse_raw_to_csv(build_columnar=False, incremental=True)
+    assert _read_partitions(dm) == expected
+    assert dm.load_manifest() is not None and not dm.needs_etl()
+
+
+def test_partition_aggregates_are_shared_across_managers(tmp_path, monkeypatch):
+    raw_path = tmp_path / "raw.txt"
+    raw_path.write_text("\n".join(make_raw_lines()) + "\n", encoding="utf-8")
+    first = DataManager(str(raw_path), out_dir=str(tmp_path / "ds"))
+    first.parse_raw_to_csv()
+    partition = os.path.join(first.part_dir, sorted(os.listdir(first.part_dir))[0])
+    builds = []
+    def build(columns):
+        builds.append(1)
+        return {"n": columns["lat"][:3]}
+    loaded = first._load_aggregate(partition, "test", [], build)
+    second = DataManager(str(raw_path), out_dir=str(tmp_path / "ds"))
+    assert second._load_aggregate(partition, "test", [], build) is loaded and builds == [1]
+    monkeypatch.setattr(DataManager, "AGGREGATE_CACHE_MAX", 1)
+    second._load_aggregate(partition, "other", [], build)
+    assert len(second._aggregate_cache) == 1 and builds == [1, 1]
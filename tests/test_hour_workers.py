@@ -0,0 +1,41 @@
+import pytest
+
+from conftest import make_raw_lines
+from Fase_1.fase_1 import ExperimentConfig, run_experiment, hour_seed
+
+
+def _run(tmp_path, raw_path, workers, sink=None):
+    rows = []
+    config = ExperimentConfig(raw_data_path=str(raw_path), day="2014-02-01", hour_start=0, hour_end=4, block_size=2, cell_size_m=500, task_radius_m=2500.0, bbox=None, max_users=40, cost_params=(0.45, 0.70), value_mode="uniform", norm_mode="percentiles", percentile_low=2.0, percentile_high=98.0, plot_dpi=30, output_dir=str(tmp_path / f"out_w{workers}"), random_seed=7, save_raw_logs=False, verify_properties=False, dataset_out=str(tmp_path / "ds"), workers=workers)
+    run_experiment(config, kpi_sink=sink or rows.append)
+    return sorted(rows, key=lambda row: row["hour"])
+
+
+def test_hour_seed_is_stable_and_distinct():
+    seeds = [hour_seed(7, "2014-02-01", hour) for hour in range(24)]
+    assert seeds == [hour_seed(7, "2014-02-01", hour) for hour in range(24)]
+    assert len(set(seeds)) == 24
+    assert hour_seed(7, "2014-02-02", 0) != seeds[0] and hour_seed(8, "2014-02-01", 0) != seeds[0]
+
+
+def test_parallel_hour_blocks_match_sequential(tmp_path):
+    raw_path = tmp_path / "raw.txt"
+    raw_path.write_text("\n".join(make_raw_lines(n_lines=2400, n_drivers=30)) + "\n", encoding="utf-8")
+    default = _run(tmp_path, raw_path, workers=0)
+    sequential = _run(tmp_path, raw_path, workers=1)
+    parallel = _run(tmp_path, raw_path, workers=2)
+    assert [row["hour"] for row in sequential] == [0, 1, 2, 3]
+    assert parallel == sequential == default
+
+
+@pytest.mark.parametrize("workers", [0, 1, 2])
+def test_kpi_rows_are_emitted_before_daily_aggregates(tmp_path, workers):
+    raw_path = tmp_path / "raw.txt"
+    raw_path.write_text("\n".join(make_raw_lines(n_lines=2400, n_drivers=30)) + "\n", encoding="utf-8")
+    daily_csv = tmp_path / f"out_w{workers}" / "day_2014-02-01" / "2014-02-01_hourly_kpi.csv"
+    seen = []
+    def sink(row):
+        assert not daily_csv.exists()
+        seen.append(row["hour"])
+    _run(tmp_path, raw_path, workers, sink=sink)
+    assert seen == [0, 1, 2, 3] and daily_csv.exists()
@@ -0,0 +1,112 @@
+import pytest
+
+from conftest import make_auction_users
+from Fase_1.imcu import IMCUAuction, run_imcu_auction, validate_users_cached, users_fingerprint, _validate_users, VALIDATION_LEVELS
+import Fase_1.imcu as imcu_base
+
+
+@pytest.mark.parametrize("duplicates", [False, True])
+def test_compiled_coverage_matches_set_path(duplicates):
+    users = make_auction_users(duplicates=duplicates)
+    plain = IMCUAuction(users, debug=False, verify_properties=False)
+    compiled = IMCUAuction(users, debug=False, verify_properties=False, compiled_coverage=True)
+    covered_plain, covered_compiled = plain._new_covered(), compiled._new_covered()
+    for u in users[:10]:
+        assert plain._marginal_value(u, covered_plain, "sel") == pytest.approx(compiled._marginal_value(u, covered_compiled, "sel"))
+        plain._add_user_tasks_to_covered(u, covered_plain)
+        compiled._add_user_tasks_to_covered(u, covered_compiled)
+    assert plain._marginal_values(users, covered_plain, "sel") == pytest.approx(compiled._marginal_values(users, covered_compiled, "sel"))
+    winners_plain, payments_plain, _ = run_imcu_auction(users, debug=False, verify_properties=False)
+    winners_compiled, payments_compiled, _ = run_imcu_auction(users, debug=False, verify_properties=False, compiled_coverage=True)
+    assert winners_plain == winners_compiled
+    assert payments_plain == pytest.approx(payments_compiled)
+
+
+@pytest.mark.parametrize("seed", [1, 2, 3, 4])
+def test_lazy_greedy_matches_plain_greedy(seed):
+    users = make_auction_users(n_users=40, n_tasks=80, bundle=6, seed=seed)
+    if seed % 2 == 0:
+        for u in users:
+            u.bid = u.cost = float(round(u.cost))
+            for t in u.tasks:
+                t.value = float(round(t.value))
+    winners_plain, payments_plain, diag_plain = run_imcu_auction(users, debug=False, verify_properties=False)
+    winners_lazy, payments_lazy, diag_lazy = run_imcu_auction(users, debug=False, verify_properties=False, lazy_greedy=True)
+    assert winners_lazy == winners_plain
+    assert payments_lazy == pytest.approx(payments_plain)
+    assert diag_lazy["mv_calls_selection"] <= diag_plain["mv_calls_selection"]
+    selection_plain = IMCUAuction(users, debug=False, verify_properties=False)._selection_phase()
+    selection_lazy = IMCUAuction(users, debug=False, verify_properties=False, lazy_greedy=True)._selection_phase()
+    assert [u.id for u in selection_lazy] == [u.id for u in selection_plain]
+
+
+def test_validation_levels(monkeypatch):
+    monkeypatch.setattr(imcu_base, "_VALIDATED_SNAPSHOTS", {})
+    calls = []
+    def counting_validator(users):
+        calls.append(len(users))
+        return _validate_users(users)
+    users = make_auction_users()
+    expected = [u.id for u in sorted(users, key=lambda u: u.id)]
+    for level in VALIDATION_LEVELS:
+        assert [u.id for u in validate_users_cached(users, counting_validator, level)] == expected
+    assert len(calls) == 2
+    validate_users_cached(users, counting_validator, "hourly")
+    assert len(calls) == 2
+    users[3].bid += 1.0
+    validate_users_cached(users, counting_validator, "hourly")
+    assert len(calls) == 3
+    users[3].tasks = users[3].tasks[:-1]
+    validate_users_cached(users, counting_validator, "hourly")
+    assert len(calls) == 4
+    assert users_fingerprint(users) == users_fingerprint(list(users))
+    assert users_fingerprint(users) != users_fingerprint(users[:-1])
+    users[0].bid = -1.0
+    for level in ("full", "hourly"):
+        with pytest.raises(ValueError):
+            validate_users_cached(users, _validate_users, level)
+    validate_users_cached(users, _validate_users, "off")
+    with pytest.raises(ValueError):
+        validate_users_cached(users, _validate_users, "sempre")
+
+
+def test_property_checks_do_not_depend_on_verification_workers():
+    users = make_auction_users(n_users=12, n_tasks=30, bundle=4, seed=5)
+    reports = []
+    for workers in (0, 2):
+        _, _, diag = run_imcu_auction(users, debug=True, verify_properties=True, verification_workers=workers)
+        reports.append({k: v for k, v in diag["property_checks"].items() if k != "Submodularity"})
+    assert reports[0] == reports[1]
+    for bad in (-1, 1.5, True):
+        with pytest.raises(ValueError):
+            IMCUAuction(users, verification_workers=bad)
+
+
+def test_fingerprint_covers_validated_user_fields():
+    from Fase_3.classes_adaptive import AdaptiveUser, TaskAdaptive
+    task = TaskAdaptive(1, 12.45, 41.9, value=5.0, is_community_task=False, quality_target=0.5, required_reliability=0.2, feedback_weight=1.0)
+    user = AdaptiveUser(1, 12.45, 41.9, cost_per_km=0.5, rationality_level=0.6, global_seed=3)
+    user.set_tasks([task])
+    base = users_fingerprint([user])
+    changes = {"position": (41.0, 12.0), "cost": 2.5, "cost_per_km": 0.6, "rationality_level": 0.95, "p_defect": 0.5, "reputation": 0.2, "penalty_accumulated": 1.0, "blacklisted_until": 7200.0, "blacklist_strikes": 2, "estimated_rationality": 1.5, "rho_alpha": -1.0, "reputation_reliability": 0.3, "reputation_quality": 0.3, "mdr_observation_count": 0}
+    for attr, value in changes.items():
+        old = getattr(user, attr)
+        setattr(user, attr, value)
+        assert users_fingerprint([user]) != base or value == old, attr
+        setattr(user, attr, old)
+    assert users_fingerprint([user]) == base
+
+
+def test_rational_auction_validates_users_once(monkeypatch):
+    from Fase_2 import imcu_bounded
+    from Fase_2.classes_bounded import generate_bids, set_random_seed
+    from test_classes_bounded import make_bounded_users
+    users, _ = make_bounded_users(n_users=12, n_tasks=20)
+    set_random_seed(9)
+    generate_bids(users)
+    calls = []
+    validator = imcu_bounded._validate_users_rational
+    monkeypatch.setattr(imcu_bounded, "_validate_users_rational", lambda users: calls.append(len(users)) or validator(users))
+    monkeypatch.setattr(imcu_bounded.imcu_base, "_validate_users", lambda users: pytest.fail("validazione base ripetuta"))
+    auction = imcu_bounded.IMCUAuctionRational(users, debug=False, verify_properties=False, validation="full")
+    assert calls == [12] and [u.id for u in auction.users] == sorted(u.id for u in users)
@@ -0,0 +1,122 @@
+import logging
+
+import numpy as np
+import pytest
+
+from Fase_2.classes_bounded import generate_bids, set_random_seed
+from Fase_3.classes_adaptive import AdaptiveUser, TaskAdaptive, CohortState
+from Fase_3.imcu_adaptive import run_imcu_auction_adaptive, compute_eligibility_masks
+from Fase_3.data_manager_adaptive import DataManagerAdaptive
+from Fase_3.fase_3 import assign_tasks_to_users
+
+
+def make_adaptive_auction(n_users: int = 30, n_tasks: int = 40, seed: int = 6):
+    rng = np.random.default_rng(seed)
+    tasks = [TaskAdaptive(j, 12.4 + rng.random() * 0.1, 41.85 + rng.random() * 0.1, value=float(rng.uniform(5.0, 25.0)), is_community_task=False, quality_target=float(rng.choice([0.2, 0.5, 0.9])), required_reliability=0.2, feedback_weight=1.0) for j in range(n_tasks)]
+    users = []
+    for i in range(n_users):
+        user = AdaptiveUser(i + 1, 12.4 + rng.random() * 0.1, 41.85 + rng.random() * 0.1, cost_per_km=0.2, rationality_level=float(rng.uniform(0.3, 0.9)), global_seed=seed)
+        user.set_tasks([tasks[j] for j in rng.choice(n_tasks, size=int(rng.integers(1, 5)), replace=False).tolist()])
+        user.estimated_rationality = float(rng.uniform(0.3, 0.9))
+        users.append(user)
+    set_random_seed(seed)
+    generate_bids(users)
+    return users, tasks
+
+
+def _snapshot(users):
+    return [(u.id, [t.id for t in u.tasks], u.payment, u.utility, u.is_winner, u.completed, u.actually_completed, u.reputation, u.penalty_accumulated) for u in users]
+
+
+@pytest.mark.parametrize("compiled_coverage", [False, True])
+def test_adaptive_auction_applies_outcomes_to_winners_only(compiled_coverage):
+    users, tasks = make_adaptive_auction()
+    before = _snapshot(users)
+    bundles = {u.id: list(u.tasks) for u in users}
+    winners, payments, diag = run_imcu_auction_adaptive(users, tasks, current_time=0.0, debug=False, compiled_coverage=compiled_coverage, validation="off")
+    assert winners and set(payments) == winners
+    user_mask, owners, pair_tasks, pair_mask = compute_eligibility_masks(users, {t.id: t for t in tasks}, 0.0)
+    eligible = {}
+    for i, task, ok in zip(owners.tolist(), pair_tasks, pair_mask.tolist()):
+        if ok:
+            eligible.setdefault(users[i].id, []).append(task.id)
+    for u, snap in zip(users, before):
+        if u.id in winners:
+            assert u.is_winner and u.payment == pytest.approx(payments[u.id])
+            assert [t.id for t in u.tasks] == eligible[u.id]
+            assert u.completed or not u.actually_completed
+        else:
+            assert _snapshot([u])[0] == snap and u.tasks == bundles[u.id]
+    completed = {u.id for u in users if u.id in winners and u.actually_completed}
+    assert set(diag["property_checks"]["AdaptiveGAPMetrics"]["completed_tasks_by_winner"]) == completed
+    assert diag["covered_tasks_count"] <= len({tid for ids in eligible.values() for tid in ids})
+    assert diag["n_users_eligible"] == len(eligible)
+
+
+def test_cohort_learning_observes_auction_outcomes():
+    users, tasks = make_adaptive_auction(n_users=40, seed=11)
+    cohort = CohortState(users)
+    winners, _, _ = run_imcu_auction_adaptive(users, tasks, current_time=0.0, debug=False, validation="off")
+    alpha_before = cohort.rho_alpha.copy()
+    rows, failed = cohort.update_platform_beliefs(winners)
+    assert failed == [] and sorted(cohort.users[i].id for i in rows.tolist()) == sorted(winners)
+    outcomes = np.array([cohort.users[i].actually_completed for i in rows.tolist()])
+    assert outcomes.any() and not outcomes.all()
+    assert (cohort.rho_alpha[rows] - alpha_before[rows] == outcomes.astype(float)).all()
+    cohort.reset_hour()
+    assert not any(u.is_winner or u.actually_completed or u.penalty_accumulated for u in users)
+
+
+def test_adaptive_auction_compiled_coverage_matches_plain():
+    users, tasks = make_adaptive_auction(seed=8)
+    plain = run_imcu_auction_adaptive(users, tasks, current_time=0.0, debug=False, validation="off")
+    users, tasks = make_adaptive_auction(seed=8)
+    compiled = run_imcu_auction_adaptive(users, tasks, current_time=0.0, debug=False, compiled_coverage=True, validation="off")
+    assert plain[0] == compiled[0]
+    assert plain[1] == pytest.approx(compiled[1])
+    assert plain[2]["platform_value_vS"] == pytest.approx(compiled[2]["platform_value_vS"])
+
+
+def test_reliability_filter_is_enforced_by_default():
+    users, tasks = make_adaptive_auction()
+    for u in users[:10]:
+        u.reputation = 0.25 if u.id % 2 else 0.5
+    for t in tasks:
+        t.required_reliability = 0.6
+    tasks_map = {t.id: t for t in tasks}
+    strict = compute_eligibility_masks(users, tasks_map, 0.0)
+    relaxed = compute_eligibility_masks(users, tasks_map, 0.0, enforce_reliability=False)
+    owners = strict[1]
+    low = np.array([users[i].reputation < 0.6 for i in owners.tolist()], dtype=bool)
+    assert not strict[3][low].any() and relaxed[3][low].any()
+    assert (strict[3][~low] == relaxed[3][~low]).all()
+
+
+def test_eligibility_masks_from_cohort_state_match_users():
+    users, tasks = make_adaptive_auction()
+    users[3].reputation = 0.1
+    users[5].blacklisted_until = 100.0
+    cohort = CohortState(users)
+    subset = users[::-1][5:]
+    tasks_map = {t.id: t for t in tasks}
+    plain = compute_eligibility_masks(subset, tasks_map, 50.0, enforce_reliability=True)
+    from_state = compute_eligibility_masks(subset, tasks_map, 50.0, enforce_reliability=True, cohort=cohort)
+    assert plain[0].tolist() == from_state[0].tolist() and not plain[0].all()
+    assert plain[1].tolist() == from_state[1].tolist() and plain[2] == from_state[2]
+    assert plain[3].tolist() == from_state[3].tolist()
+
+
+def test_task_assignment_uses_data_manager_grid(tmp_path, monkeypatch):
+    users, tasks = make_adaptive_auction(seed=4)
+    dm = DataManagerAdaptive(str(tmp_path / "raw.txt"), out_dir=str(tmp_path / "out"))
+    dm._grid_cell_m_current, dm._grid_origin_current = 250, (41.8, 12.3)
+    built = []
+    build = dm.build_task_index
+    monkeypatch.setattr(dm, "build_task_index", lambda *args, **kwargs: built.append(build(*args, **kwargs)) or built[-1])
+    radius_m = 1500.0
+    assigned = assign_tasks_to_users(users, tasks, dm, radius_m, logging.getLogger(__name__))
+    assert len(built) == 1 and built[0].cell_m == 250 * int(radius_m // 500) and (built[0].origin_lat, built[0].origin_lon) == (41.8, 12.3)
+    for u in users:
+        expected = [t for t, d in zip(tasks, u.distances_to(tasks).tolist()) if d <= radius_m]
+        assert u.tasks == expected
+    assert assigned == sum(1 for u in users if u.tasks)
@@ -0,0 +1,43 @@
+import csv
+import os
+
+import sweep
+from Fase_1 import fase_1
+
+
+def _run():
+    return sweep.SweepRun(phase="F1", day="2014-02-01", seed=7, radius_m=2500.0, rationality=None, output_dir="unused")
+
+
+def test_execute_run_fails_without_hourly_results(monkeypatch, tmp_path):
+    monkeypatch.setattr(sweep, "build_config", lambda run, settings: None)
+    monkeypatch.setattr(fase_1, "run_experiment", lambda config, kpi_sink=None: None)
+    result = sweep.execute_run(_run(), {"kpi_spool_dir": str(tmp_path)})
+    assert not result["ok"] and result["error"] and result["kpi_rows"] == 0
+
+
+def test_execute_run_streams_hourly_rows_to_spool(monkeypatch, tmp_path):
+    seen = []
+    def fake_run(config, kpi_sink=None):
+        for hour in range(3):
+            kpi_sink({"day": "2014-02-01", "hour": hour, "n_winners": float(hour)})
+            seen.append(len(list(sweep.read_kpi_spool(spool[0]))))
+    spool = []
+    real_mkstemp = sweep.tempfile.mkstemp
+    def mkstemp(**kwargs):
+        fd, path = real_mkstemp(**kwargs)
+        spool.append(path)
+        return fd, path
+    monkeypatch.setattr(sweep.tempfile, "mkstemp", mkstemp)
+    monkeypatch.setattr(sweep, "build_config", lambda run, settings: None)
+    monkeypatch.setattr(fase_1, "run_experiment", fake_run)
+    result = sweep.execute_run(_run(), {"kpi_spool_dir": str(tmp_path)})
+    assert result["ok"] and result["kpi_rows"] == 3 and "kpi_spool" in result
+    assert seen == [1, 2, 3]
+    aggregator = sweep.KpiAggregator(str(tmp_path / "kpi.csv"), str(tmp_path / "ci.csv"))
+    sweep.ingest_kpi_spool(aggregator, _run(), result)
+    assert not os.path.exists(spool[0]) and "kpi_spool" not in result
+    with open(tmp_path / "kpi.csv", encoding="utf-8") as f:
+        rows = list(csv.DictReader(f))
+    assert [(row["hour"], row["kpi"], row["value"]) for row in rows] == [("0", "n_winners", "0.0"), ("1", "n_winners", "1.0"), ("2", "n_winners", "2.0")]
+    assert aggregator.rows_written == 3 and aggregator.stats[("F1", "raggio_2500", "n_winners")].mean == 1.0
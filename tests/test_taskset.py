@@ -0,0 +1,59 @@
+import numpy as np
+import pytest
+
+from Fase_1.classes import Task, TaskSet
+from Fase_3.classes_adaptive import TaskAdaptive
+
+SLOTS = ("id", "position", "value", "is_community_task", "quality_target", "group_id", "required_reliability", "feedback_weight", "feedback_quality", "completion_timestamp", "feedback_notes")
+
+
+def _columns(n, rng):
+    return {
+        "quality_target": [None if k % 3 else float(q) for k, q in enumerate(rng.uniform(0.4, 0.6, n))],
+        "required_reliability": rng.uniform(0.0, 0.9, n).tolist(),
+        "feedback_weight": rng.uniform(1.0, 2.5, n).tolist(),
+    }
+
+
+def test_taskset_views_match_object_path():
+    rng = np.random.default_rng(11)
+    n = 40
+    ids, lat, lon, values = np.arange(n) + 100, rng.uniform(41.8, 42.0, n), rng.uniform(12.4, 12.6, n), rng.uniform(1.8, 15.0, n)
+    columns = _columns(n, rng)
+    task_set = TaskSet(ids, lat, lon, values).with_task_cls(TaskAdaptive, columns=columns)
+    expected = [TaskAdaptive(int(ids[k]), float(lon[k]), float(lat[k]), value=float(values[k]), is_community_task=False, **{name: column[k] for name, column in columns.items()}) for k in range(n)]
+    for via_index, via_list, obj in zip([task_set[k] for k in range(n)], task_set.to_list(), expected):
+        assert via_index is via_list
+        assert {name: getattr(via_list, name) for name in SLOTS} == {name: getattr(obj, name) for name in SLOTS}
+    assert TaskSet.from_tasks(expected).to_list() == expected
+
+
+@pytest.mark.parametrize("name,bad", [("quality_target", 1.2), ("quality_target", float("nan")), ("required_reliability", -0.1), ("required_reliability", 1.5), ("feedback_weight", -1.0)])
+def test_taskset_validates_adaptive_columns(name, bad):
+    rng = np.random.default_rng(3)
+    n = 10
+    columns = _columns(n, rng)
+    columns[name][7] = bad
+    base = TaskSet(np.arange(n), rng.uniform(41.8, 42.0, n), rng.uniform(12.4, 12.6, n), rng.uniform(1.8, 15.0, n))
+    with pytest.raises(ValueError, match=name):
+        base.with_task_cls(TaskAdaptive, columns=columns)
+    with pytest.raises(ValueError, match=name):
+        TaskAdaptive(0, 12.5, 41.9, value=5.0, **{k: column[7] for k, column in columns.items()})
+
+
+@pytest.mark.parametrize("field,bad,error", [("lat", 95.0, ValueError), ("lon", float("inf"), ValueError), ("values", -1.0, ValueError), ("values", float("nan"), ValueError), ("ids", 2.5, TypeError)])
+def test_taskset_validates_base_columns_like_task(field, bad, error):
+    rng = np.random.default_rng(5)
+    n = 8
+    arrays = {"ids": np.arange(n).astype(float) if field == "ids" else np.arange(n), "lat": rng.uniform(41.8, 42.0, n), "lon": rng.uniform(12.4, 12.6, n), "values": rng.uniform(1.8, 15.0, n)}
+    arrays[field][3] = bad
+    with pytest.raises(error):
+        TaskSet(arrays["ids"], arrays["lat"], arrays["lon"], arrays["values"])
+
+
+def test_taskset_rejects_columns_unknown_to_task_cls():
+    rng = np.random.default_rng(9)
+    base = TaskSet(np.arange(4), rng.uniform(41.8, 42.0, 4), rng.uniform(12.4, 12.6, 4), rng.uniform(1.8, 15.0, 4))
+    with pytest.raises(TypeError, match="required_reliability"):
+        base.with_task_cls(Task, columns={"required_reliability": [0.1] * 4})
+    assert [t.required_reliability for t in base.with_task_cls(TaskAdaptive, columns={"required_reliability": [0.1] * 4})] == [0.1] * 4